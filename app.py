@@ -1,16 +1,30 @@
 import streamlit as st
 import pandas as pd
-import requests
-import re
 import time
 import io
-from supabase import create_client
+import os
+import json
+import uuid
+import tempfile
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
 
-# Import klienta WP
-try:
-    from wordpress_client import publish_post_draft
-except ImportError:
-    st.error("Brakuje pliku wordpress_client.py! Utwórz go w katalogu aplikacji.")
+from pipeline import (
+    COLUMN_MAP, REVERSE_COLUMN_MAP, STAGE_LABELS, WRITING_MODES, STAGES, PIPELINE_ORDER, PENDING_STATUS, QUEUED_STATUS, ROW_PROGRESS,
+    GRID_COLUMNS, configure, get_supabase, default_stage_workers, process_single_row, mark_stages_status, root_stages,
+    submit_row, stage_executor, wp_sites, wp_config_reference, stage_args_reference, with_wp_credentials, wp_reference_resolvable, fetch_table_version, fetch_changed_ids, fetch_grid_page, fetch_rows, PipelineRunner,
+    tracked_run, resume_plan
+)
+import job_queue
+import checkpoints
+import dify_cache
+import importer
+import exporter
+import metrics
+import upstreams
+import live_updates
+import blob_store
+import scheduler
 
 # --- KONFIGURACJA STRONY ---
 st.set_page_config(page_title="SEO 3.0 Content Factory", page_icon="🏭", layout="wide")
@@ -24,47 +38,38 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# --- MAPOWANIE KOLUMN (BAZA -> UI) ---
-COLUMN_MAP = {
-    'id': 'ID',
-    'keyword': 'Słowo kluczowe',
-    'language': 'Język',
-    'aio_prompt': 'AIO',
-    'status_research': 'Status Research',
-    'serp_phrases': 'Frazy z wyników',
-    'senuto_phrases': 'Frazy Senuto',
-    'info_graph': 'Graf informacji',
-    'competitors_headers': 'Nagłówki konkurencji',
-    'knowledge_graph': 'Knowledge graph',
-    'status_headers': 'Status Nagłówki',
-    'headers_expanded': 'Nagłówki rozbudowane',
-    'headers_h2': 'Nagłówki H2',
-    'headers_questions': 'Nagłówki pytania',
-    'headers_final': 'Nagłówki (Finalne)',
-    'status_rag': 'Status RAG',
-    'rag_content': 'RAG',
-    'rag_general': 'RAG General',
-    'status_brief': 'Status Brief',
-    'brief_json': 'Brief',
-    'brief_html': 'Brief plik',
-    'instructions': 'Dodatkowe instrukcje',
-    'status_writing': 'Status Generacja',
-    'final_article': 'Generowanie contentu',
-    # NOWE KOLUMNY WP
-    'status_publication': 'Status Publikacji',
-    'publication_link': 'Link do wpisu'
-}
+# --- KONFIGURACJA SILNIKA + SUPABASE INIT ---
+configure(st.secrets.to_dict())
+supabase = get_supabase()
 
-REVERSE_COLUMN_MAP = {v: k for k, v in COLUMN_MAP.items()}
+# --- TRYBY WYKONANIA ---
+# browser: batch w tej sesji Streamlit (przerywany przy zamknięciu karty)
+# queue: zadania trafiają do trwałej kolejki, wykonuje je osobny proces worker.py
+EXECUTION_MODES = {
+    'browser': 'W przeglądarce (ta sesja)',
+    'queue': 'W tle (kolejka + worker)'
+}
 
-# --- SUPABASE INIT ---
 @st.cache_resource
-def init_supabase():
-    url = st.secrets["SUPABASE"]["URL"]
-    key = st.secrets["SUPABASE"]["KEY"]
-    return create_client(url, key)
+def init_job_store():
+    return job_queue.get_job_store(st.secrets.to_dict(), supabase)
 
-supabase = init_supabase()
+# --- ZMIANY NA ŻYWO ---
+# Jeden kanał zmian seo_content_tasks na proces, wspólny dla wszystkich sesji ([live] w secrets)
+LIVE_CFG = st.secrets.get("live", {})
+LIVE_REFRESH_SECONDS = float(LIVE_CFG.get("REFRESH_SECONDS", 3))
+
+@st.cache_resource
+def init_change_feed():
+    mode = LIVE_CFG.get("MODE", "realtime")
+    if mode == "off":
+        return None
+    if mode not in live_updates.LIVE_MODES:
+        raise ValueError(f"Nieznany tryb [live] MODE: {mode}")
+    return live_updates.ChangeFeed(
+        mode, fetch_table_version, fetch_changed_ids, st.secrets["SUPABASE"]["URL"], st.secrets["SUPABASE"]["KEY"],
+        poll_seconds=LIVE_CFG.get("POLL_SECONDS"), buffer_size=LIVE_CFG.get("BUFFER_SIZE")
+    ).start()
 
 # --- FUNKCJE POMOCNICZE EXCEL ---
 def to_excel(df):
@@ -74,227 +79,555 @@ def to_excel(df):
     return output.getvalue()
 
 def generate_template_excel():
-    df_template = pd.DataFrame(columns=["Słowo kluczowe", "Język", "AIO"])
-    df_template.loc[0] = ["Przykład: Jaki rower kupić", "pl", "Tutaj wpisz opcjonalne instrukcje AIO"]
+    df_template = pd.DataFrame(columns=["Słowo kluczowe", "Język", "AIO", "Projekt", "Priorytet", "Publikuj do"])
+    df_template.loc[0] = ["Przykład: Jaki rower kupić", "pl", "Tutaj wpisz opcjonalne instrukcje AIO", "", 0, ""]
     return to_excel(df_template)
 
-# --- FUNKCJE DIFY ---
-def run_dify_workflow(api_key, inputs, user_id="streamlit_user"):
-    url = f"{st.secrets['dify']['BASE_URL']}/workflows/run"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "inputs": inputs,
-        "response_mode": "blocking",
-        "user": user_id
-    }
-    try:
-        response = requests.post(url, headers=headers, json=payload, timeout=450)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        return {"error": str(e)}
-
 # --- OBSŁUGA DANYCH ---
-def fetch_data():
-    response = supabase.table("seo_content_tasks").select("*").order("id", desc=True).execute()
-    data = response.data
-    if not data:
-        return pd.DataFrame(columns=['Select'] + list(COLUMN_MAP.values()))
-    
-    df = pd.DataFrame(data)
-    df = df.rename(columns=COLUMN_MAP)
+PAGE_SIZES = [50, 100, 250, 500]
+
+def _grid_df(records, columns):
+    df = pd.DataFrame(records, columns=[COLUMN_MAP.get(c, c) for c in columns] if not records else None)
     # Dodajemy kolumnę Select
     df.insert(0, 'Select', False)
     return df
 
-def update_db_record(row_id, updates):
-    supabase.table("seo_content_tasks").update(updates).eq("id", row_id).execute()
+def _grid_cache():
+    return st.session_state.setdefault("grid_cache", {"version": None, "seq": None, "pages": {}, "dirty": set()})
+
+def invalidate_grid_cache():
+    """Po imporcie, dodaniu, usunięciu lub zapisie z siatki - strony pobierane od nowa przy następnym przebiegu."""
+    st.session_state.pop("grid_cache", None)
+
+def mark_rows_dirty(row_ids):
+    """Wiersze zmienione przez batch tej sesji - łatane przy następnym przebiegu, nawet jeśli kanał zmian się spóźni."""
+    _grid_cache()["dirty"].update(int(i) for i in row_ids)
+
+def _patch_df(df, rows):
+    df = df.set_index('ID', drop=False)
+    for row in rows:
+        if row['ID'] in df.index:
+            df.loc[row['ID'], list(row)] = pd.Series(row)
+    return df.reset_index(drop=True)
+
+def _patch_pages(cache, changed):
+    """Dociąga tylko zmienione wiersze stron z cache (jedno zapytanie na zestaw kolumn). Strony z filtrem - od nowa."""
+    for full in (False, True):
+        keys = [k for k in cache["pages"] if k[3] == full]
+        filtered = [k for k in keys if k[2]]
+        for k in filtered:
+            # Zmiana mogła przenieść wiersz do filtra albo z niego
+            del cache["pages"][k]
+        keys = [k for k in keys if not k[2]]
+        ids = {i for k in keys for i in cache["pages"][k][0]['ID'].tolist() if i in changed}
+        if not ids:
+            continue
+        columns = list(COLUMN_MAP) + ['updated_at'] if full else GRID_COLUMNS
+        rows = fetch_rows(ids, ",".join(columns))
+        for k in keys:
+            df, total = cache["pages"][k]
+            cache["pages"][k] = (_patch_df(df, rows), total)
+
+def _refresh_from_feed(cache, feed):
+    if cache["seq"] is None:
+        cache["seq"], cache["pages"] = feed.seq, {}
+        return
+    cache["seq"], changed, reset = feed.changes_since(cache["seq"])
+    changed |= cache["dirty"]
+    cache["dirty"] = set()
+    if reset:
+        cache["pages"] = {}
+    elif changed:
+        _patch_pages(cache, changed)
+
+def _refresh_from_version(cache, key, columns):
+    """Bez kanału zmian: przy każdym przebiegu skryptu jedno zapytanie o wersję tabeli."""
+    version = fetch_table_version()
+    cache["dirty"] = set()
+    if cache["version"] == version:
+        return
+    previous, cached = cache["version"], cache["pages"].get(key)
+    cache["version"], cache["pages"] = version, {}
+    # Ta sama liczba wierszy i brak filtrów (przynależność do strony się nie zmienia) - łatka zamiast pełnego pobrania
+    if cached and previous and previous[0] == version[0] and not key[2]:
+        df, total = cached
+        changed = fetch_rows(df['ID'].tolist(), ",".join(columns), updated_since=previous[1])
+        cache["pages"][key] = (_patch_df(df, changed) if changed else df, total)
+
+def fetch_data(page=0, page_size=100, filters=None, full=False):
+    """
+    Strona siatki z cache sesji. Z kanałem zmian ([live]) łatane są tylko wiersze zgłoszone przez kanał
+    (bez żadnego zapytania, gdy nic się nie zmieniło). Bez kanału przy każdym przebiegu pobierana jest
+    wersja tabeli (liczba wierszy + najnowszy updated_at) i dociągane wiersze z nowszym updated_at.
+    """
+    columns = list(COLUMN_MAP) + ['updated_at'] if full else GRID_COLUMNS
+    cache = _grid_cache()
+    key = (page, page_size, tuple(sorted((filters or {}).items())), full)
+    feed = init_change_feed()
+    if feed is not None:
+        _refresh_from_feed(cache, feed)
+    else:
+        _refresh_from_version(cache, key, columns)
+
+    cached = cache["pages"].get(key)
+    if cached is None:
+        records, total = fetch_grid_page(page, page_size, filters, columns)
+        cached = cache["pages"][key] = (_grid_df(records, columns), total)
+    df, total = cached
+    return df.copy(), total
+
+def fetch_row_details(row_id, updated_at):
+    """Pełny wiersz do podglądu - z cache sesji, dopóki updated_at wiersza się nie zmienił."""
+    details = st.session_state.setdefault("row_details", {})
+    cached = details.get(row_id)
+    if cached is None or cached[0] != updated_at:
+        rows = fetch_rows([row_id])
+        if not rows:
+            return None
+        details[row_id] = cached = (updated_at, rows[0])
+    return dict(cached[1])
+
+def hydrate_rows(grid_rows):
+    """Pełne wiersze dla batcha w sesji: kolumny z bazy + niezapisane zmiany z siatki."""
+    full = {r['ID']: r for r in fetch_rows([r['ID'] for r in grid_rows])}
+    rows = []
+    for grid_row in grid_rows:
+        row = full.get(grid_row['ID'])
+        if row is not None:
+            row.update({k: v for k, v in grid_row.items() if k in row})
+            rows.append(row)
+    return rows
+
+def run_export(fmt, columns, filters):
+    """Eksport stronami do pliku tymczasowego (poprzedni plik sesji jest usuwany). Zwraca ścieżkę."""
+    previous = st.session_state.pop("export_file", None)
+    if previous and os.path.exists(previous["path"]):
+        os.remove(previous["path"])
+    fd, path = tempfile.mkstemp(prefix="seo_export_", suffix=f".{fmt}")
+    os.close(fd)
+    my_bar = st.progress(0.0, text="Eksport...")
+    _, total = fetch_grid_page(0, 1, filters, ['id'])
+    count, truncated = exporter.export_table(
+        path, fmt, columns, filters,
+        on_progress=lambda n: my_bar.progress(min(n / total, 1.0) if total else 1.0, text=f"Wyeksportowano {n}/{total}")
+    )
+    my_bar.empty()
+    st.session_state["export_file"] = {"path": path, "fmt": fmt, "rows": count, "truncated": truncated}
 
 def delete_records(ids_list):
     if not ids_list: return
     supabase.table("seo_content_tasks").delete().in_("id", ids_list).execute()
 
-def save_manual_changes(edited_df):
-    df_to_save = edited_df.drop(columns=['Select'], errors='ignore')
-    df_to_save = df_to_save.rename(columns=REVERSE_COLUMN_MAP)
-    records = df_to_save.to_dict('records')
-    
-    progress_text = "Zapisywanie zmian..."
-    my_bar = st.progress(0, text=progress_text)
-    total = len(records)
-    for i, record in enumerate(records):
-        if record.get('id'):
-            supabase.table("seo_content_tasks").upsert(record).execute()
-        my_bar.progress((i + 1) / total, text=f"Zapisano wiersz {i+1}/{total}")
+def save_batch_size():
+    return int(st.secrets.get("batch", {}).get("SAVE_BATCH_SIZE", 200))
+
+def import_batch_size():
+    return int(st.secrets.get("batch", {}).get("IMPORT_BATCH_SIZE", importer.DEFAULT_IMPORT_BATCH_SIZE))
+
+def collect_grid_changes(df, edited_rows):
+    """{id: {kolumna_db: wartość}} tylko dla zmienionych komórek (stan edited_rows z st.data_editor)."""
+    changes = {}
+    for idx, cells in edited_rows.items():
+        cells = {REVERSE_COLUMN_MAP.get(c, c): v for c, v in cells.items() if c not in ('Select', 'updated_at')}
+        if cells.get('publish_by') == "":
+            cells['publish_by'] = None  # timestamptz - pusta komórka = brak terminu
+        if cells:
+            changes[int(df.iloc[int(idx)]['ID'])] = cells
+    return changes
+
+def save_manual_changes(df, edited_rows, batch_size=200):
+    """
+    Zapisuje tylko zmienione komórki. Wiersze o tym samym zestawie zmienionych kolumn trafiają
+    do wspólnych upsertów (PostgREST wymaga tych samych kluczy w paczce) po `batch_size` rekordów.
+    id i keyword są zawsze w rekordzie (keyword jest NOT NULL dla ścieżki INSERT upsertu).
+    """
+    changes = collect_grid_changes(df, edited_rows)
+    if not changes:
+        st.info("Brak zmian do zapisania.")
+        return False
+
+    keywords = dict(zip(df['ID'].astype(int), df['Słowo kluczowe']))
+    groups = {}
+    for row_id, cells in changes.items():
+        record = {'id': row_id, 'keyword': keywords[row_id], **cells}
+        groups.setdefault(tuple(sorted(record)), []).append(record)
+    batches = [records[i:i + batch_size] for records in groups.values() for i in range(0, len(records), batch_size)]
+
+    my_bar = st.progress(0, text="Zapisywanie zmian...")
+    errors = []
+    for i, batch in enumerate(batches):
+        try:
+            supabase.table("seo_content_tasks").upsert([blob_store.offload(r) for r in batch], on_conflict="id").execute()
+        except Exception as e:
+            errors.append(f"Paczka {i + 1}/{len(batches)} (ID: {', '.join(str(r['id']) for r in batch)}): {e}")
+        my_bar.progress((i + 1) / len(batches), text=f"Zapisano paczkę {i + 1}/{len(batches)}")
     my_bar.empty()
-    st.success("Zmiany zapisane w bazie!")
-
-def extract_headers_from_text(text):
-    if not isinstance(text, str): return []
-    html_headers = re.findall(r'<h2.*?>(.*?)</h2>', text, re.IGNORECASE)
-    if html_headers:
-        return [re.sub(r'<.*?>', '', h).strip() for h in html_headers]
-    return [line.strip() for line in text.split('\n') if line.strip()]
-
-# --- LOGIKA BIZNESOWA (ETAPY) ---
-
-def stage_research(row):
-    inputs = {"keyword": row['Słowo kluczowe'], "language": row['Język'], "aio": row['AIO'] if row['AIO'] else ""}
-    resp = run_dify_workflow(st.secrets['dify']['API_KEY_RESEARCH'], inputs)
-    if "data" in resp and "outputs" in resp["data"]:
-        out = resp["data"]["outputs"]
-        return {
-            "status_research": "✅ Gotowe",
-            "serp_phrases": out.get("frazy z serp", ""),
-            "senuto_phrases": out.get("frazy_senuto", ""),
-            "info_graph": out.get("grafinformacji", ""),
-            "competitors_headers": out.get("naglowki", ""),
-            "knowledge_graph": out.get("knowledge_graph", "")
-        }
-    else:
-        raise Exception(f"Dify Error: {resp.get('error', 'Unknown error')}")
-
-def stage_headers(row):
-    frazy_full = f"{row['Frazy z wyników']}\n{row['Frazy Senuto']}"
-    inputs = {"keyword": row['Słowo kluczowe'], "language": row['Język'], "frazy": frazy_full, "graf": row['Graf informacji'], "headings": row['Nagłówki konkurencji']}
-    resp = run_dify_workflow(st.secrets['dify']['API_KEY_HEADERS'], inputs)
-    if "data" in resp and "outputs" in resp["data"]:
-        out = resp["data"]["outputs"]
-        h2 = out.get("naglowki_h2", "")
-        questions = out.get("naglowki_pytania", "")
-        final_headers = row['Nagłówki (Finalne)']
-        if not final_headers: final_headers = questions if questions else h2
-        return {
-            "status_headers": "✅ Gotowe",
-            "headers_expanded": out.get("naglowki_rozbudowane", ""),
-            "headers_h2": h2,
-            "headers_questions": questions,
-            "headers_final": final_headers
-        }
-    else:
-        raise Exception(f"Dify Error: {resp.get('error', 'Unknown error')}")
-
-def stage_rag(row):
-    inputs = {"keyword": row['Słowo kluczowe'], "language": row['Język'], "headings": row['Nagłówki konkurencji']}
-    resp = run_dify_workflow(st.secrets['dify']['API_KEY_RAG'], inputs)
-    if "data" in resp and "outputs" in resp["data"]:
-        out = resp["data"]["outputs"]
-        return {"status_rag": "✅ Gotowe", "rag_content": out.get("dokladne", ""), "rag_general": out.get("ogolne", "")}
-    else:
-        raise Exception(f"Dify Error: {resp.get('error', 'Unknown error')}")
-
-def stage_brief(row):
-    h2_source = row['Nagłówki H2'] if row['Nagłówki H2'] else row['Nagłówki (Finalne)']
-    if not h2_source: raise Exception("Brak nagłówków H2 do stworzenia briefu.")
-    frazy_full = f"{row['Frazy z wyników']}\n{row['Frazy Senuto']}"
-    inputs = {"keyword": row['Słowo kluczowe'], "keywords": frazy_full, "headings": h2_source, "knowledge_graph": row['Knowledge graph'], "information_graph": row['Graf informacji']}
-    resp = run_dify_workflow(st.secrets['dify']['API_KEY_BRIEF'], inputs)
-    if "data" in resp and "outputs" in resp["data"]:
-        out = resp["data"]["outputs"]
-        return {"status_brief": "✅ Gotowe", "brief_json": out.get("brief", ""), "brief_html": out.get("html", "")}
-    else:
-        raise Exception(f"Dify Error: {resp.get('error', 'Unknown error')}")
-
-def stage_writing(row):
-    headers_text = row['Nagłówki (Finalne)']
-    headers_list = extract_headers_from_text(headers_text)
-    if not headers_list: raise Exception("Pusta kolumna 'Nagłówki (Finalne)'.")
-    full_knowledge = f"{row['RAG']}\n{row['RAG General']}"
-    full_keywords = f"{row['Frazy z wyników']}, {row['Frazy Senuto']}"
-    article_content = ""
-    for h2 in headers_list:
-        inputs = {
-            "naglowek": h2, "language": row['Język'], "knowledge": full_knowledge, "keywords": full_keywords,
-            "headings": row['Nagłówki rozbudowane'], "done": article_content, "keyword": row['Słowo kluczowe'], "instruction": row['Dodatkowe instrukcje']
-        }
-        resp = run_dify_workflow(st.secrets['dify']['API_KEY_WRITE'], inputs)
-        if "data" in resp and "outputs" in resp["data"]:
-            section = resp["data"]["outputs"].get("result", "")
-            article_content += f"<h2>{h2}</h2>\n{section}\n\n"
-        else:
-            article_content += f"<h2>{h2}</h2>\n[BŁĄD GENEROWANIA: {resp.get('error')}]\n\n"
-    return {"status_writing": "✅ Gotowe", "final_article": article_content}
-
-def stage_publication(row, wp_config):
-    """Etap 6: Publikacja w WP"""
-    content = row['Generowanie contentu']
-    title = row['Słowo kluczowe']
-    
-    if not content or len(content) < 50:
-        raise Exception("Brak wygenerowanej treści do publikacji.")
-    
-    if not wp_config['url'] or not wp_config['user'] or not wp_config['key']:
-        raise Exception("Brak konfiguracji WordPress.")
-
-    result = publish_post_draft(
-        wp_config['url'],
-        wp_config['user'],
-        wp_config['key'],
-        title,
-        content
-    )
-    
-    if result['success']:
-        return {
-            "status_publication": "✅ Opublikowano (Draft)",
-            "publication_link": result['link']
-        }
-    else:
-        raise Exception(f"WP Error: {result['message']}")
 
+    if errors:
+        st.error(f"Nie zapisano {len(errors)} z {len(batches)} paczek:\n\n" + "\n\n".join(errors))
+        return False
+    st.success(f"Zmiany zapisane w bazie! Wiersze: {len(changes)}, paczki: {len(batches)}")
+    return True
+
+# --- HARMONOGRAM (OPERATOR I KLASA BATCHA) ---
+def batch_operator():
+    # Bez podpisu operatora każda sesja jest osobnym udziałem - dwie karty nie dzielą jednej wagi
+    name = st.session_state.get("operator_name", "").strip()
+    return name or st.session_state.setdefault("session_operator", f"sesja-{uuid.uuid4().hex[:4]}")
+
+def batch_flow():
+    """Zakres harmonogramu dla pul batcha: operator i klasa z paska bocznego."""
+    return scheduler.flow_scope(batch_operator(), st.session_state.get("batch_class", scheduler.DEFAULT_CLASS))
+
+def queue_share():
+    """Udział i waga zadań w kolejce workerów (claim_seo_jobs dzieli zadania wg wag udziałów)."""
+    operator, klass = batch_operator(), st.session_state.get("batch_class", scheduler.DEFAULT_CLASS)
+    return {"share": scheduler.share_label(operator, klass), "weight": scheduler.share_weight(operator, "", klass)}
 
 # --- UNIWERSALNY PROCESOR BATCHOWY ---
-def run_batch_process(selected_rows, process_func, status_col_db, success_msg, extra_args=None):
+def render_live_progress(placeholder, keywords, limit=15):
+    """Bieżący węzeł workflow dla wierszy tego batcha (dostępne w trybie streaming Dify)."""
+    entries = sorted((k, v) for k, v in list(ROW_PROGRESS.items()) if k[0] in keywords)
+    if not entries:
+        placeholder.empty()
+        return
+    lines = [f"- **#{row_id} {keywords[row_id]}** · {label}: _{node}_" for (row_id, label), node in entries[:limit]]
+    if len(entries) > limit:
+        lines.append(f"- … i {len(entries) - limit} więcej")
+    placeholder.markdown("\n".join(lines))
+
+def run_batch_process(selected_rows, process_func, status_col_db, success_msg, extra_args=None, workers=1, force_refresh=False):
     progress_container = st.empty()
     status_log = st.empty()
+    live_log = st.empty()
     stop_button_placeholder = st.empty()
-    
-    stop_process = False
-    if stop_button_placeholder.button("⛔ ZATRZYMAJ PO OBECNYM REKORDZIE"):
-        stop_process = True
-    
+    keywords = {row['ID']: row['Słowo kluczowe'] for row in selected_rows}
+
+    # Flaga STOP współdzielona z wątkami workerów. Kliknięcie przycisku wywołuje rerun skryptu,
+    # callback ustawia flagę, a workery nie zaczynają już kolejnych wierszy.
+    stop_event = threading.Event()
+    st.session_state["batch_stop_event"] = stop_event
+    stop_button_placeholder.button("⛔ ZATRZYMAJ PO OBECNYCH REKORDACH", on_click=stop_event.set)
+
     total = len(selected_rows)
+    workers = max(1, min(int(workers), total)) if total else 1
     success_count = 0
     error_count = 0
+    skipped_count = 0
     my_bar = progress_container.progress(0)
-    
-    for i, row in enumerate(selected_rows):
-        # Sprawdzenie flagi STOP (symulacja, bo Streamlit reruns on click)
-        # W praktyce user klika stop, strona się przeładowuje i pętla nie rusza dalej, 
-        # ale tutaj wewnątrz pętli ciężko to złapać bez session_state. 
-        # Zostawiamy jak jest - działa jako "zatrzymaj kolejne uruchomienia".
-        
-        row_id = row['ID']
-        keyword = row['Słowo kluczowe']
-        status_log.info(f"⏳ [{i+1}/{total}] Przetwarzanie: **{keyword}**...")
-        update_db_record(row_id, {status_col_db: "🔄 W trakcie..."})
-        
+
+    stage_key = next(k for k, spec in STAGES.items() if spec['status_col'] == status_col_db)
+    row_ids = [row['ID'] for row in selected_rows]
+    # Rekord przebiegu z heartbeatem - po restarcie Streamlit batch można wznowić (sekcja "♻️ Przerwane przebiegi")
+    with tracked_run("stage", row_ids, [stage_key], {stage_key: extra_args} if extra_args else None) as run, batch_flow():
+        executor = stage_executor(stage_key, workers, extra_args, thread_name_prefix=f"batch-{status_col_db}")
         try:
-            # Przekazanie dodatkowych argumentów (np. konfig WP)
-            if extra_args:
-                updates = process_func(row, extra_args)
-            else:
-                updates = process_func(row)
-                
-            update_db_record(row_id, updates)
-            success_count += 1
-        except Exception as e:
-            error_count += 1
-            error_msg = str(e)[:100]
-            update_db_record(row_id, {status_col_db: f"❌ Błąd: {error_msg}"})
-            st.toast(f"Błąd przy '{keyword}': {error_msg}", icon="⚠️")
-        
-        my_bar.progress((i + 1) / total)
-    
+            # Zakres cache batcha (wymuszenie odświeżenia + liczniki) trafia do wątków razem z kontekstem
+            with dify_cache.batch_scope(force_refresh) as cache_scope, metrics.batch_scope(run.run_id, flush_on_exit=False):
+                futures = {
+                    submit_row(executor, row, process_single_row, row, process_func, status_col_db, extra_args, stop_event): row
+                    for row in selected_rows
+                }
+            pending = set(futures)
+            while pending:
+                # Krótki timeout - każda aktualizacja UI pozwala Streamlitowi obsłużyć kliknięcie STOP
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    keyword = futures[future]['Słowo kluczowe']
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = (False, str(e)[:100])
+
+                    if result is None:
+                        skipped_count += 1
+                    elif result[0]:
+                        success_count += 1
+                    else:
+                        error_count += 1
+                        st.toast(f"Błąd przy '{keyword}': {result[1]}", icon="⚠️")
+
+                finished = success_count + error_count + skipped_count
+                in_flight = sum(1 for f in pending if f.running())
+                my_bar.progress(finished / total)
+                status_log.info(
+                    f"⏳ [{finished}/{total}] Wątki: {workers} | W trakcie: {in_flight} | "
+                    f"✅ {success_count} | ❌ {error_count}"
+                    + (f" | ⛔ Pominięte: {skipped_count}" if skipped_count else "")
+                )
+                render_live_progress(live_log, keywords)
+        finally:
+            # Przerwanie skryptu (rerun) anuluje wiersze w kolejce; bieżące dokończą zapis do bazy
+            executor.shutdown(wait=False, cancel_futures=True)
+            metrics.flush()
+        # Wiersze wstrzymane przez otwarty bezpiecznik usługi też czynią przebieg wznawialnym
+        run.stopped = stop_event.is_set() or skipped_count > 0
+        run.stats = {"done": success_count, "errors": error_count, "skipped": skipped_count}
+
     my_bar.empty()
+    live_log.empty()
     stop_button_placeholder.empty()
-    status_log.success(f"Zakończono! Sukces: {success_count}, Błędy: {error_count}")
-    time.sleep(2)
+    summary = f"Zakończono! Sukces: {success_count}, Błędy: {error_count}"
+    if skipped_count:
+        summary += f", Zatrzymane/wstrzymane: {skipped_count}"
+    finish_batch(row_ids, f"{summary} | {cache_scope.summary()}")
+
+def finish_batch(row_ids, message):
+    """Koniec batcha w sesji: komunikat przetrwa ponowny przebieg skryptu, a siatka łata tylko wiersze batcha."""
+    mark_rows_dirty(row_ids)
+    st.session_state["batch_summary"] = message
     st.rerun()
 
+def warn_unresolvable_wp(wp_config):
+    if not wp_reference_resolvable(wp_config):
+        st.warning(
+            "Hasło aplikacji WP nie trafia do kolejki - worker bierze dane logowania z rejestru [wordpress.sites]. "
+            "Ręcznie wpisanej strony nie ma w rejestrze, więc wiersze bez kolumny \"Strona WP\" zakończą się błędem."
+        )
+
+def launch_stage(stage_key, rows, extra_args=None, workers=1):
+    """Uruchamia etap w bieżącej sesji albo wrzuca go do kolejki workerów (zależnie od trybu)."""
+    stage = STAGES[stage_key]
+    force_refresh = st.session_state.get("cache_force_refresh", False)
+    if st.session_state.get("execution_mode") == 'queue':
+        # Jednoetapowy "pipeline" niesie do workera tylko opcję odświeżenia cache
+        pipeline_cfg = {"stages": [stage_key], "force_refresh": True} if force_refresh else None
+        if stage_key == 'publication':
+            warn_unresolvable_wp(extra_args)
+            extra_args = wp_config_reference(extra_args)
+        batch_id = init_job_store().enqueue([r['ID'] for r in rows], stage_key, extra_args, pipeline=pipeline_cfg, **queue_share())
+        st.success(f"Dodano {len(rows)} zadań do kolejki (batch `{batch_id}`). Postęp widać w sekcji \"Kolejka zadań\".")
+        return
+    run_batch_process(hydrate_rows(rows), stage['func'], stage['status_col'], "Gotowe", extra_args=extra_args, workers=workers, force_refresh=force_refresh)
+
+def stage_label(stage):
+    return STAGE_LABELS[STAGES[stage]['status_col']]
+
+# --- PEŁNY PIPELINE ---
+def run_full_pipeline(rows, stages, stage_args, pause_after, stage_workers, force_refresh=False, statuses=None, resumed_from=None):
+    status_log = st.empty()
+    stage_bars = {stage: st.empty() for stage in stages}
+    live_log = st.empty()
+    stop_button_placeholder = st.empty()
+    keywords = {row['ID']: row['Słowo kluczowe'] for row in rows}
+
+    stop_event = threading.Event()
+    st.session_state["batch_stop_event"] = stop_event
+    stop_button_placeholder.button("⛔ ZATRZYMAJ PIPELINE PO OBECNYCH ETAPACH", on_click=stop_event.set)
+
+    total = len(rows)
+    row_ids = [row['ID'] for row in rows]
+    with tracked_run("pipeline", row_ids, stages, stage_args, pause_after, resumed_from=resumed_from) as run:
+        with dify_cache.batch_scope(force_refresh) as cache_scope, metrics.batch_scope(run.run_id, flush_on_exit=False), batch_flow():
+            runner = PipelineRunner(rows, stages, stage_workers, stage_args, pause_after, stop_event, statuses).start()
+        try:
+            while True:
+                finished = runner.wait(0.5)
+                for row_id, stage, result in runner.drain_events():
+                    if result is not None and not result[0]:
+                        st.toast(f"Błąd [{stage_label(stage)}] przy #{row_id}: {result[1]}", icon="⚠️")
+                for stage in stages:
+                    s = runner.stats[stage]
+                    processed = s['done'] + s['errors'] + s['skipped'] + s['paused']
+                    stage_bars[stage].progress(
+                        min(processed / total, 1.0) if total else 1.0,
+                        text=f"{stage_label(stage)}: ✅ {s['done']} | ❌ {s['errors']}" + (f" | ⏸️ {s['paused']}" if s['paused'] else "")
+                    )
+                if finished:
+                    break
+                status_log.info(f"⏳ Pipeline w toku ({total} wierszy)...")
+                render_live_progress(live_log, keywords)
+        finally:
+            runner.shutdown()
+            metrics.flush()
+        run.stopped = stop_event.is_set() or any(s['skipped'] for s in runner.stats.values())
+        run.stats = runner.stats
+
+    live_log.empty()
+    stop_button_placeholder.empty()
+    done_rows = runner.stats[stages[-1]]['done']
+    finish_batch(
+        row_ids, f"Pipeline zakończony! Wierszy po ostatnim etapie ({stage_label(stages[-1])}): {done_rows}/{total} | {cache_scope.summary()}"
+    )
+
+def launch_pipeline(rows, stages, stage_args, pause_after, stage_workers):
+    """Pełny pipeline: w sesji (PipelineRunner) albo w kolejce - worker dokłada kolejne etapy sam."""
+    stage_args = {stage: args for stage, args in stage_args.items() if stage in stages}
+    force_refresh = st.session_state.get("cache_force_refresh", False)
+    if st.session_state.get("execution_mode") == 'queue':
+        ids = [r['ID'] for r in rows]
+        if 'publication' in stages:
+            warn_unresolvable_wp(stage_args.get('publication'))
+        stage_args = stage_args_reference(stage_args)
+        pipeline_cfg = {"stages": stages, "pause_after": list(pause_after), "stage_args": stage_args, "force_refresh": force_refresh}
+        batch_id = job_queue.new_batch_id()
+        # Statusy "w kolejce" - worker uznaje zależność za spełnioną dopiero po ✅ z tego przebiegu
+        mark_stages_status(ids, stages, QUEUED_STATUS)
+        for stage in root_stages(stages):
+            init_job_store().enqueue(ids, stage, stage_args.get(stage), batch_id=batch_id, pipeline=pipeline_cfg, **queue_share())
+        st.success(f"Pipeline dla {len(rows)} wierszy dodany do kolejki (batch `{batch_id}`).")
+        return
+    run_full_pipeline(hydrate_rows(rows), stages, stage_args, pause_after, stage_workers, force_refresh)
+
+# --- PRZERWANE PRZEBIEGI (WZNAWIANIE) ---
+RUN_END_REASONS = {checkpoints.RUN_STOPPED: "zatrzymany", checkpoints.RUN_INTERRUPTED: "przerwany"}
+
+def resume_run(run, stage_workers, wp_config):
+    """Wznawia przebieg: tylko niedokończone wiersze i etapy (sekcje artykułu z checkpointu nie są pisane ponownie)."""
+    plan = resume_plan(run)
+    if not plan:
+        checkpoints.dismiss(run["run_id"])
+        st.info(f"Przebieg `{run['run_id']}` nie ma niedokończonych wierszy.")
+        return
+    # Rejestr przebiegów nie przechowuje hasła WP - strona ręczna dostaje je z paska bocznego (ten sam adres)
+    stage_args = with_wp_credentials(run["stage_args"] or {}, wp_config)
+    publication = stage_args.get('publication')
+    if 'publication' in run["stages"] and publication and not publication.get('key') and not wp_reference_resolvable(publication):
+        st.warning(
+            f"Przebieg publikował na {publication.get('url') or 'stronę spoza rejestru'} - hasło aplikacji WP nie jest zapisywane. "
+            "Wpisz w pasku bocznym dane logowania tej strony, inaczej wiersze bez kolumny \"Strona WP\" zakończą się błędem."
+        )
+    run_full_pipeline(
+        fetch_rows(list(plan)), run["stages"], stage_args, run["pause_after"] or [], stage_workers,
+        st.session_state.get("cache_force_refresh", False), statuses=plan, resumed_from=run["run_id"]
+    )
+
+def render_resumable_runs(stage_workers, wp_config):
+    runs = checkpoints.resumable_runs()
+    if not runs:
+        return
+    to_resume = None
+    with st.expander(f"♻️ Przerwane przebiegi ({len(runs)})", expanded=True):
+        st.caption("Batche przerwane restartem aplikacji, zamknięciem karty lub przyciskiem STOP. Wznowienie obejmuje tylko niedokończone wiersze.")
+        for run in runs:
+            reason = "proces nie odpowiada" if checkpoints.is_stale(run) else RUN_END_REASONS.get(run["status"], run["status"])
+            started = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["created_at"]))
+            c_i, c_r, c_d = st.columns([5, 1, 1])
+            with c_i:
+                st.markdown(
+                    f"`{run['run_id']}` **{', '.join(stage_label(s) for s in run['stages'])}** — "
+                    f"{len(run['row_ids'])} wierszy, start {started}, {reason}"
+                )
+            with c_r:
+                if st.button("▶️ Wznów", key=f"resume_{run['run_id']}"):
+                    to_resume = run
+            with c_d:
+                if st.button("🗑️ Odrzuć", key=f"dismiss_{run['run_id']}"):
+                    checkpoints.dismiss(run["run_id"])
+                    st.rerun()
+    if to_resume:
+        resume_run(to_resume, stage_workers, wp_config)
+
+# --- SIATKA NA ŻYWO ---
+@st.fragment(run_every=LIVE_REFRESH_SECONDS if LIVE_CFG.get("MODE") != "off" else None)
+def render_live_status():
+    """Sprawdza kanał zmian (bez zapytań do bazy); zmiana na widocznej stronie odświeża siatkę z łatanego cache."""
+    feed = init_change_feed()
+    cache = st.session_state.get("grid_cache")
+    if feed is None or cache is None or cache["seq"] is None:
+        return
+    _, changed, reset = feed.changes_since(cache["seq"])
+    ids, filtered = st.session_state.get("grid_view", (set(), False))
+    if not (reset or changed & ids or (filtered and changed)):
+        st.caption(feed.describe())
+        return
+    edits = st.session_state.get("data_editor") or {}
+    if not any(edits.get(k) for k in ("edited_rows", "added_rows", "deleted_rows")):
+        st.rerun()
+    # Niezapisane edycje lub zaznaczenie - odświeżenie siatki mogłoby je skasować, operator decyduje
+    c_l, c_b = st.columns([5, 1])
+    with c_l:
+        st.caption(f"{feed.describe()} · wiersze na tej stronie zmieniły się w bazie (niezapisane zmiany w siatce wstrzymują odświeżanie)")
+    with c_b:
+        if st.button("🔄 Odśwież siatkę", key="live_refresh", help="Niezapisane zmiany i zaznaczenie zostaną utracone."):
+            st.session_state.pop("data_editor", None)
+            st.rerun()
+
+# --- KOLEJKA ZADAŃ (PODGLĄD) ---
+@st.fragment(run_every=5)
+def render_job_queue():
+    st.subheader("📡 Kolejka zadań (w tle)")
+    try:
+        batches = init_job_store().batch_summary(limit=10)
+    except Exception as e:
+        st.warning(f"Kolejka niedostępna: {e}")
+        return
+    if not batches:
+        st.caption("Brak zadań w kolejce. Worker uruchamia się poleceniem: `python worker.py`")
+        return
+
+    for b in batches:
+        counts = {k: int(b.get(k) or 0) for k in job_queue.JOB_STATUSES}
+        finished = counts['done'] + counts['failed'] + counts['cancelled']
+        label = STAGE_LABELS.get(STAGES.get(b['stage'], {}).get('status_col'), b['stage'])
+        c_p, c_b = st.columns([5, 1])
+        with c_p:
+            st.progress(
+                finished / b['total'] if b['total'] else 0.0,
+                text=f"`{b['batch_id']}` **{label}** — ⏳ {counts['queued']} | 🔄 {counts['running']} | "
+                     f"✅ {counts['done']} | ❌ {counts['failed']} | ⛔ {counts['cancelled']}"
+            )
+        with c_b:
+            if counts['queued'] and st.button("⛔ Anuluj", key=f"cancel_{b['batch_id']}_{b['stage']}"):
+                init_job_store().cancel(b['batch_id'])
+                st.rerun(scope="fragment")
+
+# --- METRYKI ---
+METRICS_WINDOWS = {'1h': 3600, '24h': 24 * 3600, '7d': 7 * 24 * 3600, '30d': 30 * 24 * 3600}
+
+METRICS_SECTIONS = [
+    ('stage', "Etapy (wiersz)"),
+    ('section', "Sekcje artykułu"),
+    ('dify', "Workflow Dify"),
+    ('http', "Żądania HTTP (host)"),
+    ('db', "Supabase"),
+    ('content', "Przetwarzanie treści przed publikacją"),
+    ('blob', "Magazyn blobów (ciężkie kolumny)"),
+    ('upstream', "Bezpieczniki usług (otwarcia / zamknięcia)"),
+]
+
+def render_metrics_dashboard():
+    st.header("📈 Metryki wydajności")
+    states = upstreams.snapshot()
+    if states:
+        st.subheader("🔌 Usługi (ten proces)")
+        st.caption("Bezpiecznik i bieżący limit równoległości per usługa - stan wątków tej instancji aplikacji.")
+        st.dataframe(pd.DataFrame(states), hide_index=True, use_container_width=True)
+    if scheduler.enabled():
+        state = scheduler.snapshot()
+        st.subheader("⚖️ Harmonogram (ten proces)")
+        st.caption(
+            f"Wątki: {state['threads']}/{state['max_workers']} (bezczynne: {state['idle']}). "
+            "Udział = operator × projekt × klasa batcha; wolny wątek bierze zadanie udziału, który dostał najmniej względem swojej wagi."
+        )
+        if state['shares']:
+            st.dataframe(pd.DataFrame(state['shares']), hide_index=True, use_container_width=True)
+    if not metrics.enabled():
+        st.info("Metryki są wyłączone ([metrics] BACKEND = \"off\").")
+        return
+    c_w, c_r = st.columns([1, 5])
+    with c_w:
+        window = st.selectbox("Okres", list(METRICS_WINDOWS), index=1, key="metrics_window")
+    with c_r:
+        st.caption("Czasy w sekundach. Kolejka = oczekiwanie na wolny wątek puli. Zdarzenia z workerów są widoczne przy backendzie \"supabase\".")
+    metrics.flush()
+    events = metrics.load_events(time.time() - METRICS_WINDOWS[window])
+    if not events:
+        st.caption("Brak zdarzeń w wybranym okresie.")
+        return
+
+    st.subheader("Przepustowość batchy")
+    st.dataframe(pd.DataFrame(metrics.batch_throughput(events)), hide_index=True, use_container_width=True)
+    for kind, title in METRICS_SECTIONS:
+        rows = metrics.summarize(events, kind)
+        if not rows:
+            continue
+        st.subheader(title)
+        df_m = pd.DataFrame(rows).dropna(axis=1, how='all')
+        st.dataframe(df_m, hide_index=True, use_container_width=True)
+        if kind == 'stage':
+            st.bar_chart(df_m.set_index('name')[['p50_s', 'p95_s']])
+
 # --- AUTORYZACJA ---
 def check_password():
     if "password_correct" not in st.session_state:
@@ -329,29 +662,45 @@ if check_password():
             uploaded_file = st.file_uploader("Wgraj plik", type=['xlsx', 'csv'])
             if uploaded_file:
                 if st.button("Importuj"):
-                    # ... (Kod importu bez zmian - skrócony dla czytelności)
                     try:
-                        df_imp = pd.read_csv(uploaded_file) if uploaded_file.name.endswith('.csv') else pd.read_excel(uploaded_file)
-                        count = 0
-                        cols = df_imp.columns.tolist()
-                        # Prosta heurystyka wyboru kolumn
-                        c_kw = cols[0]
-                        for c in cols:
-                            if "słowo" in c.lower() or "keyword" in c.lower(): c_kw = c
-                        
-                        my_bar = st.progress(0)
-                        for i, r in df_imp.iterrows():
-                            supabase.table("seo_content_tasks").insert({
-                                "keyword": str(r[c_kw]), "language": "pl", "headers_final": ""
-                            }).execute()
-                            count += 1
-                            my_bar.progress((i+1)/len(df_imp))
-                        st.success(f"Zaimportowano {count}")
-                        time.sleep(1)
-                        st.rerun()
+                        # CSV czytany jest strumieniowo - postęp z pozycji w pliku. XLSX (openpyxl read_only) wczytuje
+                        # plik od razu, a liczba wierszy nie jest znana - tylko licznik przetworzonych wierszy.
+                        is_csv = uploaded_file.name.lower().endswith('.csv')
+                        my_bar = st.progress(0.0, text="Import...") if is_csv else st.empty()
+                        if not is_csv:
+                            my_bar.info("⏳ Import...")
+                        file_size = max(uploaded_file.size, 1)
+
+                        def show_import_progress(rows, inserted):
+                            text = f"Wierszy: {rows} | zaimportowano: {inserted}"
+                            if is_csv:
+                                my_bar.progress(min(uploaded_file.tell() / file_size, 1.0), text=text)
+                            else:
+                                my_bar.info(f"⏳ Import... {text}")
+
+                        report = importer.import_file(
+                            supabase, uploaded_file, uploaded_file.name, batch_size=import_batch_size(),
+                            on_progress=show_import_progress
+                        )
+                        my_bar.empty()
+                        st.session_state["import_report"] = report
+                        invalidate_grid_cache()
+                        if not report.rejected:
+                            st.success(report.summary())
+                            time.sleep(1)
+                            st.rerun()
                     except Exception as e:
                         st.error(f"Błąd: {e}")
 
+            report = st.session_state.get("import_report")
+            if report is not None and report.rejected:
+                st.warning(report.summary())
+                st.dataframe(report.rejected_df(), hide_index=True, height=200)
+                st.download_button("📥 Odrzucone wiersze (CSV)", report.rejected_csv(), "import_odrzucone.csv", mime="text/csv")
+                if st.button("Zamknij raport"):
+                    del st.session_state["import_report"]
+                    st.rerun()
+
             st.divider()
             st.header("Dodaj Ręcznie")
             with st.form("add_manual"):
@@ -360,13 +709,28 @@ if check_password():
                 m_aio = st.text_area("AIO")
                 if st.form_submit_button("Dodaj"):
                     supabase.table("seo_content_tasks").insert({"keyword": m_kw, "language": m_lang, "aio_prompt": m_aio, "headers_final": ""}).execute()
+                    invalidate_grid_cache()
                     st.success("Dodano!")
                     st.rerun()
 
         with st.expander("📤 2. Eksport", expanded=False):
-            if st.button("Przygotuj Excel"):
-                full_df = fetch_data().drop(columns=['Select'], errors='ignore')
-                st.download_button("💾 Pobierz (XLSX)", to_excel(full_df), "seo_export.xlsx")
+            export_fmt = st.selectbox("Format", list(exporter.EXPORT_FORMATS), format_func=exporter.EXPORT_FORMATS.get, key="export_fmt")
+            export_cols = st.multiselect(
+                "Kolumny", list(COLUMN_MAP), default=list(COLUMN_MAP), format_func=COLUMN_MAP.get, key="export_cols"
+            )
+            export_status_col = st.selectbox("Filtr statusu", list(STAGE_LABELS), format_func=STAGE_LABELS.get, key="export_status_col")
+            export_status = st.selectbox("Status", ["Wszystkie", PENDING_STATUS, "✅", "❌", "🔄", "⏳", "⏸️"], key="export_status")
+            if st.button("Przygotuj plik", disabled=not export_cols):
+                run_export(export_fmt, export_cols, {} if export_status == "Wszystkie" else {export_status_col: export_status})
+            export_file = st.session_state.get("export_file")
+            if export_file and os.path.exists(export_file["path"]):
+                if export_file["truncated"]:
+                    st.warning(f"Przycięto {export_file['truncated']} komórek dłuższych niż limit Excela ({exporter.XLSX_MAX_CELL_CHARS} znaków). Pełne treści: CSV lub JSON Lines.")
+                with open(export_file["path"], "rb") as f:
+                    st.download_button(
+                        f"💾 Pobierz ({export_file['rows']} wierszy)", f, f"seo_export.{export_file['fmt']}",
+                        mime=exporter.EXPORT_MIME[export_file['fmt']]
+                    )
 
         st.divider()
         
@@ -380,28 +744,108 @@ if check_password():
             4. Skopiowany ciąg to Twój **Klucz API**.
             """)
 
-        wp_domain = st.text_input("Domena", placeholder="https://twojablog.pl")
-        wp_user = st.text_input("Użytkownik WP (Login)", help="Login do konta, na którym wygenerowano klucz")
-        wp_key = st.text_input("Hasło Aplikacji (Klucz API)", type="password", help="Ciąg znaków wygenerowany w profilu użytkownika")
-        
-        wp_config = {
-            "url": wp_domain,
-            "user": wp_user,
-            "key": wp_key # To trafi do funkcji publish_post_draft jako api_key
-        }
+        # Strony z rejestru ([wordpress.sites.*] w secrets) - wiersze z kolumną "Strona WP" idą na swoją stronę
+        registered_sites = list(wp_sites())
+        wp_site = st.selectbox(
+            "Strona domyślna", [""] + registered_sites, format_func=lambda n: n or "✏️ Wpisz ręcznie",
+            help="Dla wierszy bez przypisanej kolumny \"Strona WP\"."
+        ) if registered_sites else ""
+
+        wp_config = {"site": wp_site, "url": "", "user": "", "key": ""}
+        if not wp_site:
+            wp_domain = st.text_input("Domena", placeholder="https://twojablog.pl")
+            wp_user = st.text_input("Użytkownik WP (Login)", help="Login do konta, na którym wygenerowano klucz")
+            wp_key = st.text_input("Hasło Aplikacji (Klucz API)", type="password", help="Ciąg znaków wygenerowany w profilu użytkownika")
+
+            wp_config.update({
+                "url": wp_domain,
+                "user": wp_user,
+                "key": wp_key # To trafi do funkcji publish_post jako api_key
+            })
+        # Bez strony domyślnej publikacja ma sens tylko, gdy wiersze mają przypisaną stronę z rejestru
+        wp_ready = bool(wp_site or (wp_config['url'] and wp_config['key']) or registered_sites)
+
+        st.divider()
+
+        # RÓWNOLEGŁOŚĆ
+        with st.expander("⚡ Równoległość (wątki na etap)", expanded=False):
+            st.caption("Ile wierszy przetwarzać jednocześnie. 1 = tryb sekwencyjny.")
+            stage_workers = {
+                col: st.number_input(label, min_value=1, max_value=64, value=default_stage_workers(col), key=f"workers_{col}")
+                for col, label in STAGE_LABELS.items()
+            }
+
+        # TRYB GENERACJI
+        with st.expander("✍️ Tryb generacji artykułu", expanded=False):
+            writing_mode = st.radio("Tryb", list(WRITING_MODES.keys()), format_func=WRITING_MODES.get, key="writing_mode")
+            wave_size = 0
+            if writing_mode == 'parallel':
+                wave_size = st.number_input(
+                    "Sekcji na falę (0 = wszystkie naraz)", min_value=0, max_value=30, value=4, key="writing_wave_size",
+                    help="Kolejne fale dostają streszczenia sekcji z poprzednich fal zamiast pełnego HTML."
+                )
+            writing_config = {"mode": writing_mode, "wave_size": wave_size}
+
+        st.divider()
+
+        # HARMONOGRAM
+        with st.expander("⚖️ Harmonogram (priorytet batcha)", expanded=False):
+            st.text_input(
+                "Operator", key="operator_name", placeholder="np. ania",
+                help="Moc procesu dzielona jest sprawiedliwie między operatorów i projekty - długi batch jednej osoby nie blokuje innych."
+            )
+            st.radio(
+                "Klasa batcha", list(scheduler.PRIORITY_CLASSES), format_func=scheduler.PRIORITY_CLASSES.get, key="batch_class",
+                index=list(scheduler.PRIORITY_CLASSES).index(scheduler.DEFAULT_CLASS),
+                help="Pilny dostaje większą część wątków i limitów Dify, \"w tle\" - tylko wolną moc. "
+                     "Wiersze z bliskim terminem \"Publikuj do\" idą pierwsze niezależnie od klasy."
+            )
+
+        # TRYB WYKONANIA
+        execution_mode = st.radio(
+            "🚦 Tryb wykonania", list(EXECUTION_MODES.keys()), format_func=EXECUTION_MODES.get, key="execution_mode",
+            help="W tle: zadania zapisują się w kolejce i wykonuje je worker (python worker.py) - można zamknąć przeglądarkę."
+        )
+        st.checkbox(
+            "♻️ Wymuś odświeżenie (pomiń cache Dify)", key="cache_force_refresh",
+            help="Wyniki workflow dla identycznych wejść są brane z cache. Zaznacz, aby ten batch wywołał Dify ponownie i nadpisał cache."
+        )
 
     # --- GŁÓWNY OBSZAR ---
     
-    df = fetch_data()
-    
+    main_view = st.radio("Widok", ["📋 Zadania", "📈 Metryki"], horizontal=True, label_visibility="collapsed", key="main_view")
+    if main_view == "📈 Metryki":
+        render_metrics_dashboard()
+        st.stop()
+
+    render_resumable_runs({stage: stage_workers[spec['status_col']] for stage, spec in STAGES.items()}, wp_config)
+
     st.header("📋 Lista Zadań")
+    batch_summary = st.session_state.pop("batch_summary", None)
+    if batch_summary:
+        st.success(batch_summary)
     
-    # Filtry
-    col_f1, col_f2 = st.columns([2, 2])
+    # Filtry i stronicowanie (po stronie bazy)
+    col_f1, col_f2, col_f3, col_f4 = st.columns([2, 1, 1, 2])
     with col_f1:
-        status_filter = st.selectbox("Status Research", ["Wszystkie", "Oczekuje", "✅ Gotowe", "❌ Błąd"])
-    if status_filter != "Wszystkie":
-        df = df[df['Status Research'].str.contains(status_filter, na=False)]
+        status_filter = st.selectbox("Status Research", ["Wszystkie", PENDING_STATUS, "✅ Gotowe", "❌ Błąd"])
+    with col_f2:
+        page_size = st.selectbox("Wierszy na stronę", PAGE_SIZES, index=1)
+    with col_f4:
+        show_full = st.checkbox("Pokaż wszystkie kolumny (wolniej)", help="Domyślnie siatka pobiera tylko statusy i krótkie kolumny. Treści widać w podglądzie poniżej.")
+    filters = {} if status_filter == "Wszystkie" else {"status_research": status_filter}
+
+    with col_f3:
+        page = st.number_input("Strona", min_value=1, value=1, key="grid_page")
+    df, total_rows = fetch_data(page - 1, page_size, filters, show_full)
+    page_count = max(1, -(-total_rows // page_size))
+    if page > page_count:
+        # Np. po zmianie filtra - ostatnia istniejąca strona
+        page = page_count
+        df, total_rows = fetch_data(page - 1, page_size, filters, show_full)
+    st.caption(f"Strona {page} z {page_count} · pasujących wierszy: {total_rows}")
+    st.session_state["grid_view"] = (set(df['ID'].tolist()), bool(filters))
+    render_live_status()
 
     # KONFIGURACJA TABELI
     column_cfg = {
@@ -410,6 +854,11 @@ if check_password():
         "Słowo kluczowe": st.column_config.TextColumn(width=200),
         "Język": st.column_config.TextColumn(width="small"),
         "AIO": st.column_config.TextColumn(width=200),
+        "Projekt": st.column_config.TextColumn(width="small", help="Udział w harmonogramie (wagi [scheduler.project_weights])"),
+        "Priorytet": st.column_config.NumberColumn(width="small", format="%d", step=1, help="Wyższy = wcześniej w kolejce swojego batcha"),
+        "Publikuj do": st.column_config.TextColumn(
+            width="small", help="Termin publikacji, np. 2026-11-03 12:00. Bliżej niż URGENT_HOURS = wiersz wyprzedza inne batche"
+        ),
         # Statusy
         "Status Research": st.column_config.TextColumn(width="small"),
         "Status Nagłówki": st.column_config.TextColumn(width="small"),
@@ -434,7 +883,15 @@ if check_password():
         "Brief plik": st.column_config.TextColumn(width=200),
         "Dodatkowe instrukcje": st.column_config.TextColumn(width=200),
         "Generowanie contentu": st.column_config.TextColumn(width=200, disabled=True),
+        "Statystyki generacji": st.column_config.TextColumn(width=200, disabled=True),
         "Link do wpisu": st.column_config.LinkColumn(width=200), # NOWE
+        "Strona WP": st.column_config.SelectboxColumn(width=150, options=registered_sites, help="Strona z rejestru [wordpress.sites]; puste = strona domyślna")
+            if registered_sites else st.column_config.TextColumn(width=150, help="Nazwa strony z rejestru [wordpress.sites]"),
+        "ID wpisu WP": st.column_config.NumberColumn(width="small", format="%d", help="Ponowna publikacja aktualizuje ten wpis zamiast tworzyć nowy"),
+        "Kategorie WP": st.column_config.TextColumn(width=150, help="Nazwy oddzielone przecinkami - brakujące zostaną utworzone"),
+        "Tagi WP": st.column_config.TextColumn(width=150, help="Nazwy oddzielone przecinkami - brakujące zostaną utworzone"),
+        "Obrazek wyróżniający (URL)": st.column_config.TextColumn(width=200),
+        "updated_at": None, # tylko do unieważniania cache
     }
 
     edited_df = st.data_editor(
@@ -453,13 +910,15 @@ if check_password():
 
     with c_s:
         if st.button("💾 Zapisz"):
-            save_manual_changes(edited_df)
-            time.sleep(1)
-            st.rerun()
+            if save_manual_changes(df, st.session_state["data_editor"]["edited_rows"], save_batch_size()):
+                invalidate_grid_cache()
+                time.sleep(1)
+                st.rerun()
     with c_d:
         if st.button("🗑️ Usuń"):
             if count_selected > 0:
                 delete_records(selected_rows['ID'].tolist())
+                invalidate_grid_cache()
                 st.success(f"Usunięto {count_selected}")
                 time.sleep(1)
                 st.rerun()
@@ -477,29 +936,56 @@ if check_password():
 
         with c1:
             if st.button(f"1. RESEARCH"):
-                run_batch_process(rows_to_process, stage_research, "status_research", "Gotowe")
+                launch_stage("research", rows_to_process, workers=stage_workers["status_research"])
         with c2:
             if st.button(f"2. NAGŁÓWKI"):
-                run_batch_process(rows_to_process, stage_headers, "status_headers", "Gotowe")
+                launch_stage("headers", rows_to_process, workers=stage_workers["status_headers"])
         with c3:
             if st.button(f"3. RAG"):
-                run_batch_process(rows_to_process, stage_rag, "status_rag", "Gotowe")
+                launch_stage("rag", rows_to_process, workers=stage_workers["status_rag"])
         with c4:
             if st.button(f"4. BRIEF"):
-                run_batch_process(rows_to_process, stage_brief, "status_brief", "Gotowe")
+                launch_stage("brief", rows_to_process, workers=stage_workers["status_brief"])
         with c5:
             if st.button(f"5. GENERUJ"):
-                run_batch_process(rows_to_process, stage_writing, "status_writing", "Gotowe")
+                launch_stage("writing", rows_to_process, extra_args=writing_config, workers=stage_workers["status_writing"])
         with c6:
             # PRZYCISK PUBLIKACJI
             if st.button(f"6. PUBLIKUJ WP", type="primary"):
-                if not wp_config['url'] or not wp_config['key']:
+                if not wp_ready:
                     st.error("Uzupełnij dane WP w pasku bocznym!")
                 else:
-                    run_batch_process(rows_to_process, stage_publication, "status_publication", "Opublikowano", extra_args=wp_config)
+                    launch_stage("publication", rows_to_process, extra_args=wp_config, workers=stage_workers["status_publication"])
+
+        # PEŁNY PIPELINE (etapy 1-6 strumieniowo, per wiersz)
+        st.markdown("**🚀 Pełny pipeline** — każdy wiersz przechodzi do kolejnego etapu zaraz po zakończeniu poprzedniego.")
+        p1, p2, p3 = st.columns([3, 2, 1])
+        with p1:
+            pipeline_stages = st.multiselect("Etapy", PIPELINE_ORDER, default=PIPELINE_ORDER, format_func=stage_label, key="pipeline_stages")
+        with p2:
+            pause_after_headers = st.checkbox(
+                "⏸️ Zatrzymaj po nagłówkach", key="pipeline_pause_headers",
+                help="Brief, generacja i publikacja czekają na ręczną akceptację \"Nagłówki (Finalne)\". Wznów, uruchamiając pipeline od etapu Brief."
+            )
+        with p3:
+            if st.button("🚀 URUCHOM PIPELINE", type="primary", disabled=not pipeline_stages):
+                if 'publication' in pipeline_stages and not wp_ready:
+                    st.error("Uzupełnij dane WP w pasku bocznym lub usuń etap publikacji!")
+                else:
+                    launch_pipeline(
+                        rows_to_process,
+                        [s for s in PIPELINE_ORDER if s in pipeline_stages],
+                        {"writing": writing_config, "publication": wp_config},
+                        ['headers'] if pause_after_headers else [],
+                        {stage: stage_workers[spec['status_col']] for stage, spec in STAGES.items()}
+                    )
     else:
         st.caption("Zaznacz wiersze, aby uruchomić akcje.")
 
+    if execution_mode == 'queue':
+        st.divider()
+        render_job_queue()
+
     # --- PODGLĄD SZCZEGÓŁÓW ---
     st.divider()
     
@@ -509,7 +995,10 @@ if check_password():
             sel = st.selectbox("Podgląd:", opts.keys())
             if sel:
                 row_id = opts[sel]
-                view_row = edited_df[edited_df['ID'] == row_id].iloc[0]
+                grid_row = edited_df[edited_df['ID'] == row_id].iloc[0].to_dict()
+                # Ciężkie kolumny tylko dla podglądanego wiersza; edycje z siatki mają pierwszeństwo
+                view_row = fetch_row_details(row_id, grid_row.get('updated_at')) or {}
+                view_row.update({k: v for k, v in grid_row.items() if k != 'Select'})
                 
                 with st.expander("🔍 Szczegóły", expanded=False):
                     t1, t2, t3, t4, t5, t6 = st.tabs(["Research", "Nagłówki", "RAG", "Brief", "Artykuł", "Publikacja"])
@@ -525,6 +1014,9 @@ if check_password():
                         if view_row['Brief plik']: st.components.v1.html(view_row['Brief plik'], height=400, scrolling=True)
                     with t5:
                         if view_row['Generowanie contentu']: st.markdown(view_row['Generowanie contentu'], unsafe_allow_html=True)
+                        if view_row.get('Statystyki generacji'):
+                            with st.popover("⏱️ Statystyki generacji"):
+                                st.json(json.loads(view_row['Statystyki generacji']))
                     with t6:
                         st.write(f"Status: {view_row['Status Publikacji']}")
                         if view_row['Link do wpisu']:
@@ -0,0 +1,606 @@
+"""
+Benchmark Content Factory offline - bez kosztów LLM i bez dotykania prawdziwych stron.
+
+Uruchamia prawdziwe funkcje etapów (pipeline.stage_*) i PipelineRunner na lokalnych zamiennikach:
+- MockServer: HTTP na localhost z fałszywym Dify (/v1/workflows/run, blocking i streaming SSE)
+  o zadanym rozkładzie opóźnień (lognormalny), rozmiarze odpowiedzi i odsetku błędów,
+  oraz fałszywym WordPress REST (/wp-json/wp/v2/posts, terminy, /batch/v1),
+- FakeSupabase: tabela seo_content_tasks w pamięci z podzbiorem API klienta supabase-py
+  używanym przez pipeline (select/eq/in_/ilike/order/range/update/insert/upsert/delete).
+
+Raport per rozmiar batcha: wiersze/min, p50/p95 czasu etapów (z metrics.py), błędy,
+szczyt pamięci Pythona (tracemalloc) i maksymalny RSS procesu.
+
+Przykłady:
+    python benchmark.py --sizes 10,100,1000
+    python benchmark.py --sizes 10000 --stages research,headers --latency-ms 20 --workers 64
+    python benchmark.py --response-mode streaming --failure-rate 0.02 --json bench.json
+    python benchmark.py --content-kb 100,300,800   # tylko przetwarzanie HTML (content_processing), bez mocków
+"""
+import re
+import json
+import math
+import time
+import random
+import argparse
+import resource
+import threading
+import tracemalloc
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import metrics
+import pipeline
+import content_processing
+from pipeline import PIPELINE_ORDER, STAGES, PipelineRunner, rename_to_ui
+
+# --- FAŁSZYWY DIFY + WORDPRESS ---
+# Klucz API workflow -> etap (nagłówek Authorization identyfikuje workflow jak w prawdziwym Dify)
+BENCH_API_KEYS = {
+    'API_KEY_RESEARCH': 'bench-research',
+    'API_KEY_HEADERS': 'bench-headers',
+    'API_KEY_RAG': 'bench-rag',
+    'API_KEY_BRIEF': 'bench-brief',
+    'API_KEY_WRITE': 'bench-writing'
+}
+
+def _filler(size, seed):
+    words = ["rower", "miejski", "opony", "rama", "przerzutki", "hamulce", "siodełko", "koło", "łańcuch", "kask"]
+    rnd = random.Random(seed)
+    out, length = [], 0
+    while length < size:
+        word = rnd.choice(words)
+        out.append(word)
+        length += len(word) + 1
+    return " ".join(out)[:size]
+
+def fake_outputs(stage, inputs, payload_bytes, sections):
+    """Wyjścia workflow w kształcie, którego oczekują etapy pipeline.py."""
+    text = _filler(payload_bytes, inputs.get("keyword"))
+    if stage == 'research':
+        return {"frazy z serp": text, "frazy_senuto": text[:200], "grafinformacji": text, "naglowki": text[:500], "knowledge_graph": text}
+    if stage == 'headers':
+        headers = "\n".join(f"<h2>Nagłówek {i + 1}: {inputs.get('keyword')}</h2>" for i in range(sections))
+        return {"naglowki_rozbudowane": text, "naglowki_h2": headers, "naglowki_pytania": ""}
+    if stage == 'rag':
+        return {"dokladne": text, "ogolne": text[:1000]}
+    if stage == 'brief':
+        return {"brief": text, "html": f"<p>{text}</p>"}
+    return {"result": f"<p>{text}</p>"}
+
+class MockConfig:
+    def __init__(self, latency_ms=50.0, latency_sigma=0.5, failure_rate=0.0, payload_bytes=4000, sections=5, wp_latency_ms=20.0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.payload_bytes = payload_bytes
+        self.sections = sections
+        self.wp_latency_ms = wp_latency_ms
+
+    def sample_latency(self, median_ms):
+        # Lognormalny rozkład wokół mediany - długi ogon jak w prawdziwych wywołaniach LLM
+        if median_ms <= 0:
+            return 0.0
+        return median_ms / 1000.0 * math.exp(random.gauss(0, self.latency_sigma))
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return {}
+
+    def do_GET(self):
+        self.server.mock.handle_wp(self, "GET", self.path, {})
+
+    def do_POST(self):
+        body = self._body()
+        if self.path.startswith("/v1/workflows/run"):
+            self.server.mock.handle_dify(self, body)
+        else:
+            self.server.mock.handle_wp(self, "POST", self.path, body)
+
+    def do_PUT(self):
+        self.server.mock.handle_wp(self, "PUT", self.path, self._body())
+
+class MockServer:
+    """Fałszywy Dify + WordPress na jednym porcie (wątek w tle)."""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockConfig()
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.posts = {}
+        self.terms = {'categories': {}, 'tags': {}}
+        self.requests = {"dify": 0, "wp": 0, "wp_batch": 0}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # --- Dify ---
+    def handle_dify(self, handler, body):
+        with self._lock:
+            self.requests["dify"] += 1
+        stage = handler.headers.get("Authorization", "").replace("Bearer bench-", "")
+        time.sleep(self.config.sample_latency(self.config.latency_ms))
+        if random.random() < self.config.failure_rate:
+            handler._json(500, {"code": "internal_error", "message": "bench: wylosowany błąd"})
+            return
+        outputs = fake_outputs(stage, body.get("inputs") or {}, self.config.payload_bytes, self.config.sections)
+        data = {"status": "succeeded", "outputs": outputs, "total_tokens": self.config.payload_bytes // 4, "elapsed_time": 0}
+        if body.get("response_mode") != "streaming":
+            handler._json(200, {"workflow_run_id": "bench", "task_id": "bench", "data": data})
+            return
+        events = [
+            {"event": "workflow_started", "data": {}},
+            {"event": "node_started", "data": {"title": "LLM"}},
+            {"event": "workflow_finished", "workflow_run_id": "bench", "task_id": "bench", "data": data},
+        ]
+        payload = b"".join(f"data: {json.dumps(e, ensure_ascii=False)}\n\n".encode("utf-8") for e in events)
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Content-Length", str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    # --- WordPress ---
+    def _wp_call(self, method, path, body):
+        """(status, dane) dla pojedynczego żądania /wp/v2/... (także z wnętrza /batch/v1)."""
+        path = path.split("?")[0]
+        if path.rstrip("/") in ("", "/wp-json"):
+            return 200, {"namespaces": ["wp/v2", "batch/v1"]}
+        path = path.replace("/wp-json", "", 1)
+        taxonomy = re.fullmatch(r"/wp/v2/(categories|tags)", path)
+        if taxonomy:
+            terms = self.terms[taxonomy.group(1)]
+            if method == "GET":
+                return 200, [{"id": tid, "name": name, "slug": name.lower()} for name, tid in terms.items()]
+            with self._lock:
+                terms.setdefault(body.get("name"), len(terms) + 1)
+                return 201, {"id": terms[body.get("name")]}
+        if path == "/wp/v2/posts" and method == "POST":
+            with self._lock:
+                post_id = len(self.posts) + 1
+                self.posts[post_id] = body
+            return 201, {"id": post_id, "link": f"{self.url}/?p={post_id}"}
+        match = re.fullmatch(r"/wp/v2/posts/(\d+)", path)
+        if match and method in ("PUT", "POST"):
+            post_id = int(match.group(1))
+            if post_id not in self.posts:
+                return 404, {"code": "rest_post_invalid_id"}
+            self.posts[post_id] = body
+            return 200, {"id": post_id, "link": f"{self.url}/?p={post_id}"}
+        return 404, {"code": "rest_no_route"}
+
+    def handle_wp(self, handler, method, path, body):
+        time.sleep(self.config.sample_latency(self.config.wp_latency_ms))
+        if path.split("?")[0] == "/wp-json/batch/v1":
+            with self._lock:
+                self.requests["wp_batch"] += 1
+            responses = []
+            for item in body.get("requests", []):
+                status, data = self._wp_call(item.get("method", "POST"), item.get("path", ""), item.get("body") or {})
+                responses.append({"status": status, "body": data})
+            handler._json(207, {"responses": responses})
+            return
+        with self._lock:
+            self.requests["wp"] += 1
+        status, data = self._wp_call(method, path, body)
+        handler._json(status, data, {"X-WP-TotalPages": "1"})
+
+# --- FAŁSZYWY SUPABASE (w pamięci) ---
+class _Response:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class _Query:
+    def __init__(self, table, op="select", payload=None, **options):
+        self.table = table
+        self.op = op
+        self.payload = payload
+        self.options = options
+        self.columns = None
+        self.count = None
+        self.filters = []
+        self.ordering = None
+        self.offset = 0
+        self.limit_n = None
+
+    def select(self, columns="*", count=None):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        self.count = count
+        return self
+
+    def _filter(self, fn):
+        self.filters.append(fn)
+        return self
+
+    def eq(self, col, value):
+        return self._filter(lambda r: r.get(col) == value)
+
+    def neq(self, col, value):
+        return self._filter(lambda r: r.get(col) != value)
+
+    def in_(self, col, values):
+        values = set(values)
+        return self._filter(lambda r: r.get(col) in values)
+
+    def gt(self, col, value):
+        return self._filter(lambda r: r.get(col) is not None and r.get(col) > value)
+
+    def gte(self, col, value):
+        return self._filter(lambda r: r.get(col) is not None and r.get(col) >= value)
+
+    def lt(self, col, value):
+        return self._filter(lambda r: r.get(col) is not None and r.get(col) < value)
+
+    def ilike(self, col, pattern):
+        regex = re.compile("^" + re.escape(pattern).replace("%", ".*") + "$", re.IGNORECASE | re.DOTALL)
+        return self._filter(lambda r: isinstance(r.get(col), str) and regex.match(r[col]) is not None)
+
+    def order(self, col, desc=False, nullsfirst=None):
+        self.ordering = (col, desc)
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    def range(self, start, end):
+        self.offset, self.limit_n = start, end - start + 1
+        return self
+
+    def execute(self):
+        return self.table.execute(self)
+
+class FakeTable:
+    def __init__(self, name):
+        self.name = name
+        self.rows = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def select(self, columns="*", count=None):
+        return _Query(self).select(columns, count)
+
+    def update(self, values):
+        return _Query(self, "update", values)
+
+    def insert(self, records):
+        return _Query(self, "insert", records)
+
+    def upsert(self, records, on_conflict="id", ignore_duplicates=False):
+        return _Query(self, "upsert", records, on_conflict=on_conflict, ignore_duplicates=ignore_duplicates)
+
+    def delete(self):
+        return _Query(self, "delete")
+
+    def _now(self):
+        return datetime.now(timezone.utc).isoformat()
+
+    def _store(self, record):
+        record = dict(record)
+        if record.get("id") is None:
+            record["id"] = self._next_id
+        self._next_id = max(self._next_id, record["id"] + 1)
+        record.setdefault("created_at", self._now())
+        record["updated_at"] = self._now()
+        self.rows[record["id"]] = record
+        return record
+
+    def execute(self, q):
+        with self._lock:
+            if q.op in ("insert", "upsert"):
+                records = q.payload if isinstance(q.payload, list) else [q.payload]
+                stored = []
+                for record in records:
+                    existing = self.rows.get(record.get("id")) if q.op == "upsert" else None
+                    if existing is not None and q.options.get("ignore_duplicates"):
+                        continue
+                    stored.append(self._store({**(existing or {}), **record}))
+                return _Response(stored)
+
+            matched = [r for r in self.rows.values() if all(f(r) for f in q.filters)]
+            if q.op == "update":
+                for r in matched:
+                    r.update(q.payload)
+                    r["updated_at"] = self._now()
+                return _Response([dict(r) for r in matched])
+            if q.op == "delete":
+                for r in matched:
+                    del self.rows[r["id"]]
+                return _Response(matched)
+
+            if q.ordering:
+                col, desc = q.ordering
+                present = [r for r in matched if r.get(col) is not None]
+                missing = [r for r in matched if r.get(col) is None]
+                matched = sorted(present, key=lambda r: r[col], reverse=desc) + missing
+            total = len(matched)
+            end = None if q.limit_n is None else q.offset + q.limit_n
+            page = matched[q.offset:end]
+            if q.columns:
+                page = [{c: r.get(c) for c in q.columns} for r in page]
+            else:
+                page = [dict(r) for r in page]
+            return _Response(page, total if q.count else None)
+
+class FakeSupabase:
+    """Zamiennik klienta supabase-py dla tabel używanych przez pipeline (dane w pamięci procesu)."""
+
+    def __init__(self):
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        with self._lock:
+            if name not in self.tables:
+                self.tables[name] = FakeTable(name)
+            return self.tables[name]
+
+class ListMetricsBackend:
+    """Metryki w pamięci - do raportu benchmarku."""
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def write(self, events):
+        with self._lock:
+            self.events.extend(events)
+
+    def load(self, since_ts, limit=None):
+        with self._lock:
+            return [e for e in self.events if e["ts"] >= since_ts]
+
+# --- URUCHOMIENIE ---
+def bench_secrets(server, response_mode="blocking", batch_cfg=None):
+    return {
+        "SUPABASE": {"URL": "bench://memory", "KEY": "bench"},
+        "dify": {"BASE_URL": f"{server.url}/v1", "RESPONSE_MODE": response_mode, **BENCH_API_KEYS},
+        "batch": dict(batch_cfg or {}),
+        "http": {"MAX_RETRIES": 2, "BACKOFF_BASE": 0.05, "BACKOFF_MAX": 0.5},
+        "wordpress": {"RATE_PER_SECOND": 0},
+        "cache": {"BACKEND": "off"},
+        "metrics": {"BACKEND": "off"}
+    }
+
+def seed_rows(client, count, sections=5):
+    """Wiersze z samym słowem kluczowym (etapy uzupełnią resztę kolumn)."""
+    table = client.table("seo_content_tasks")
+    empty = {col: None for col in pipeline.COLUMN_MAP if col != 'id'}
+    records = [
+        {**empty, "keyword": f"bench słowo {i}", "language": "pl", "aio_prompt": "", "headers_final": "", "instructions": ""}
+        for i in range(count)
+    ]
+    table.insert(records).execute()
+    return [rename_to_ui(r) for r in table.select("*").order("id").execute().data]
+
+def run_benchmark(size, stages, server, stage_workers, writing_config=None):
+    """Jeden przebieg: świeża tabela w pamięci, PipelineRunner przez wybrane etapy. Zwraca wiersz raportu."""
+    client = FakeSupabase()
+    pipeline._supabase_client = client
+    rows = seed_rows(client, size)
+    backend = ListMetricsBackend()
+    metrics.configure(backend)
+
+    stage_args = {
+        "writing": writing_config or {"mode": "sequential"},
+        "publication": {"url": server.url, "user": "bench", "key": "bench"}
+    }
+    # Etapy wymagają treści z poprzednich - przebieg zawsze od researchu do ostatniego wybranego etapu
+    stages = PIPELINE_ORDER[:max(PIPELINE_ORDER.index(s) for s in stages) + 1]
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    with metrics.batch_scope(f"bench-{size}"):
+        stats = PipelineRunner(rows, stages, stage_workers, stage_args).run(poll_interval=0.05)
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    metrics.configure(None)
+
+    summary = {r["name"]: r for r in metrics.summarize(backend.events, "stage")}
+    done = stats[stages[-1]]["done"]
+    result = {
+        "rows": size,
+        "stages": ",".join(stages),
+        "wall_s": round(wall, 2),
+        "rows_per_min": round(done / wall * 60, 1) if wall else None,
+        "completed": done,
+        "errors": sum(s["errors"] for s in stats.values()),
+        "py_peak_mb": round(peak / 1024 / 1024, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stage_p50_s": {name: s["p50_s"] for name, s in summary.items()},
+        "stage_p95_s": {name: s["p95_s"] for name, s in summary.items()},
+        "http": summarize_http(backend.events)
+    }
+    return result
+
+def summarize_http(events):
+    rows = metrics.summarize(events, "http")
+    return {r["name"]: {"count": r["count"], "p95_s": r["p95_s"], "retries": r["retries"]} for r in rows}
+
+def print_report(results):
+    header = f"{'wiersze':>8} {'czas s':>8} {'wiersze/min':>12} {'gotowe':>7} {'błędy':>6} {'py MB':>7} {'RSS MB':>7}  p95 etapów (s)"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        p95 = " ".join(f"{name}={value}" for name, value in r["stage_p95_s"].items())
+        print(f"{r['rows']:>8} {r['wall_s']:>8} {r['rows_per_min']:>12} {r['completed']:>7} {r['errors']:>6} "
+              f"{r['py_peak_mb']:>7} {r['max_rss_mb']:>7}  {p95}")
+
+# --- PRZETWARZANIE HTML (mikro-benchmark) ---
+LOREM = ("Lorem ipsum dolor sit amet, <strong>consectetur</strong> adipiscing elit, sed do eiusmod tempor "
+         "incididunt ut labore et dolore <a href=\"https://example.com/x\">magna aliqua</a>. Zażółć gęślą jaźń. ")
+
+def synthetic_article(size_kb, rng):
+    """Artykuł HTML ~size_kb KB: sekcje H2 z H3, akapitami, listami, komentarzami i nadmiarowymi białymi znakami."""
+    sections, size, i = [], 0, 0
+    while size < size_kb * 1024:
+        i += 1
+        body = [f"<h3>Podsekcja {i}.{j} – „szczegóły”</h3>\n\n  <p>{LOREM * rng.randint(3, 8)}</p>\n" for j in range(rng.randint(1, 3))]
+        body.append("<ul>\n" + "".join(f"    <li>Punkt {k}: {LOREM[:60]}</li>\n" for k in range(5)) + "</ul>\n<!-- notatka redakcyjna -->\n")
+        section = f"<h2>Sekcja {i}: Łódź &amp; okolice</h2>\n<p>{LOREM * rng.randint(4, 10)}</p>\n{''.join(body)}\n\n"
+        sections.append(section)
+        size += len(section.encode("utf-8"))
+    return sections
+
+def legacy_extract_headers(text):
+    # Poprzednia implementacja pipeline.extract_headers_from_text (regex kompilowany w każdym wywołaniu + regex na nagłówek)
+    html_headers = re.findall(r'<h2.*?>(.*?)</h2>', text, re.IGNORECASE)
+    return [re.sub(r'<.*?>', '', h).strip() for h in html_headers]
+
+def legacy_assemble(sections):
+    # Poprzedni tryb sekwencyjny: kontekst przez += i pełny join przy zapisie postępu po każdej sekcji
+    article_content, parts = "", [""] * len(sections)
+    for i, section in enumerate(sections):
+        done = article_content
+        parts[i] = section
+        "".join(parts)
+        article_content += section
+    return "".join(parts), done
+
+def builder_assemble(sections):
+    parts = content_processing.ArticleBuilder(len(sections))
+    for i, section in enumerate(sections):
+        done = parts.html(upto=i)
+        parts[i] = section
+        parts.html()
+    return parts.html(), done
+
+def _best_ms(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 2), result
+
+def run_content_benchmark(size_kb, repeat, rng):
+    sections = synthetic_article(size_kb, rng)
+    article = "".join(sections)
+    legacy_ms, legacy_headers = _best_ms(lambda: legacy_extract_headers(article), repeat)
+    extract_ms, headers = _best_ms(lambda: content_processing.extract_headers(article), repeat)
+    if headers != legacy_headers:
+        raise AssertionError("extract_headers zwraca inne nagłówki niż poprzednia implementacja")
+    legacy_assemble_ms, _ = _best_ms(lambda: legacy_assemble(sections), repeat)
+    assemble_ms, _ = _best_ms(lambda: builder_assemble(sections), repeat)
+    publish_ms, (published, report) = _best_ms(lambda: content_processing.prepare_for_publication(article, language="pl"), repeat)
+    size_mb = len(article.encode("utf-8")) / 1024 / 1024
+    return {
+        "kb": round(size_mb * 1024),
+        "sections": len(sections),
+        "headings": report["headings"],
+        "extract_legacy_ms": legacy_ms,
+        "extract_ms": extract_ms,
+        "assemble_legacy_ms": legacy_assemble_ms,
+        "assemble_ms": assemble_ms,
+        "publish_ms": publish_ms,
+        "publish_mb_s": round(size_mb / (publish_ms / 1000), 1) if publish_ms else None,
+        "size_change_pct": round(100 * (len(published) / len(article) - 1), 1)
+    }
+
+def print_content_report(results):
+    header = (f"{'KB':>6} {'sekcje':>7} {'nagł.':>6} {'extract stary':>14} {'extract':>8} "
+              f"{'składanie stare':>16} {'składanie':>10} {'publikacja':>11} {'MB/s':>6} {'rozmiar %':>10}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['kb']:>6} {r['sections']:>7} {r['headings']:>6} {r['extract_legacy_ms']:>14} {r['extract_ms']:>8} "
+              f"{r['assemble_legacy_ms']:>16} {r['assemble_ms']:>10} {r['publish_ms']:>11} {r['publish_mb_s']:>6} {r['size_change_pct']:>+10}")
+    print("\nCzasy w ms (najlepszy z --repeat przebiegów). Publikacja = kotwice + spis treści + sanityzacja + minifikacja;"
+          "\nrozmiar % = zmiana rozmiaru HTML po publikacji (spis treści i id dodają, minifikacja odejmuje).")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Content Factory na lokalnym fałszywym Dify/WordPress/Supabase")
+    parser.add_argument("--sizes", default="10,100,1000", help="Rozmiary batchy, np. 10,100,1000,10000")
+    parser.add_argument("--stages", default=",".join(PIPELINE_ORDER), help="Etapy (przebieg od researchu do ostatniego z listy)")
+    parser.add_argument("--workers", type=int, help="Wątki na etap (domyślnie DEFAULT_STAGE_WORKERS)")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mediana opóźnienia fałszywego Dify w ms")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Rozrzut (sigma rozkładu lognormalnego)")
+    parser.add_argument("--wp-latency-ms", type=float, default=20.0, help="Mediana opóźnienia fałszywego WordPress w ms")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Odsetek odpowiedzi 500 z Dify (0-1)")
+    parser.add_argument("--payload-kb", type=float, default=4.0, help="Rozmiar tekstu w odpowiedzi Dify (KB)")
+    parser.add_argument("--sections", type=int, default=5, help="Liczba nagłówków H2 (sekcji artykułu)")
+    parser.add_argument("--response-mode", choices=["blocking", "streaming"], default="blocking")
+    parser.add_argument("--writing-mode", choices=list(pipeline.WRITING_MODES), default="sequential")
+    parser.add_argument("--wave-size", type=int, default=0, help="Sekcji na falę w trybie parallel (0 = wszystkie)")
+    parser.add_argument("--content-kb", help="Tylko mikro-benchmark przetwarzania HTML: rozmiary artykułów w KB, np. 100,300,800")
+    parser.add_argument("--repeat", type=int, default=5, help="Powtórzenia mikro-benchmarku (liczy się najlepszy czas)")
+    parser.add_argument("--json", help="Zapisz wyniki jako JSON do pliku")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    if args.content_kb:
+        rng = random.Random(args.seed)
+        results = [run_content_benchmark(float(kb), max(1, args.repeat), rng) for kb in args.content_kb.split(",") if kb.strip()]
+        print_content_report(results)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        return results
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"Nieznane etapy: {', '.join(unknown)}")
+
+    config = MockConfig(args.latency_ms, args.latency_sigma, args.failure_rate, int(args.payload_kb * 1024), args.sections, args.wp_latency_ms)
+    server = MockServer(config).start()
+    try:
+        pipeline.configure(bench_secrets(server, args.response_mode))
+        stage_workers = {s: args.workers for s in STAGES} if args.workers else None
+        writing_config = {"mode": args.writing_mode, "wave_size": args.wave_size}
+        results = []
+        for size in sizes:
+            print(f"Batch {size} wierszy...", flush=True)
+            results.append(run_benchmark(size, stages, server, stage_workers, writing_config))
+    finally:
+        server.stop()
+
+    print()
+    print_report(results)
+    print(f"\nŻądania do mocków: {server.requests}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+if __name__ == "__main__":
+    main()
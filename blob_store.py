@@ -0,0 +1,423 @@
+"""
+Magazyn ciężkich kolumn seo_content_tasks (artykuł, RAG, brief, grafy...) poza gorącą tabelą.
+
+Wartość kolumny z BLOB_SETTINGS["columns"] dłuższa niż min_bytes jest kompresowana (zstd - pakiet
+zstandard, gdy zainstalowany - albo gzip), adresowana skrótem SHA-256 treści (ta sama treść = jeden
+blob, np. ten sam RAG General w wielu wierszach) i zapisywana w magazynie. W wierszu zostaje tylko
+referencja z kodekiem, skrótem i rozmiarami:
+
+    cfblob:v1:zstd:<sha256>:<bajty tekstu>:<bajty po kompresji>
+
+Odczyt rozwija referencje tylko w pobieranych kolumnach (siatka ich nie pobiera), wsadowo - jedno
+zapytanie na porcję blobów - z pamięcią podręczną rozpakowanych blobów w procesie (cache_mb).
+Wiersze z treścią zapisaną jeszcze w tabeli działają bez zmian (python factory.py compact przenosi je).
+
+Wiek bloba liczy się od ostatniego użycia: zapis tej samej treści odświeża go (touch) przed sprawdzeniem,
+czy blob istnieje, a sprzątanie (collect_garbage) usuwa tylko bloby, których od tego czasu nikt nie
+odświeżył - równoległy zapis w innym procesie nie traci bloba, do którego właśnie dodał referencję.
+
+Backendy:
+    FilesystemBlobStore - katalog lokalny (zamiennik magazynu obiektów: testy, jedna maszyna)
+    SupabaseBlobStore   - tabela seo_content_blobs (patrz README)
+    StorageBlobStore    - Supabase Storage (bucket), magazyn obiektów
+"""
+import os
+import gzip
+import time
+import base64
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+import metrics
+
+log = logging.getLogger("content_factory.blobs")
+
+REF_PREFIX = "cfblob:v1:"
+
+DEFAULT_COLUMNS = [
+    'final_article', 'rag_content', 'rag_general', 'brief_html', 'brief_json', 'knowledge_graph', 'info_graph',
+    'competitors_headers', 'serp_phrases', 'senuto_phrases', 'headers_expanded'
+]
+DEFAULT_ROOT = "blobs"
+GET_CHUNK = 50
+
+BLOB_SETTINGS = {
+    "columns": list(DEFAULT_COLUMNS),
+    "min_bytes": 4096,       # krótsze wartości zostają w wierszu (referencja i tak ma ~100 znaków)
+    "compression": "zstd",   # zstd | gzip | none; zstd bez pakietu zstandard = gzip
+    "level": None,           # None = domyślny poziom kodeka (zstd 3, gzip 6)
+    "cache_mb": 64,          # rozpakowane bloby w pamięci procesu
+    "gc_grace_hours": 24     # blob bez referencji użyty w tym czasie nie jest usuwany (zapis w toku)
+}
+
+BlobRef = namedtuple("BlobRef", "codec sha size stored")
+
+class BlobError(Exception):
+    """Brak bloba w magazynie albo treść niezgodna ze skrótem z referencji."""
+
+_backend = None
+
+def configure(backend=None, **settings):
+    global _backend
+    _backend = backend
+    BLOB_SETTINGS.update({k: v for k, v in settings.items() if v is not None})
+    _cache.clear()
+
+def enabled():
+    return _backend is not None
+
+# --- REFERENCJE ---
+def is_ref(value):
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+def parse_ref(value):
+    codec, sha, size, stored = value[len(REF_PREFIX):].split(":")
+    return BlobRef(codec, sha, int(size), int(stored))
+
+def format_ref(ref):
+    return f"{REF_PREFIX}{ref.codec}:{ref.sha}:{ref.size}:{ref.stored}"
+
+def blob_key(ref):
+    # Kodek w kluczu: zmiana COMPRESSION nie myli starych blobów z nowymi
+    return f"{ref.sha}.{ref.codec}"
+
+# --- KOMPRESJA ---
+_zstd_warned = False
+
+def _codec():
+    global _zstd_warned
+    codec = BLOB_SETTINGS["compression"]
+    if codec == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            if not _zstd_warned:
+                log.warning("Brak pakietu zstandard - bloby kompresowane gzip")
+                _zstd_warned = True
+            return "gzip"
+    return codec
+
+def _compress(data, codec):
+    level = BLOB_SETTINGS["level"]
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=int(level or 3)).compress(data)
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=min(int(level or 6), 9), mtime=0)
+    return data
+
+def _decompress(data, codec):
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    return data
+
+# --- PAMIĘĆ PODRĘCZNA (LRU wg rozmiaru) ---
+class _TextCache:
+    def __init__(self):
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            text = self._items.get(key)
+            if text is not None:
+                self._items.move_to_end(key)
+            return text
+
+    def put(self, key, text):
+        limit = float(BLOB_SETTINGS["cache_mb"]) * 1024 * 1024
+        if len(text) > limit:
+            return
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = text
+                self._size += len(text)
+            while self._size > limit and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+_cache = _TextCache()
+
+# --- ZAPIS ---
+def offload(record, columns=None):
+    """
+    Kopia rekordu (nazwy kolumn z bazy), w której długie wartości kolumn z magazynu są zastąpione
+    referencjami; bloby zapisywane są przed zwróceniem. Bez backendu - rekord bez zmian.
+    """
+    if _backend is None:
+        return record
+    columns = BLOB_SETTINGS["columns"] if columns is None else columns
+    min_bytes = int(BLOB_SETTINGS["min_bytes"])
+    result, pending = dict(record), {}
+    for col in columns:
+        value = record.get(col)
+        if not isinstance(value, str) or len(value) < min_bytes or is_ref(value):
+            continue
+        data = value.encode("utf-8")
+        if len(data) < min_bytes:
+            continue
+        sha = hashlib.sha256(data).hexdigest()
+        codec = _codec()
+        stored = _compress(data, codec) if codec != "none" else data
+        if len(stored) >= len(data):
+            codec, stored = "none", data  # niekompresowalne (np. już skompresowane dane)
+        ref = BlobRef(codec, sha, len(data), len(stored))
+        pending[blob_key(ref)] = stored
+        result[col] = format_ref(ref)
+        _cache.put(blob_key(ref), value)
+    if pending:
+        with metrics.timed("blob", "put", request_bytes=sum(len(v) for v in pending.values())):
+            # Najpierw touch: blob obecny po nim ma świeży wiek i collect_garbage go nie usunie
+            _backend.touch(list(pending))
+            for key in _backend.missing(list(pending)):
+                _backend.put(key, pending[key])
+    return result
+
+# --- ODCZYT ---
+def resolve(records):
+    """Zamienia referencje w rekordach (w miejscu) na treść: bloby z cache, reszta jednym get_many na porcję."""
+    refs = {}
+    for record in records:
+        for value in record.values():
+            if is_ref(value) and value not in refs:
+                refs[value] = parse_ref(value)
+    if not refs:
+        return records
+    texts = {}
+    to_fetch = {}
+    for value, ref in refs.items():
+        text = _cache.get(blob_key(ref))
+        if text is not None:
+            texts[value] = text
+        else:
+            to_fetch[blob_key(ref)] = (value, ref)
+    if to_fetch:
+        if _backend is None:
+            raise BlobError("Wiersz ma treść w magazynie blobów, ale [blobs] BACKEND = \"off\".")
+        keys = list(to_fetch)
+        with metrics.timed("blob", "get") as m:
+            blobs = {}
+            for i in range(0, len(keys), GET_CHUNK):
+                blobs.update(_backend.get_many(keys[i:i + GET_CHUNK]))
+            m["response_bytes"] = sum(len(b) for b in blobs.values())
+        for key, (value, ref) in to_fetch.items():
+            if key not in blobs:
+                raise BlobError(f"Brak bloba {key} w magazynie.")
+            try:
+                data = _decompress(blobs[key], ref.codec)
+            except Exception as e:
+                raise BlobError(f"Blob {key} uszkodzony: {e}") from e
+            if hashlib.sha256(data).hexdigest() != ref.sha:
+                raise BlobError(f"Blob {key} nie zgadza się ze skrótem z referencji.")
+            texts[value] = data.decode("utf-8")
+            _cache.put(key, texts[value])
+    for record in records:
+        for col, value in record.items():
+            if is_ref(value):
+                record[col] = texts[value]
+    return records
+
+# --- SPRZĄTANIE ---
+def referenced_keys(records):
+    return {blob_key(parse_ref(v)) for record in records for v in record.values() if is_ref(v)}
+
+def collect_garbage(referenced, dry_run=False, started=None):
+    """
+    Usuwa bloby bez referencji nieużywane od gc_grace_hours przed `started` (początek zbierania
+    referencji). Blob odświeżony w trakcie sprzątania nie jest usuwany. Zwraca liczbę (do) usuniętych.
+    """
+    if _backend is None:
+        return 0
+    cutoff = (started or time.time()) - float(BLOB_SETTINGS["gc_grace_hours"]) * 3600
+    orphans = [key for key in _backend.list_keys(cutoff) if key not in referenced]
+    if orphans and not dry_run:
+        for i in range(0, len(orphans), 500):
+            _backend.delete(orphans[i:i + 500], cutoff)
+    return len(orphans)
+
+# --- BACKEND: SYSTEM PLIKÓW ---
+class FilesystemBlobStore:
+    """Bloby jako pliki <root>/<2 znaki skrótu>/<klucz>; zapis atomowy (plik tymczasowy + os.replace)."""
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def touch(self, keys):
+        for key in keys:
+            try:
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def missing(self, keys):
+        return [key for key in keys if not os.path.exists(self._path(key))]
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get_many(self, keys):
+        blobs = {}
+        for key in keys:
+            try:
+                with open(self._path(key), "rb") as f:
+                    blobs[key] = f.read()
+            except FileNotFoundError:
+                pass
+        return blobs
+
+    def list_keys(self, older_than):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.startswith(".tmp-") and os.path.getmtime(os.path.join(dirpath, name)) < older_than:
+                    yield name
+
+    def delete(self, keys, older_than):
+        for key in keys:
+            try:
+                if os.path.getmtime(self._path(key)) < older_than:
+                    os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+# --- BACKEND: TABELA SUPABASE ---
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+class SupabaseBlobStore:
+    """Tabela seo_content_blobs: klucz, kodek, rozmiary i treść po kompresji w base64."""
+
+    def __init__(self, client, table="seo_content_blobs"):
+        self.client = client
+        self.table = table
+
+    def touch(self, keys):
+        self.client.table(self.table).update({"touched_at": _iso(time.time())}, returning="minimal").in_("key", keys).execute()
+
+    def missing(self, keys):
+        response = self.client.table(self.table).select("key").in_("key", keys).execute()
+        present = {r["key"] for r in response.data or []}
+        return [key for key in keys if key not in present]
+
+    def put(self, key, data):
+        codec = key.rsplit(".", 1)[1]
+        self.client.table(self.table).upsert({
+            "key": key, "codec": codec, "stored_size": len(data), "data": base64.b64encode(data).decode("ascii")
+        }, on_conflict="key", ignore_duplicates=True).execute()
+
+    def get_many(self, keys):
+        response = self.client.table(self.table).select("key,data").in_("key", keys).execute()
+        return {r["key"]: base64.b64decode(r["data"]) for r in response.data or []}
+
+    def list_keys(self, older_than):
+        last_key = ""
+        while True:
+            response = self.client.table(self.table).select("key").lt("touched_at", _iso(older_than)) \
+                .gt("key", last_key).order("key").limit(1000).execute()
+            keys = [r["key"] for r in response.data or []]
+            if not keys:
+                return
+            yield from keys
+            last_key = keys[-1]
+
+    def delete(self, keys, older_than):
+        # Warunek na touched_at w tym samym zapytaniu - blob odświeżony po list_keys zostaje
+        self.client.table(self.table).delete(returning="minimal").in_("key", keys).lt("touched_at", _iso(older_than)).execute()
+
+# --- BACKEND: SUPABASE STORAGE ---
+class StorageBlobStore:
+    """
+    Bucket Supabase Storage (magazyn obiektów), ścieżki <2 znaki skrótu>/<klucz>. Storage nie ma
+    zbiorczego sprawdzania istnienia - zapis z upsert (ta sama treść pod tym samym kluczem), który
+    odświeża też updated_at, więc touch nie jest potrzebny.
+    """
+
+    def __init__(self, client, bucket="content-blobs"):
+        self.client = client
+        self.bucket = bucket
+
+    def _bucket(self):
+        return self.client.storage.from_(self.bucket)
+
+    def touch(self, keys):
+        pass
+
+    def missing(self, keys):
+        return list(keys)
+
+    @staticmethod
+    def _updated_at(item):
+        stamp = item.get("updated_at") or item.get("created_at")
+        return datetime.fromisoformat(stamp.replace("Z", "+00:00")).timestamp() if stamp else None
+
+    def put(self, key, data):
+        self._bucket().upload(f"{key[:2]}/{key}", data, {"content-type": "application/octet-stream", "upsert": "true"})
+
+    def get_many(self, keys):
+        blobs = {}
+        for key in keys:
+            try:
+                blobs[key] = self._bucket().download(f"{key[:2]}/{key}")
+            except Exception as e:
+                log.warning("Blob %s niedostępny w Storage: %s", key, e)
+        return blobs
+
+    def list_keys(self, older_than):
+        for prefix in (f"{i:02x}" for i in range(256)):
+            offset = 0
+            while True:
+                items = self._bucket().list(prefix, {"limit": 1000, "offset": offset}) or []
+                for item in items:
+                    updated = self._updated_at(item)
+                    if updated is not None and updated < older_than:
+                        yield item["name"]
+                if len(items) < 1000:
+                    break
+                offset += 1000
+
+    def delete(self, keys, older_than):
+        # Ponowne sprawdzenie wieku tuż przed usunięciem - blob zapisany po list_keys zostaje
+        stale = []
+        for key in keys:
+            items = self._bucket().list(key[:2], {"limit": 1, "search": key}) or []
+            updated = next((self._updated_at(i) for i in items if i.get("name") == key), None)
+            if updated is not None and updated < older_than:
+                stale.append(key)
+        if stale:
+            self._bucket().remove([f"{key[:2]}/{key}" for key in stale])
+
+# --- FABRYKA ---
+def build_backend(secrets, supabase_getter=None):
+    """Backend wg sekcji [blobs] w secrets: BACKEND = "off" (domyślnie) | "filesystem" | "supabase" | "storage"."""
+    blobs_cfg = secrets.get("blobs", {})
+    backend = blobs_cfg.get("BACKEND", "off")
+    if backend == "off":
+        return None
+    if backend == "filesystem":
+        return FilesystemBlobStore(blobs_cfg.get("ROOT", DEFAULT_ROOT))
+    if backend == "supabase":
+        return SupabaseBlobStore(supabase_getter(), blobs_cfg.get("TABLE", "seo_content_blobs"))
+    if backend == "storage":
+        return StorageBlobStore(supabase_getter(), blobs_cfg.get("BUCKET", "content-blobs"))
+    raise ValueError(f"Nieznany backend magazynu blobów: {backend}")
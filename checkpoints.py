@@ -0,0 +1,254 @@
+"""
+Rejestr przebiegów (batchy) z przeglądarki i CLI - wznawianie po awarii lub restarcie Streamlit.
+
+Każdy batch uruchomiony w sesji (run_batch_process, pipeline) albo przez factory.py zapisuje
+rekord przebiegu: etapy, id wierszy, argumenty etapów oraz heartbeat odświeżany w tle.
+Przebieg do wznowienia to taki, który przerwano (rerun, zamknięta karta, wyjątek), zatrzymano
+przyciskiem STOP albo którego heartbeat jest starszy niż stale_after_seconds (proces padł).
+Wiersze "🔄 W trakcie..." z takiego przebiegu nikt już nie przetwarza - wznowienie je powtarza.
+
+Częściowy artykuł zapisuje stage_writing w kolumnie writing_checkpoint (gotowe sekcje),
+więc wznowiona generacja pisze tylko brakujące sekcje.
+
+Zadania kolejki (worker.py) mają własne leasy w job_queue.py i nie są tu rejestrowane.
+
+Backendy:
+    SQLiteRunStore   - lokalny plik runs.sqlite (domyślnie)
+    SupabaseRunStore - tabela seo_runs (wspólna dla kilku instancji aplikacji, patrz README)
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone
+
+log = logging.getLogger("content_factory.checkpoints")
+
+RUN_RUNNING = 'running'
+RUN_FINISHED = 'finished'
+RUN_STOPPED = 'stopped'          # przycisk STOP - część wierszy nie wystartowała
+RUN_INTERRUPTED = 'interrupted'  # wyjątek / rerun Streamlit w trakcie batcha
+RUN_RESUMED = 'resumed'          # wznowiony (nowy przebieg ma resumed_from = ten run_id)
+RUN_DISMISSED = 'dismissed'      # operator zrezygnował ze wznowienia
+
+RESUMABLE_STATUSES = (RUN_STOPPED, RUN_INTERRUPTED)
+
+DEFAULT_SQLITE_PATH = "runs.sqlite"
+
+RUNS_SETTINGS = {
+    "heartbeat_seconds": 30,     # co ile odświeżany jest heartbeat przebiegu
+    "stale_after_seconds": 180   # heartbeat starszy niż to = proces padł
+}
+
+_backend = None
+
+def configure(backend=None, **settings):
+    global _backend
+    _backend = backend
+    RUNS_SETTINGS.update({k: v for k, v in settings.items() if v is not None})
+
+def enabled():
+    return _backend is not None
+
+def new_run_id():
+    return uuid.uuid4().hex[:12]
+
+def owner_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _safe(fn, *args):
+    # Rejestr przebiegów nie może zatrzymać batcha - błąd zapisu tylko w logu
+    try:
+        fn(*args)
+        return True
+    except Exception:
+        log.exception("Zapis rejestru przebiegów nie powiódł się")
+        return False
+
+class RunHandle:
+    """Uchwyt przebiegu w track_run: stopped=True przy STOP, stats trafiają do rekordu na końcu."""
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.stopped = False
+        self.stats = None
+
+def _heartbeat_loop(run_id, stop):
+    while not stop.wait(float(RUNS_SETTINGS["heartbeat_seconds"])):
+        _safe(_backend.heartbeat, run_id, time.time())
+
+@contextmanager
+def track_run(run_id, kind, stages, row_ids, stage_args=None, pause_after=(), resumed_from=None):
+    """Rekord przebiegu + heartbeat w tle. Wyjście przez wyjątek oznacza przebieg jako przerwany."""
+    handle = RunHandle(run_id)
+    now = time.time()
+    registered = _backend is not None and _safe(_backend.create, {
+        "run_id": run_id, "kind": kind, "stages": list(stages), "pause_after": list(pause_after or []),
+        "stage_args": stage_args or {}, "row_ids": [int(i) for i in row_ids], "status": RUN_RUNNING,
+        "owner": owner_id(), "heartbeat_at": now, "created_at": now, "resumed_from": resumed_from
+    })
+    stop = threading.Event()
+    if registered:
+        if resumed_from:
+            _safe(_backend.finish, resumed_from, RUN_RESUMED, None)
+        threading.Thread(target=_heartbeat_loop, args=(run_id, stop), name=f"run-heartbeat-{run_id}", daemon=True).start()
+    status = RUN_INTERRUPTED
+    try:
+        yield handle
+        status = RUN_STOPPED if handle.stopped else RUN_FINISHED
+    finally:
+        stop.set()
+        if registered:
+            _safe(_backend.finish, run_id, status, handle.stats)
+
+def is_stale(run, now=None):
+    now = now or time.time()
+    return run["status"] == RUN_RUNNING and run["heartbeat_at"] < now - float(RUNS_SETTINGS["stale_after_seconds"])
+
+def is_resumable(run, now=None):
+    return run["status"] in RESUMABLE_STATUSES or is_stale(run, now)
+
+def in_progress_abandoned(run, now=None):
+    """Czy wiersze "🔄 W trakcie..." przebiegu są porzucone: proces padł albo przebieg przerwano ponad stale_after_seconds temu."""
+    now = now or time.time()
+    if run["status"] == RUN_RUNNING:
+        return is_stale(run, now)
+    # Po przerwaniu sesji wiersze w toku kończą się jeszcze w tle (wątki puli nie są zabijane)
+    return (run.get("finished_at") or 0) < now - float(RUNS_SETTINGS["stale_after_seconds"])
+
+def list_runs(limit=20):
+    return _backend.list(limit) if _backend is not None else []
+
+def resumable_runs(limit=20):
+    now = time.time()
+    return [r for r in list_runs(limit) if is_resumable(r, now)]
+
+def dismiss(run_id):
+    if _backend is not None:
+        _safe(_backend.finish, run_id, RUN_DISMISSED, None)
+
+def get_run(run_id):
+    return _backend.get(run_id) if _backend is not None else None
+
+# --- SQLITE ---
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seo_runs (
+    run_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    stages TEXT NOT NULL,
+    pause_after TEXT,
+    stage_args TEXT,
+    row_ids TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT,
+    resumed_from TEXT,
+    stats TEXT,
+    heartbeat_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS seo_runs_created_idx ON seo_runs (created_at);
+"""
+
+JSON_FIELDS = ("stages", "pause_after", "stage_args", "row_ids", "stats")
+
+class SQLiteRunStore:
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SQLITE_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create(self, record):
+        record = {k: json.dumps(v, ensure_ascii=False) if k in JSON_FIELDS else v for k, v in record.items()}
+        with closing(self._connect()) as conn:
+            conn.execute(
+                f"INSERT INTO seo_runs ({', '.join(record)}) VALUES ({', '.join('?' for _ in record)})", list(record.values())
+            )
+
+    def heartbeat(self, run_id, ts):
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE seo_runs SET heartbeat_at = ? WHERE run_id = ? AND status = ?", (ts, run_id, RUN_RUNNING))
+
+    def finish(self, run_id, status, stats):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE seo_runs SET status = ?, stats = COALESCE(?, stats), finished_at = ? WHERE run_id = ?",
+                (status, json.dumps(stats, ensure_ascii=False) if stats else None, time.time(), run_id)
+            )
+
+    def _to_run(self, row):
+        run = dict(row)
+        for field in JSON_FIELDS:
+            run[field] = json.loads(run[field]) if run[field] else None
+        return run
+
+    def get(self, run_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM seo_runs WHERE run_id = ?", (run_id,)).fetchone()
+        return self._to_run(row) if row else None
+
+    def list(self, limit=20):
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT * FROM seo_runs ORDER BY created_at DESC LIMIT ?", (int(limit),)).fetchall()
+        return [self._to_run(r) for r in rows]
+
+# --- SUPABASE ---
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+def _epoch(value):
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+TIME_FIELDS = ("heartbeat_at", "created_at", "finished_at")
+
+class SupabaseRunStore:
+    def __init__(self, client, table="seo_runs"):
+        self.client = client
+        self.table = table
+
+    def create(self, record):
+        self.client.table(self.table).insert({k: _iso(v) if k in TIME_FIELDS else v for k, v in record.items()}).execute()
+
+    def heartbeat(self, run_id, ts):
+        self.client.table(self.table).update({"heartbeat_at": _iso(ts)}).eq("run_id", run_id).eq("status", RUN_RUNNING).execute()
+
+    def finish(self, run_id, status, stats):
+        updates = {"status": status, "finished_at": _iso(time.time())}
+        if stats:
+            updates["stats"] = stats
+        self.client.table(self.table).update(updates).eq("run_id", run_id).execute()
+
+    def _to_run(self, record):
+        return {**record, **{f: _epoch(record.get(f)) for f in TIME_FIELDS}}
+
+    def get(self, run_id):
+        response = self.client.table(self.table).select("*").eq("run_id", run_id).limit(1).execute()
+        return self._to_run(response.data[0]) if response.data else None
+
+    def list(self, limit=20):
+        response = self.client.table(self.table).select("*").order("created_at", desc=True).limit(limit).execute()
+        return [self._to_run(r) for r in response.data or []]
+
+# --- FABRYKA ---
+def build_backend(secrets, supabase_getter=None):
+    """Backend wg sekcji [runs] w secrets: BACKEND = "sqlite" (domyślnie) | "supabase" | "off"."""
+    runs_cfg = secrets.get("runs", {})
+    backend = runs_cfg.get("BACKEND", "sqlite")
+    if backend == "off":
+        return None
+    if backend == "sqlite":
+        return SQLiteRunStore(runs_cfg.get("SQLITE_PATH", DEFAULT_SQLITE_PATH))
+    if backend == "supabase":
+        return SupabaseRunStore(supabase_getter(), runs_cfg.get("TABLE", "seo_runs"))
+    raise ValueError(f"Nieznany backend rejestru przebiegów: {backend}")
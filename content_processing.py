@@ -0,0 +1,323 @@
+"""
+Przetwarzanie HTML artykułów: nagłówki, składanie artykułu i przygotowanie treści do WordPressa.
+
+- extract_headings(): nagłówki H2/H3 jednym prekompilowanym wyrażeniem (bez drugiego regexu na każdy nagłówek),
+- ArticleBuilder: artykuł składany z sekcji w liście zamiast doklejania do rosnącego napisu,
+- prepare_for_publication(): jeden przebieg tokenizera - kotwice id w nagłówkach, sanityzacja
+  (skrypty, style, atrybuty on*, javascript:, komentarze, bloki ``` z odpowiedzi LLM), minifikacja
+  białych znaków poza <pre>/<textarea> (puste linie zostają - to akapity dla wpautop) - oraz spis treści
+  wstawiany przed pierwszym H2.
+
+Moduł nie zależy od Streamlit ani sieci - można go puścić po całym archiwum artykułów.
+Ustawienia (configure) ładuje pipeline.configure() z sekcji [content] w secrets.
+Mikro-benchmark: python benchmark.py --content-kb 100,300,800
+"""
+import re
+import html
+import unicodedata
+from functools import lru_cache
+from collections import namedtuple
+
+CONTENT_SETTINGS = {
+    "anchors": True,           # id w nagłówkach H2/H3 (istniejące id zostają)
+    "toc": True,               # spis treści przed pierwszym H2
+    "toc_min_headings": 3,     # mniej H2 = bez spisu treści
+    "toc_title": None,         # None = wg języka wiersza (TOC_TITLES), "" = bez tytułu
+    "sanitize": True,
+    "minify": True
+}
+
+TOC_TITLES = {
+    "pl": "Spis treści", "en": "Table of contents", "de": "Inhaltsverzeichnis", "cs": "Obsah", "sk": "Obsah",
+    "fr": "Sommaire", "es": "Índice", "it": "Indice", "uk": "Зміст"
+}
+
+HEADING_LEVELS = ("h2", "h3")
+
+# Tagi usuwane razem z zawartością i tagi "rozpakowywane" (pełny dokument HTML z odpowiedzi LLM)
+DROP_WITH_CONTENT = {"script", "style", "noscript", "object", "embed", "head", "template"}
+UNWRAP = {"html", "body"}
+PRESERVE_WHITESPACE = {"pre", "textarea", "code"}
+# Zawartość bez tokenizowania (także gdy sanityzacja jest wyłączona) - koniec szukany wprost
+RAW_TEXT_END = {tag: re.compile(rf"</{tag}\s*>", re.I) for tag in ("script", "style")}
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "aside", "header", "footer", "nav", "h1", "h2", "h3", "h4", "h5", "h6",
+    "ul", "ol", "li", "dl", "dt", "dd", "table", "thead", "tbody", "tfoot", "tr", "td", "th", "caption",
+    "blockquote", "figure", "figcaption", "hr", "br", "pre"
+}
+
+# Jeden przebieg: komentarz | deklaracja (<!DOCTYPE>) | tag (otwierający/zamykający, atrybuty w cudzysłowach mogą zawierać ">")
+TOKEN_RE = re.compile(
+    r'<!--.*?-->|<![^>]*>|<(/?)([a-zA-Z][a-zA-Z0-9-]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>',
+    re.S
+)
+TAG_RE = re.compile(r'<[^>]+>')
+WS_RE = re.compile(r'\s+')
+# Minifikacja: tylko ciągi >= 2 białych znaków albo pojedynczy znak inny niż spacja (zwykłe spacje bez wywołań)
+MINIFY_RE = re.compile(r'\s{2,}|[^\S ]')
+ATTR_RE = re.compile(r'([^\s=/"\'>]+)(?:\s*=\s*("[^"]*"|\'[^\']*\'|[^\s"\'>]+))?')
+ID_ATTR_RE = re.compile(r'\bid\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+))', re.I)
+FENCE_RE = re.compile(r'^[ \t]*```[a-zA-Z]*[ \t]*$\n?', re.M)
+SLUG_RE = re.compile(r'[^a-z0-9]+')
+UNSAFE_ATTRS_HINT = re.compile(r'\bon[a-z]|javascript:|vbscript:|data:text/html', re.I)
+UNSAFE_URL_RE = re.compile(r'^\s*(?:javascript|vbscript|data\s*:\s*text/html)', re.I)
+URL_ATTRS = {"href", "src", "action", "formaction", "xlink:href"}
+
+_TRANSLIT = str.maketrans({"ł": "l", "Ł": "L", "ß": "ss", "æ": "ae", "Æ": "AE", "ø": "o", "Ø": "O", "đ": "d", "Đ": "D"})
+
+Heading = namedtuple("Heading", "level text id")
+
+def configure(**settings):
+    CONTENT_SETTINGS.update({k: v for k, v in settings.items() if v is not None})
+
+# --- NAGŁÓWKI ---
+def _id_attr(attrs):
+    match = ID_ATTR_RE.search(attrs or "")
+    return next((g for g in match.groups() if g is not None), None) if match else None
+
+@lru_cache(maxsize=None)
+def _heading_re(levels):
+    return re.compile(r'<(%s)\b([^>]*)>(.*?)</\1\s*>' % "|".join(levels), re.S | re.I)
+
+def extract_headings(text, levels=HEADING_LEVELS):
+    """Nagłówki [Heading(poziom, tekst, id)] w kolejności z dokumentu; tekst bez zagnieżdżonych tagów."""
+    if not isinstance(text, str) or "<" not in text:
+        return []
+    headings = []
+    for tag, attrs, inner in _heading_re(tuple(levels)).findall(text):
+        text_only = TAG_RE.sub("", inner) if "<" in inner else inner
+        headings.append(Heading(int(tag[1]), text_only.strip(), _id_attr(attrs) if attrs else None))
+    return headings
+
+def extract_headers(text):
+    """Plan artykułu z "Nagłówki (Finalne)": teksty H2, a gdy ich brak - niepuste linie."""
+    if not isinstance(text, str):
+        return []
+    headers = [h.text for h in extract_headings(text, ("h2",))]
+    if headers:
+        return headers
+    return [line.strip() for line in text.split('\n') if line.strip()]
+
+def plain_text(fragment):
+    """Tekst bez tagów, z pojedynczymi spacjami."""
+    return WS_RE.sub(" ", TAG_RE.sub(" ", fragment or "")).strip()
+
+def slugify(text):
+    """Identyfikator kotwicy: ASCII, małe litery, myślniki (ą -> a, ł -> l)."""
+    text = unicodedata.normalize("NFKD", html.unescape(plain_text(text)).translate(_TRANSLIT))
+    return SLUG_RE.sub("-", text.encode("ascii", "ignore").decode("ascii").lower()).strip("-") or "sekcja"
+
+# --- SKŁADANIE ARTYKUŁU ---
+class ArticleBuilder:
+    """
+    Sekcje artykułu w liście (sekcje równoległe trafiają na swoje miejsce w dowolnej kolejności).
+    html() łączy sekcje jednym join i zapamiętuje wynik do następnej zmiany.
+    """
+
+    def __init__(self, size=0):
+        self._parts = [""] * size
+        self._html = None
+
+    def __len__(self):
+        return len(self._parts)
+
+    def __getitem__(self, i):
+        return self._parts[i]
+
+    def __setitem__(self, i, section_html):
+        self._parts[i] = section_html
+        self._html = None
+
+    def append(self, section_html):
+        self._parts.append(section_html)
+        self._html = None
+
+    def html(self, upto=None):
+        """Cały artykuł albo pierwsze `upto` sekcji (kontekst "done" w trybie sekwencyjnym)."""
+        if upto is not None:
+            return "".join(self._parts[:upto])
+        if self._html is None:
+            self._html = "".join(self._parts)
+        return self._html
+
+# --- PRZYGOTOWANIE DO PUBLIKACJI ---
+def _collapse_ws(match):
+    # Pusta linia zostaje - wpautop w WordPressie robi z niej granicę akapitu
+    newlines = match.group(0).count("\n")
+    return "\n\n" if newlines > 1 else "\n" if newlines else " "
+
+def _clean_attrs(attrs, report):
+    # Szybka ścieżka: atrybuty bez on*/javascript: zostają bajt w bajt
+    if not attrs or not UNSAFE_ATTRS_HINT.search(attrs):
+        return attrs
+    kept = []
+    for name, value in ATTR_RE.findall(attrs):
+        lowered = name.lower()
+        if lowered.startswith("on") or (lowered in URL_ATTRS and UNSAFE_URL_RE.match(value.strip("\"'"))):
+            report["removed_attributes"] += 1
+            continue
+        kept.append(f"{name}={value}" if value else name)
+    return (" " + " ".join(kept)) if kept else ""
+
+def _with_id(tag, attrs, heading_id):
+    return f"<{tag}{attrs} id=\"{heading_id}\">"
+
+def build_toc(headings, title=""):
+    """Spis treści <nav class="toc"> z H2 i zagnieżdżonymi H3 (nagłówki muszą mieć id)."""
+    out = ['<nav class="toc">']
+    if title:
+        out.append(f'<p class="toc-title">{html.escape(title)}</p>')
+    out.append("<ol>")
+    open_item = in_sub = False
+    for h in headings:
+        link = f'<a href="#{h.id}">{h.text}</a>'
+        if h.level <= 2:
+            if in_sub:
+                out.append("</ol>")
+                in_sub = False
+            if open_item:
+                out.append("</li>")
+            out.append(f"<li>{link}")
+            open_item = True
+        else:
+            if not in_sub:
+                if not open_item:
+                    out.append("<li>")
+                    open_item = True
+                out.append("<ol>")
+                in_sub = True
+            out.append(f"<li>{link}</li>")
+    if in_sub:
+        out.append("</ol>")
+    if open_item:
+        out.append("</li>")
+    out.append("</ol></nav>")
+    return "".join(out)
+
+def prepare_for_publication(article_html, language=None, **options):
+    """
+    HTML artykułu gotowy do wysłania do WordPressa. Jeden przebieg tokenizera (kotwice, sanityzacja,
+    minifikacja) + spis treści. Opcje jak w CONTENT_SETTINGS (domyślnie z CONTENT_SETTINGS).
+    Zwraca (html, raport).
+    """
+    cfg = {**CONTENT_SETTINGS, **{k: v for k, v in options.items() if v is not None}}
+    anchors, sanitize, minify = cfg["anchors"] or cfg["toc"], cfg["sanitize"], cfg["minify"]
+    report = {"bytes_in": len(article_html or ""), "headings": 0, "toc": False,
+              "removed_tags": 0, "removed_attributes": 0, "removed_comments": 0}
+    source = article_html or ""
+    if sanitize and "```" in source:
+        source = FENCE_RE.sub("", source)
+
+    out = []
+    headings = []
+    used_ids = set()
+    heading = None        # (tag, indeks tagu otwierającego w out, atrybuty, fragmenty tekstu)
+    first_h2 = None
+    skip_tag, skip_depth = None, 0
+    preserve = 0
+    after_block = True    # minifikacja: białe znaki tuż po tagu blokowym są zbędne
+    pos = 0
+
+    def emit_text(text):
+        nonlocal after_block
+        if heading is not None:
+            heading[3].append(text)
+        if minify and not preserve:
+            text = MINIFY_RE.sub(_collapse_ws, text)
+            if after_block:
+                text = text.lstrip()
+            if not text:
+                return
+        out.append(text)
+        after_block = False
+
+    while True:
+        match = TOKEN_RE.search(source, pos)
+        start = match.start() if match else len(source)
+        if skip_tag is None and start > pos:
+            emit_text(source[pos:start])
+        if match is None:
+            break
+        pos = match.end()
+        tag = match.group(2)
+
+        if tag is None:
+            # Komentarz albo <!DOCTYPE>
+            if skip_tag is None:
+                if sanitize or minify:
+                    report["removed_comments"] += 1
+                else:
+                    out.append(match.group(0))
+            continue
+        tag = tag.lower()
+        closing = bool(match.group(1))
+
+        if skip_tag is not None:
+            if tag == skip_tag:
+                skip_depth += -1 if closing else 1
+                if skip_depth == 0:
+                    skip_tag = None
+            continue
+        if tag in RAW_TEXT_END and not closing:
+            end = RAW_TEXT_END[tag].search(source, pos)
+            pos = end.end() if end else len(source)
+            if sanitize:
+                report["removed_tags"] += 1
+            else:
+                out.append(source[start:pos])
+                after_block = False
+            continue
+        if sanitize and tag in DROP_WITH_CONTENT:
+            report["removed_tags"] += 1
+            if not closing and not match.group(3).rstrip().endswith("/"):
+                skip_tag, skip_depth = tag, 1
+            continue
+        if sanitize and tag in UNWRAP:
+            continue
+
+        attrs = _clean_attrs(match.group(3), report) if sanitize else match.group(3)
+        if minify and tag in BLOCK_TAGS:
+            # Białe znaki przed tagiem blokowym też są zbędne
+            if out and not preserve and out[-1] and out[-1][-1].isspace():
+                out[-1] = out[-1].rstrip()
+            after_block = True
+        else:
+            after_block = False
+        if tag in PRESERVE_WHITESPACE:
+            preserve = max(0, preserve + (-1 if closing else 1))
+
+        if tag in HEADING_LEVELS and anchors:
+            if not closing and heading is None:
+                heading = (tag, len(out), attrs, [])
+                if tag == "h2" and first_h2 is None:
+                    first_h2 = len(out)
+            elif closing and heading is not None and tag == heading[0]:
+                h_tag, index, h_attrs, parts = heading
+                text = plain_text("".join(parts))
+                heading_id = _id_attr(h_attrs)
+                if heading_id is None:
+                    base = slugify(text)
+                    heading_id, n = base, 2
+                    while heading_id in used_ids:
+                        heading_id, n = f"{base}-{n}", n + 1
+                    out[index] = _with_id(h_tag, h_attrs, heading_id)
+                used_ids.add(heading_id)
+                headings.append(Heading(int(h_tag[1]), text, heading_id))
+                heading = None
+                out.append(match.group(0))
+                continue
+        out.append(f"<{'/' if closing else ''}{match.group(2)}{attrs}>" if attrs != match.group(3) else match.group(0))
+
+    if minify and out:
+        out[-1] = out[-1].rstrip()
+
+    report["headings"] = len(headings)
+    if cfg["toc"] and first_h2 is not None and sum(1 for h in headings if h.level == 2) >= int(cfg["toc_min_headings"]):
+        title = cfg["toc_title"] if cfg["toc_title"] is not None else TOC_TITLES.get((language or "").lower()[:2], "")
+        # Spis treści zaczyna się od pierwszego H2 (H3 przed nim nie mają rodzica)
+        first = next(i for i, h in enumerate(headings) if h.level == 2)
+        out.insert(first_h2, build_toc(headings[first:], title) + ("" if minify else "\n"))
+        report["toc"] = True
+    result = "".join(out)
+    report["bytes_out"] = len(result)
+    return result, report
@@ -0,0 +1,266 @@
+"""
+Cache wyników workflow Dify adresowany treścią.
+
+Klucz = hash(identyfikator klucza API workflow, znormalizowane wejścia), więc ten sam
+research dla tego samego słowa/języka (np. ponowne kliknięcie albo duplikat słowa
+w innym projekcie) nie płaci drugi raz za wywołanie LLM.
+
+- TTL per etap (research starzeje się szybciej niż RAG), 0 = etap bez cache,
+- limit liczby wpisów z usuwaniem najdawniej używanych (LRU),
+- backend: lokalny SQLite albo tabela seo_dify_cache w Supabase,
+- batch_scope(force_refresh=...) - wymuszenie odświeżenia i liczniki trafień dla batcha.
+"""
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+import contextvars
+from contextlib import closing, contextmanager
+from datetime import datetime, timedelta, timezone
+
+log = logging.getLogger("content_factory.cache")
+
+# Domyślny TTL w godzinach. Generacja sekcji domyślnie bez cache - ponowne "Generuj" ma dać nowy tekst.
+DEFAULT_TTL_HOURS = {
+    'research': 72,
+    'headers': 24 * 14,
+    'rag': 24 * 30,
+    'brief': 24 * 14,
+    'writing': 0
+}
+
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_SQLITE_PATH = "dify_cache.sqlite"
+EVICT_EVERY_N_SETS = 50
+
+CACHE_SETTINGS = {
+    "ttl_hours": dict(DEFAULT_TTL_HOURS)
+}
+
+_backend = None
+
+def configure(backend=None, ttl_hours=None):
+    global _backend
+    _backend = backend
+    CACHE_SETTINGS["ttl_hours"] = {**DEFAULT_TTL_HOURS, **(ttl_hours or {})}
+
+def _normalize(value):
+    if value is None or (isinstance(value, float) and value != value):  # None / NaN z pandas
+        return ""
+    if isinstance(value, str):
+        # Tylko brzegi i końce linii - spacje i nowe linie w środku (np. w briefie) zmieniają wynik workflow
+        return value.replace("\r\n", "\n").strip()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+def normalize_inputs(inputs):
+    normalized = _normalize(dict(inputs))
+    for field in ("keyword", "language"):
+        if isinstance(normalized.get(field), str):
+            normalized[field] = normalized[field].lower()
+    return normalized
+
+def cache_key(api_key, inputs):
+    # Sam klucz API nie trafia do cache - tylko jego skrót identyfikujący workflow
+    key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    payload = json.dumps({"workflow": key_id, "inputs": normalize_inputs(inputs)}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# --- ZAKRES BATCHA ---
+class CacheScope:
+    def __init__(self, force_refresh=False):
+        self.force_refresh = force_refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def summary(self):
+        return f"Cache: trafienia {self.hits}, chybienia {self.misses}" + (" (wymuszone odświeżenie)" if self.force_refresh else "")
+
+_scope = contextvars.ContextVar("dify_cache_scope", default=None)
+
+@contextmanager
+def batch_scope(force_refresh=False):
+    """Zakres batcha. Wątki puli dziedziczą go, jeśli zadania są zlecane przez contextvars.copy_context().run."""
+    scope = CacheScope(force_refresh)
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+def force_refresh_requested():
+    """Czy bieżący batch wymusza odświeżenie (wtedy pomijane są też zapisane sekcje przerwanej generacji)."""
+    scope = _scope.get()
+    return bool(scope and scope.force_refresh)
+
+def cached_call(stage, api_key, inputs, call):
+    """Zwraca wynik z cache albo wywołuje call() i zapamiętuje poprawny wynik (z data.outputs)."""
+    ttl_hours = CACHE_SETTINGS["ttl_hours"].get(stage, 0)
+    if _backend is None or not ttl_hours:
+        return call()
+
+    scope = _scope.get()
+    key = cache_key(api_key, inputs)
+    if not (scope and scope.force_refresh):
+        try:
+            cached = _backend.get(key)
+        except Exception:
+            log.exception("Odczyt cache nie powiódł się")
+            cached = None
+        if cached is not None:
+            if scope: scope.count(True)
+            cached["metrics"] = {"cache": "hit"}
+            return cached
+
+    result = call()
+    if scope: scope.count(False)
+    if "data" in result and result["data"].get("outputs") is not None:
+        try:
+            _backend.set(key, stage, {k: v for k, v in result.items() if k != "metrics"}, ttl_hours * 3600)
+        except Exception:
+            log.exception("Zapis do cache nie powiódł się")
+    return result
+
+# --- BACKEND: SQLITE ---
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dify_cache (
+    key TEXT PRIMARY KEY,
+    stage TEXT,
+    value TEXT NOT NULL,
+    size INTEGER,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dify_cache_lru_idx ON dify_cache (last_access);
+"""
+
+class SQLiteCacheBackend:
+    def __init__(self, path=DEFAULT_SQLITE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._sets = 0
+        self._lock = threading.Lock()
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SQLITE_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def get(self, key):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value, expires_at FROM dify_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                conn.execute("DELETE FROM dify_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE dify_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, stage, value, ttl_seconds):
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO dify_cache (key, stage, value, size, created_at, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, stage, data, len(data), now, now + ttl_seconds, now)
+            )
+        with self._lock:
+            self._sets += 1
+            evict = self._sets % EVICT_EVERY_N_SETS == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM dify_cache WHERE expires_at < ?", (time.time(),))
+            conn.execute(
+                "DELETE FROM dify_cache WHERE key IN (SELECT key FROM dify_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM dify_cache")
+
+# --- BACKEND: SUPABASE ---
+def _utc_iso(seconds_from_now=0):
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds_from_now)).isoformat()
+
+class SupabaseCacheBackend:
+    def __init__(self, client, table="seo_dify_cache", max_entries=DEFAULT_MAX_ENTRIES):
+        self.client = client
+        self.table = table
+        self.max_entries = max_entries
+        self._sets = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        response = self.client.table(self.table).select("value,expires_at").eq("key", key).limit(1).execute()
+        if not response.data:
+            return None
+        record = response.data[0]
+        if datetime.fromisoformat(record["expires_at"]) < datetime.now(timezone.utc):
+            self.client.table(self.table).delete().eq("key", key).execute()
+            return None
+        self.client.table(self.table).update({"last_access": _utc_iso()}).eq("key", key).execute()
+        return record["value"]
+
+    def set(self, key, stage, value, ttl_seconds):
+        self.client.table(self.table).upsert({
+            "key": key, "stage": stage, "value": value,
+            "size": len(json.dumps(value, ensure_ascii=False)),
+            "expires_at": _utc_iso(ttl_seconds), "last_access": _utc_iso()
+        }).execute()
+        with self._lock:
+            self._sets += 1
+            evict = self._sets % EVICT_EVERY_N_SETS == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        self.client.table(self.table).delete().lt("expires_at", _utc_iso()).execute()
+        while True:
+            response = self.client.table(self.table).select("key").order("last_access", desc=True) \
+                .range(self.max_entries, self.max_entries + 499).execute()
+            keys = [r["key"] for r in response.data or []]
+            if not keys:
+                break
+            self.client.table(self.table).delete().in_("key", keys).execute()
+
+    def clear(self):
+        self.client.table(self.table).delete().neq("key", "").execute()
+
+# --- FABRYKA ---
+def build_backend(secrets, supabase_getter=None):
+    """Backend wg sekcji [cache] w secrets: BACKEND = "sqlite" (domyślnie) | "supabase" | "off"."""
+    cache_cfg = secrets.get("cache", {})
+    backend = cache_cfg.get("BACKEND", "sqlite")
+    max_entries = int(cache_cfg.get("MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+    if backend == "off":
+        return None
+    if backend == "sqlite":
+        return SQLiteCacheBackend(cache_cfg.get("SQLITE_PATH", DEFAULT_SQLITE_PATH), max_entries)
+    if backend == "supabase":
+        return SupabaseCacheBackend(supabase_getter(), cache_cfg.get("TABLE", "seo_dify_cache"), max_entries)
+    raise ValueError(f"Nieznany backend cache: {backend}")
+
+def ttl_from_secrets(secrets):
+    cache_cfg = secrets.get("cache", {})
+    return {stage: float(cache_cfg[f"TTL_HOURS_{stage.upper()}"]) for stage in DEFAULT_TTL_HOURS if f"TTL_HOURS_{stage.upper()}" in cache_cfg}
@@ -0,0 +1,114 @@
+"""
+Klient Dify (POST /workflows/run) przez wspólną pulę połączeń http_client.request_with_retry.
+
+Funkcje nie rzucają wyjątków: błąd zwracają jako {"error": "..."}. Wyjątek: upstreams.CircuitOpenError
+(bezpiecznik workflow otwarty) - wywołujący wstrzymuje wtedy wiersz zamiast oznaczać go błędem.
+
+Tryb "streaming" (SSE) zwraca wynik w tym samym kształcie co "blocking", ale zdarzenia
+workflow/węzłów trafiają na bieżąco do callbacku on_event, a timeout odczytu liczy się
+między zdarzeniami (Dify wysyła ping), a nie dla całego workflow.
+"""
+import json
+import time
+import hashlib
+
+import http_client
+import upstreams
+
+DIFY_SETTINGS = {
+    "base_url": None,
+    "read_timeout": 450,         # s - workflow w trybie blocking potrafi trwać kilka minut
+    "retry_read_timeout": False, # ponowienie po timeoucie odczytu = ponowny koszt LLM
+    "response_mode": "blocking"  # "blocking" | "streaming"
+}
+
+RESPONSE_MODES = ("blocking", "streaming")
+
+def configure(**settings):
+    DIFY_SETTINGS.update({k: v for k, v in settings.items() if v is not None})
+
+def _parse_sse_event(line):
+    """Jedna linia SSE -> słownik zdarzenia albo None (pingi, komentarze, puste linie)."""
+    if not line or not line.startswith("data:"):
+        return None
+    try:
+        return json.loads(line[5:].strip())
+    except ValueError:
+        return None
+
+def _consume_stream(response, on_event, metrics, started):
+    result = None
+    response.encoding = response.encoding or "utf-8"
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        event = _parse_sse_event(line)
+        if event is None:
+            continue
+        if metrics["first_event_s"] is None:
+            metrics["first_event_s"] = round(time.perf_counter() - started, 3)
+        metrics["events"] += 1
+        name = event.get("event")
+        if on_event:
+            try:
+                on_event(name, event.get("data") or {})
+            except Exception:
+                pass  # błąd w podglądzie postępu nie może przerwać workflow
+        if name == "workflow_finished":
+            result = event
+        elif name == "error":
+            return {"error": event.get("message") or "Błąd strumienia Dify"}
+
+    if result is None:
+        return {"error": "Strumień Dify zakończył się bez zdarzenia workflow_finished."}
+    data = result.get("data") or {}
+    if data.get("status") not in (None, "succeeded"):
+        return {"error": data.get("error") or f"Workflow zakończony ze statusem: {data.get('status')}"}
+    return {"workflow_run_id": result.get("workflow_run_id"), "task_id": result.get("task_id"), "data": data}
+
+def workflow_upstream(api_key):
+    """Domyślna nazwa upstreamu workflow - skrót klucza (sam klucz nie trafia do logów i metryk)."""
+    return f"dify:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]}"
+
+def run_dify_workflow(api_key, inputs, user_id="streamlit_user", response_mode=None, on_event=None, upstream=None):
+    """
+    Uruchamia workflow Dify.
+
+    Args:
+        response_mode (str): "blocking" lub "streaming" (domyślnie DIFY_SETTINGS["response_mode"])
+        on_event (callable): on_event(nazwa_zdarzenia, dane) - tylko w trybie streaming
+        upstream (str): Nazwa upstreamu w upstreams.py, np. "dify:research" (domyślnie skrót klucza).
+            Slot limitu równoległości obejmuje całe wywołanie razem ze strumieniem.
+
+    Wynik zawiera też "metrics": ttfb_s (nagłówki odpowiedzi), first_event_s, total_s, events.
+    """
+    response_mode = response_mode or DIFY_SETTINGS["response_mode"]
+    url = f"{DIFY_SETTINGS['base_url']}/workflows/run"
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "inputs": inputs,
+        "response_mode": response_mode,
+        "user": user_id
+    }
+    metrics = {"response_mode": response_mode, "ttfb_s": None, "first_event_s": None, "total_s": None, "events": 0}
+    guard = upstreams.get(upstream or workflow_upstream(api_key))
+    started = time.perf_counter()
+    try:
+        streaming = response_mode == "streaming"
+        with guard.slot():
+            response = http_client.request_with_retry(
+                "POST", url, headers=headers, json=payload, stream=streaming, upstream=guard,
+                read_timeout=DIFY_SETTINGS["read_timeout"], retry_read_timeout=DIFY_SETTINGS["retry_read_timeout"]
+            )
+            metrics["ttfb_s"] = round(time.perf_counter() - started, 3)
+            with response:
+                response.raise_for_status()
+                result = _consume_stream(response, on_event, metrics, started) if streaming else response.json()
+    except upstreams.CircuitOpenError:
+        raise
+    except Exception as e:
+        result = {"error": str(e)}
+    metrics["total_s"] = round(time.perf_counter() - started, 3)
+    result["metrics"] = metrics
+    return result
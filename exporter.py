@@ -0,0 +1,97 @@
+"""
+Eksport seo_content_tasks strumieniowo - bez budowania pełnego DataFrame i bez zależności od Streamlit.
+
+Tabela jest pobierana stronami (keyset po id, iter_record_pages), a każda strona od razu trafia
+do pliku wyjściowego, więc pamięć procesu zależy od rozmiaru strony, nie tabeli:
+- XLSX: xlsxwriter w trybie constant_memory (wiersze zapisywane na dysk po kolei),
+- CSV (UTF-8 z BOM, otwiera się poprawnie w Excelu) i JSON Lines.
+"""
+import csv
+import json
+
+from pipeline import COLUMN_MAP, iter_record_pages
+
+EXPORT_FORMATS = {
+    'xlsx': 'Excel (XLSX)',
+    'csv': 'CSV',
+    'jsonl': 'JSON Lines'
+}
+
+EXPORT_MIME = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson'
+}
+
+DEFAULT_PAGE_SIZE = 200
+# Limit długości komórki w Excelu - dłuższe teksty (np. artykuły) są przycinane
+XLSX_MAX_CELL_CHARS = 32767
+
+class _XlsxSink:
+    def __init__(self, path, headers):
+        import xlsxwriter
+        self.workbook = xlsxwriter.Workbook(path, {
+            'constant_memory': True, 'strings_to_urls': False, 'strings_to_formulas': False
+        })
+        self.sheet = self.workbook.add_worksheet('SEO Content')
+        self.sheet.write_row(0, 0, headers)
+        self.row = 1
+        self.truncated = 0
+
+    def write(self, values):
+        for col, value in enumerate(values):
+            if isinstance(value, str) and len(value) > XLSX_MAX_CELL_CHARS:
+                value = value[:XLSX_MAX_CELL_CHARS]
+                self.truncated += 1
+            self.sheet.write(self.row, col, value)
+        self.row += 1
+
+    def close(self):
+        self.workbook.close()
+
+class _CsvSink:
+    def __init__(self, path, headers):
+        self.file = open(path, 'w', encoding='utf-8-sig', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(headers)
+        self.truncated = 0
+
+    def write(self, values):
+        self.writer.writerow(["" if v is None else v for v in values])
+
+    def close(self):
+        self.file.close()
+
+class _JsonlSink:
+    def __init__(self, path, headers):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.headers = headers
+        self.truncated = 0
+
+    def write(self, values):
+        self.file.write(json.dumps(dict(zip(self.headers, values)), ensure_ascii=False, default=str) + "\n")
+
+    def close(self):
+        self.file.close()
+
+SINKS = {'xlsx': _XlsxSink, 'csv': _CsvSink, 'jsonl': _JsonlSink}
+
+def export_table(path, fmt='xlsx', columns=None, filters=None, page_size=DEFAULT_PAGE_SIZE, on_progress=None):
+    """
+    Zapisuje wiersze (najnowsze pierwsze) do pliku `path`. columns - kolumny z bazy (domyślnie wszystkie
+    z COLUMN_MAP), filters - {kolumna_db: fragment} jak w siatce. on_progress(liczba_wierszy) po każdej stronie.
+    Zwraca (liczba wierszy, liczba przyciętych komórek XLSX).
+    """
+    columns = [c for c in (columns or COLUMN_MAP) if c in COLUMN_MAP]
+    sink = SINKS[fmt](path, [COLUMN_MAP[c] for c in columns])
+    count = 0
+    try:
+        for records in iter_record_pages(",".join(columns), page_size=page_size, filters=filters):
+            for record in records:
+                sink.write([record.get(c) for c in columns])
+            count += len(records)
+            if on_progress:
+                on_progress(count)
+    finally:
+        sink.close()
+    return count, sink.truncated
@@ -0,0 +1,308 @@
+"""
+CLI Content Factory - uruchamianie etapów bez Streamlit i bez przeglądarki (cron, CI, kontenery).
+
+Korzysta z tego samego silnika co UI (pipeline.py). Konfiguracja: .streamlit/secrets.toml
+(--secrets) i/lub zmienne środowiskowe CF_<SEKCJA>__<KLUCZ>, np. CF_SUPABASE__URL,
+CF_DIFY__API_KEY_RESEARCH. Import modułów nie łączy się z niczym - połączenie z Supabase
+powstaje dopiero przy pierwszym zapytaniu.
+
+Przykłady:
+    python factory.py run --stage research --ids 1-500 --workers 8
+    python factory.py run --stage research,headers,rag,brief,writing --pending --limit 200 --pause-after headers
+    python factory.py run --stage writing --ids 10-40 --writing-mode parallel --wave-size 4
+    python factory.py run --stage publication --ids 10-40 --wp-site klient-a
+    python factory.py run --stage research,headers --pending --queue   # zadania dla worker.py
+    python factory.py run --stage writing --pending --class bulk --operator backfill
+    python factory.py status --ids 1-500
+    python factory.py compact --gc           # ciężkie kolumny do magazynu blobów ([blobs])
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+from collections import Counter
+
+import job_queue
+import metrics
+import dify_cache
+import checkpoints
+import blob_store
+import scheduler
+from pipeline import (
+    STAGES, PIPELINE_ORDER, WRITING_MODES, COLUMN_MAP, DEFAULT_SECRETS_PATH, QUEUED_STATUS, IN_PROGRESS_STATUS,
+    configure, load_config, stage_args_reference, with_wp_credentials, fetch_rows, iter_record_pages, mark_stages_status, root_stages, is_done_status,
+    tracked_run, resume_plan, PipelineRunner, compact_rows, collect_blob_garbage
+)
+
+log = logging.getLogger("content_factory.cli")
+
+def parse_ids(text):
+    """ "1-500,700,710-712" -> [1, ..., 500, 700, 710, 711, 712] (bez duplikatów, w kolejności)."""
+    ids = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = (int(p) for p in part.split("-", 1))
+            if end < start:
+                raise ValueError(f"Pusty zakres id: {part}")
+            ids.extend(range(start, end + 1))
+        else:
+            ids.append(int(part))
+    return list(dict.fromkeys(ids))
+
+def parse_stages(text):
+    stages = [s.strip() for s in text.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        raise ValueError(f"Nieznane etapy: {', '.join(unknown)}")
+    return [s for s in PIPELINE_ORDER if s in stages]
+
+def pending_ids(stage, limit=None):
+    """Id wierszy, w których etap nie jest gotowy ani w trakcie (lekkie zapytanie: id + kolumna statusu)."""
+    status_col = STAGES[stage]['status_col']
+    ids = []
+    for records in iter_record_pages(columns=f"id,{status_col}", page_size=1000):
+        for record in records:
+            status = record.get(status_col) or ""
+            if not is_done_status(status) and status != IN_PROGRESS_STATUS:
+                ids.append(record["id"])
+        if limit and len(ids) >= limit:
+            break
+    # Z limitem - najnowsze wiersze (jak w siatce UI), przetwarzane rosnąco po id
+    return sorted(ids[:limit] if limit else ids)
+
+def build_stage_args(args, stages):
+    stage_args = {}
+    if "writing" in stages:
+        stage_args["writing"] = {"mode": args.writing_mode, "wave_size": args.wave_size}
+    if "publication" in stages:
+        stage_args["publication"] = {
+            "site": args.wp_site, "url": args.wp_url, "user": args.wp_user,
+            "key": args.wp_key or os.environ.get("CF_WP_KEY")
+        }
+    return stage_args
+
+def cmd_run(args):
+    stages, pause_after = args.stages, args.pause_stages
+    if args.row_ids is not None:
+        ids = args.row_ids[:args.limit] if args.limit else args.row_ids
+    else:
+        ids = pending_ids(stages[0], args.limit)
+    if not ids:
+        log.info("Brak wierszy do przetworzenia.")
+        return 0
+    stage_args = build_stage_args(args, stages)
+
+    if args.queue:
+        store = job_queue.get_job_store(args.secrets_dict)
+        batch_id = job_queue.new_batch_id()
+        # Bez loginu i hasła WP - worker bierze je z rejestru stron we własnych secrets
+        stage_args = stage_args_reference(stage_args)
+        pipeline_cfg = {"stages": stages, "pause_after": pause_after, "stage_args": stage_args, "force_refresh": args.force_refresh}
+        mark_stages_status(ids, stages, QUEUED_STATUS)
+        share = {"share": scheduler.share_label(args.operator, args.klass), "weight": scheduler.share_weight(args.operator, "", args.klass)}
+        for stage in root_stages(stages):
+            store.enqueue(ids, stage, stage_args.get(stage), batch_id=batch_id, pipeline=pipeline_cfg, **share)
+        log.info("Dodano %d wierszy do kolejki (batch %s, etapy: %s).", len(ids), batch_id, ", ".join(stages))
+        return 0
+
+    rows = fetch_rows(ids)
+    missing = len(ids) - len(rows)
+    if missing:
+        log.warning("Pominięto %d id, których nie ma w seo_content_tasks.", missing)
+    return execute(args, rows, stages, stage_args, pause_after)
+
+def on_event(row_id, stage, result):
+    if result is None:
+        log.info("#%s %s: zatrzymano/wstrzymano (usługa niedostępna)", row_id, stage)
+    elif result[0]:
+        log.info("#%s %s: ✅", row_id, stage)
+    else:
+        log.warning("#%s %s: ❌ %s", row_id, stage, result[1])
+
+def execute(args, rows, stages, stage_args, pause_after, statuses=None, resumed_from=None):
+    """PipelineRunner w zarejestrowanym przebiegu (checkpoints) - przerwany proces można wznowić poleceniem resume."""
+    stage_workers = {s: args.workers for s in stages} if args.workers else None
+    log.info("Start: %d wierszy, etapy: %s", len(rows), ", ".join(stages))
+    kind = "pipeline" if len(stages) > 1 else "stage"
+    # Udział w harmonogramie procesu: resume nie ma tych opcji - operator "cli", klasa normalna
+    with scheduler.flow_scope(getattr(args, "operator", "cli"), getattr(args, "klass", scheduler.DEFAULT_CLASS)):
+        runner = PipelineRunner(rows, stages, stage_workers, stage_args, pause_after, statuses=statuses)
+    try:
+        with tracked_run(kind, list(runner.rows), stages, stage_args, pause_after, resumed_from=resumed_from) as run, \
+                dify_cache.batch_scope(args.force_refresh) as cache_scope, metrics.batch_scope(run.run_id):
+            stats = runner.run(on_event)
+            run.stopped = any(s['skipped'] for s in stats.values())
+            run.stats = stats
+    except KeyboardInterrupt:
+        # run() anuluje wiersze czekające w pulach; etapy w toku dokończą zapis do bazy
+        log.warning("Przerwano - wiersze w toku dokończą bieżący etap (python factory.py resume, by dokończyć).")
+        return 130
+
+    summary = {"batch_id": run.run_id, "rows": len(rows), "stages": stats, "cache": cache_scope.summary()}
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        for stage in stages:
+            s = stats[stage]
+            log.info("%s: ✅ %d | ❌ %d | ⏸️ %d | pominięte %d", stage, s['done'], s['errors'], s['paused'], s['skipped'])
+        log.info(cache_scope.summary())
+        if run.stopped:
+            log.warning("Część wierszy wstrzymano (otwarty bezpiecznik usługi) - dokończ je poleceniem python factory.py resume.")
+    return 1 if any(s['errors'] for s in stats.values()) else 0
+
+def cmd_runs(args):
+    """Ostatnie przebiegi z rejestru (checkpoints) - z oznaczeniem przebiegów do wznowienia."""
+    runs = checkpoints.list_runs(args.limit)
+    if args.json:
+        print(json.dumps(runs, ensure_ascii=False, indent=2))
+        return 0
+    for run in runs:
+        flag = "♻️ " if checkpoints.is_resumable(run) else "   "
+        status = "stale" if checkpoints.is_stale(run) else run["status"]
+        print(f"{flag}{run['run_id']}  {status:<12} {','.join(run['stages']):<45} {len(run['row_ids']):>6} wierszy  {run['owner']}")
+    return 0
+
+def cmd_resume(args):
+    """Wznawia przebiegi: tylko niedokończone wiersze i etapy, sekcje artykułu z checkpointu są pomijane."""
+    if args.run:
+        run = checkpoints.get_run(args.run)
+        if run is None:
+            log.error("Nie ma przebiegu %s.", args.run)
+            return 2
+        runs = [run]
+    else:
+        runs = checkpoints.resumable_runs(args.limit)
+    exit_code = 0
+    for run in runs:
+        plan = resume_plan(run)
+        if not plan:
+            log.info("Przebieg %s: brak niedokończonych wierszy.", run["run_id"])
+            checkpoints.dismiss(run["run_id"])
+            continue
+        log.info("Wznawiam przebieg %s (%d z %d wierszy).", run["run_id"], len(plan), len(run["row_ids"]))
+        rows = fetch_rows(list(plan))
+        # Hasło WP nie jest zapisywane w rejestrze - strona spoza [wordpress.sites] dostaje je z --wp-user/--wp-key
+        stage_args = with_wp_credentials(run["stage_args"] or {}, {
+            "url": ((run["stage_args"] or {}).get("publication") or {}).get("url"), "user": args.wp_user,
+            "key": args.wp_key or os.environ.get("CF_WP_KEY")
+        })
+        code = execute(args, rows, run["stages"], stage_args, run["pause_after"] or [], plan, run["run_id"])
+        if code == 130:
+            return code
+        exit_code = max(exit_code, code)
+    return exit_code
+
+def cmd_status(args):
+    """Liczba wierszy per status każdego etapu (dla --ids albo całej tabeli)."""
+    cols = [spec['status_col'] for spec in STAGES.values()]
+    if args.row_ids is not None:
+        records = fetch_rows(args.row_ids, columns=",".join(["id"] + cols))
+        # fetch_rows zwraca nazwy kolumn UI - wracamy do nazw z bazy
+        records = [{col: r.get(COLUMN_MAP[col]) for col in cols} for r in records]
+    else:
+        records = [r for page in iter_record_pages(columns=",".join(cols), page_size=1000) for r in page]
+    counts = {stage: Counter(r.get(spec['status_col']) or "—" for r in records) for stage, spec in STAGES.items()}
+    if args.json:
+        print(json.dumps({stage: dict(c) for stage, c in counts.items()}, ensure_ascii=False, indent=2))
+        return 0
+    print(f"Wierszy: {len(records)}")
+    for stage in PIPELINE_ORDER:
+        print(f"\n[{stage}]")
+        for status, count in counts[stage].most_common():
+            print(f"  {count:>7}  {status}")
+    return 0
+
+def cmd_compact(args):
+    """Przenosi długie wartości ciężkich kolumn z wierszy do magazynu blobów; --gc usuwa bloby bez referencji."""
+    if not blob_store.enabled():
+        log.error("Magazyn blobów wyłączony - ustaw [blobs] BACKEND w secrets.")
+        return 2
+    stats = compact_rows(args.row_ids, dry_run=args.dry_run)
+    if args.gc:
+        stats["orphan_blobs"] = collect_blob_garbage(dry_run=args.dry_run)
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+        return 0
+    prefix = "[próba] " if args.dry_run else ""
+    print(f"{prefix}Wiersze: {stats['rows']}, wartości: {stats['values']}, "
+          f"{stats['bytes_inline'] / 1024 / 1024:.1f} MB w tabeli"
+          + ("" if args.dry_run else f" -> {stats['bytes_refs'] / 1024:.1f} KB referencji")
+          + (f", pominięte (zmienione w trakcie): {stats['skipped']}" if stats['skipped'] else ""))
+    if args.gc:
+        print(f"{prefix}Bloby bez referencji usunięte: {stats['orphan_blobs']}")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Content Factory bez Streamlit: uruchamianie etapów z linii poleceń")
+    parser.add_argument("--secrets", default=DEFAULT_SECRETS_PATH, help="Ścieżka do secrets.toml (zmienne CF_* nadpisują plik)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Uruchom etap albo kilka etapów (pipeline) dla wybranych wierszy")
+    run.add_argument("--stage", required=True, help=f"Etap lub etapy po przecinku: {', '.join(PIPELINE_ORDER)}")
+    target = run.add_mutually_exclusive_group(required=True)
+    target.add_argument("--ids", help="Id wierszy, np. 1-500,700")
+    target.add_argument("--pending", action="store_true", help="Wiersze, w których pierwszy etap nie jest gotowy")
+    run.add_argument("--limit", type=int, help="Maks. liczba wierszy")
+    run.add_argument("--workers", type=int, help="Wątki na etap (domyślnie [batch] WORKERS_* z secrets)")
+    run.add_argument("--pause-after", help="Zatrzymaj wiersze po tych etapach (np. headers)")
+    run.add_argument("--force-refresh", action="store_true", help="Pomiń cache Dify (wyniki i tak trafią do cache)")
+    run.add_argument("--queue", action="store_true", help="Zamiast wykonywać - dodaj zadania do kolejki worker.py")
+    run.add_argument("--writing-mode", choices=list(WRITING_MODES), default="sequential")
+    run.add_argument("--wave-size", type=int, default=4, help="Sekcji na falę w trybie parallel (0 = wszystkie)")
+    run.add_argument("--wp-site", help="Strona z [wordpress.sites] (gdy wiersz nie ma własnej 'Strona WP')")
+    run.add_argument("--wp-url", help="Adres WP (bez rejestru stron)")
+    run.add_argument("--wp-user", help="Użytkownik WP")
+    run.add_argument("--wp-key", help="Hasło aplikacji WP (lub zmienna CF_WP_KEY)")
+    run.add_argument("--class", dest="klass", choices=list(scheduler.PRIORITY_CLASSES), default=scheduler.DEFAULT_CLASS,
+                     help="Klasa batcha w harmonogramie: urgent | normal | bulk (wagi [scheduler.class_weights])")
+    run.add_argument("--operator", default="cli", help="Operator (udział w harmonogramie i w kolejce workerów)")
+    run.add_argument("--json", action="store_true", help="Podsumowanie jako JSON na stdout")
+    run.set_defaults(func=cmd_run)
+
+    runs = sub.add_parser("runs", help="Ostatnie przebiegi (♻️ = do wznowienia)")
+    runs.add_argument("--limit", type=int, default=20)
+    runs.add_argument("--json", action="store_true", help="Wynik jako JSON na stdout")
+    runs.set_defaults(func=cmd_runs)
+
+    resume = sub.add_parser("resume", help="Wznów przerwane przebiegi (domyślnie wszystkie do wznowienia)")
+    resume.add_argument("--run", help="Id przebiegu (z polecenia runs)")
+    resume.add_argument("--limit", type=int, default=20, help="Ile ostatnich przebiegów sprawdzić")
+    resume.add_argument("--workers", type=int, help="Wątki na etap (domyślnie [batch] WORKERS_* z secrets)")
+    resume.add_argument("--force-refresh", action="store_true", help="Pomiń cache Dify i zapisane sekcje artykułów")
+    resume.add_argument("--wp-user", help="Użytkownik WP strony spoza [wordpress.sites] (hasło nie jest zapisywane w przebiegu)")
+    resume.add_argument("--wp-key", help="Hasło aplikacji WP tej strony (lub zmienna CF_WP_KEY)")
+    resume.add_argument("--json", action="store_true", help="Podsumowanie jako JSON na stdout")
+    resume.set_defaults(func=cmd_resume)
+
+    status = sub.add_parser("status", help="Podsumowanie statusów etapów")
+    status.add_argument("--ids", help="Id wierszy, np. 1-500 (domyślnie cała tabela)")
+    status.add_argument("--json", action="store_true", help="Wynik jako JSON na stdout")
+    status.set_defaults(func=cmd_status)
+
+    compact = sub.add_parser("compact", help="Przenieś ciężkie kolumny do magazynu blobów ([blobs] w secrets)")
+    compact.add_argument("--ids", help="Id wierszy, np. 1-500 (domyślnie cała tabela)")
+    compact.add_argument("--gc", action="store_true", help="Usuń też bloby bez referencji (starsze niż GC_GRACE_HOURS)")
+    compact.add_argument("--dry-run", action="store_true", help="Tylko policz, bez zapisu i usuwania")
+    compact.add_argument("--json", action="store_true", help="Wynik jako JSON na stdout")
+    compact.set_defaults(func=cmd_compact)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    try:
+        args.row_ids = parse_ids(args.ids) if getattr(args, "ids", None) else None
+        if args.command == "run":
+            args.stages = parse_stages(args.stage)
+            args.pause_stages = parse_stages(args.pause_after) if args.pause_after else []
+        args.secrets_dict = load_config(args.secrets)
+    except ValueError as e:
+        parser.error(str(e))
+    configure(args.secrets_dict)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
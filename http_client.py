@@ -0,0 +1,194 @@
+"""
+Wspólna warstwa HTTP dla Dify i WordPress.
+
+- jedna sesja keep-alive (pula połączeń) na host zamiast nowego TCP+TLS przy każdym żądaniu,
+- ponawianie błędów przejściowych (429/5xx, zerwane połączenie) z wykładniczym backoffem i jitterem;
+  zapisy nieidempotentne (POST, PATCH) tylko wtedy, gdy serwer na pewno ich nie wykonał
+  (429/503, brak połączenia) - 500/502/504 czy zerwanie po wysłaniu grożą duplikatem,
+- respektowanie nagłówka Retry-After,
+- osobne timeouty połączenia i odczytu,
+- pomiar każdego żądania (czas, ponowienia, rozmiary) w metrics.py,
+- opcjonalnie upstream (upstreams.py): token bucket, adaptacyjny limit i bezpiecznik przy każdej próbie.
+
+Ustawienia (configure) ładuje pipeline.configure() z sekcji [http] w secrets.
+"""
+import time
+import random
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+import metrics
+
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+# Odpowiedzi, po których serwer nie wykonał żądania - bezpieczne do ponowienia także dla POST
+SAFE_RETRY_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+HTTP_SETTINGS = {
+    "pool_size": 32,          # maks. połączeń keep-alive na host (~ liczba równoległych wątków)
+    "connect_timeout": 10,    # s
+    "max_retries": 4,
+    "backoff_base": 1.0,      # s, opóźnienie rośnie: base * 2^próba (z pełnym jitterem)
+    "backoff_max": 60.0,      # s, limit pojedynczego opóźnienia
+    "retry_after_max": 300.0  # s, limit dla Retry-After podanego przez serwer
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def configure(**settings):
+    """Nadpisuje HTTP_SETTINGS. Zmiana rozmiaru puli zamyka istniejące sesje."""
+    settings = {k: v for k, v in settings.items() if v is not None}
+    with _sessions_lock:
+        if settings.get("pool_size", HTTP_SETTINGS["pool_size"]) != HTTP_SETTINGS["pool_size"]:
+            for session in _sessions.values():
+                session.close()
+            _sessions.clear()
+        HTTP_SETTINGS.update(settings)
+
+def _cookie_blocking_policy():
+    # Bez ciasteczek - sesja jest wspólna dla wielu kont/kluczy na tym samym hoście
+    return DefaultCookiePolicy(allowed_domains=[])
+
+def _host_key(url):
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+def get_session(url):
+    """Sesja keep-alive współdzielona przez wszystkie wątki dla danego hosta."""
+    key = _host_key(url)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            session.cookies.set_policy(_cookie_blocking_policy())
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_SETTINGS["pool_size"])
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[key] = session
+        return session
+
+def retry_after_seconds(response):
+    """Czas z nagłówka Retry-After (sekundy lub data HTTP) albo None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt):
+    """Wykładniczy backoff z pełnym jitterem (rozprasza ponowienia wielu wątków)."""
+    cap = min(HTTP_SETTINGS["backoff_max"], HTTP_SETTINGS["backoff_base"] * (2 ** attempt))
+    return random.uniform(0, cap)
+
+def _not_sent(error):
+    """Błąd nawiązania połączenia (timeout, odmowa, DNS) - żądanie nie dotarło do serwera."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+def request_with_retry(method, url, read_timeout=60, retry_read_timeout=False, max_retries=None, upstream=None,
+                       retry_statuses=None, **kwargs):
+    """
+    Wysyła żądanie przez pulę połączeń, ponawiając błędy przejściowe.
+
+    Args:
+        method (str): Metoda HTTP
+        url (str): Pełny adres
+        read_timeout (float): Timeout odczytu odpowiedzi (połączenie: HTTP_SETTINGS["connect_timeout"])
+        retry_read_timeout (bool): Czy ponawiać po przekroczeniu czasu odczytu. Domyślnie nie -
+            serwer mógł już wykonać operację (np. utworzyć wpis), więc ponowienie grozi duplikatem.
+        max_retries (int): Liczba ponowień (domyślnie HTTP_SETTINGS["max_retries"])
+        retry_statuses (set): Kody ponawiane - domyślnie RETRY_STATUSES dla metod idempotentnych,
+            SAFE_RETRY_STATUSES dla POST/PATCH (po 500/502/504 serwer mógł już utworzyć wpis).
+            Zerwane połączenie zapisu jest ponawiane tylko, gdy żądanie nie zostało wysłane.
+        upstream (upstreams.Upstream): Limit tempa i bezpiecznik sprawdzane przed każdą próbą;
+            wynik próby (429/5xx, timeout, czas odpowiedzi) trafia do upstream.report()
+
+    Zwraca ostatnią odpowiedź (także błędną - o jej obsłudze decyduje wywołujący)
+    albo rzuca wyjątek requests po wyczerpaniu prób
+    (upstreams.CircuitOpenError, gdy bezpiecznik upstreamu jest otwarty).
+    """
+    max_retries = HTTP_SETTINGS["max_retries"] if max_retries is None else max_retries
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    if retry_statuses is None:
+        retry_statuses = RETRY_STATUSES if idempotent else SAFE_RETRY_STATUSES
+    timeout = (HTTP_SETTINGS["connect_timeout"], read_timeout)
+    session = get_session(url)
+    started = time.perf_counter()
+    response = None
+
+    try:
+        for attempt in range(max_retries + 1):
+            probe = upstream.before_attempt() if upstream is not None else None
+            attempt_started = time.perf_counter()
+            try:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+            except requests.exceptions.ReadTimeout:
+                _report(upstream, overload=True, probe=probe)
+                if not retry_read_timeout or attempt >= max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+            except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as e:
+                _report(upstream, overload=True, probe=probe)
+                if attempt >= max_retries or not (idempotent or _not_sent(e)):
+                    raise
+                delay = backoff_delay(attempt)
+            except Exception:
+                _report(upstream, probe=probe)
+                raise
+            else:
+                overload = response.status_code in RETRY_STATUSES
+                retry_after = retry_after_seconds(response) if overload else None
+                _report(upstream, overload, time.perf_counter() - attempt_started, retry_after, probe)
+                if response.status_code not in retry_statuses or attempt >= max_retries:
+                    return response
+                delay = min(retry_after, HTTP_SETTINGS["retry_after_max"]) if retry_after is not None else backoff_delay(attempt)
+                response.close()
+                response = None
+            time.sleep(delay)
+    finally:
+        _record_request(method, url, started, attempt, response, kwargs.get("stream"))
+
+def _report(upstream, overload=False, latency=None, retry_after=None, probe=None):
+    if upstream is not None:
+        upstream.report(overload, latency, retry_after, probe)
+
+def _body_size(body):
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    return None
+
+def _record_request(method, url, started, attempt, response, streamed):
+    """Zdarzenie http w metrics: czas łącznie z ponowieniami; odpowiedź strumieniowa - rozmiar z nagłówka."""
+    if not metrics.enabled():
+        return
+    response_bytes = None
+    if response is not None:
+        if streamed:
+            response_bytes = int(response.headers.get("Content-Length") or 0) or None
+        else:
+            response_bytes = len(response.content)
+    metrics.record(
+        "http", f"{method} {_host_key(url)}",
+        wall_s=time.perf_counter() - started,
+        ok=response is not None and response.status_code < 400,
+        status_code=response.status_code if response is not None else None,
+        retries=attempt,
+        request_bytes=_body_size(getattr(getattr(response, "request", None), "body", None)),
+        response_bytes=response_bytes
+    )
@@ -0,0 +1,179 @@
+"""
+Masowy import słów kluczowych (Excel/CSV) do seo_content_tasks - bez zależności od Streamlit.
+
+- kolumny pliku mapowane przez REVERSE_COLUMN_MAP (nazwy z UI, np. "Słowo kluczowe", "Język", "AIO")
+  albo nazwy kolumn z bazy; brak kolumny słowa kluczowego = heurystyka jak dotąd,
+- plik czytany porcjami (CSV przez chunksize, XLSX przez openpyxl w trybie read_only),
+- normalizacja i deduplikacja wektorowo w pandas (bez wielkości liter): w obrębie pliku oraz względem
+  istniejących par (keyword, language) - jedno wywołanie RPC existing_keyword_pairs na porcję
+  (lower(keyword) + indeks funkcyjny z README),
+- insert paczkami po `batch_size` rekordów; odrzucone wiersze trafiają do raportu z powodem.
+"""
+import io
+import itertools
+
+import pandas as pd
+
+import blob_store
+from pipeline import COLUMN_MAP, REVERSE_COLUMN_MAP
+
+DEFAULT_IMPORT_BATCH_SIZE = 500
+DEFAULT_CHUNK_ROWS = 5000
+LOOKUP_CHUNK = 200
+DEFAULT_LANGUAGE = "pl"
+MAX_KEYWORD_LENGTH = 300
+LANGUAGE_PATTERN = r"[a-z]{2,3}([-_][a-z0-9]{2,4})?"
+
+# Kolumny, których import nie ustawia (identyfikatory i statusy etapów zarządzane przez pipeline)
+NON_IMPORTABLE = {'id', 'updated_at', 'wp_post_id'} | {c for c in COLUMN_MAP if c.startswith('status_')}
+
+REJECT_EMPTY = "puste słowo kluczowe"
+REJECT_TOO_LONG = f"słowo kluczowe dłuższe niż {MAX_KEYWORD_LENGTH} znaków"
+REJECT_LANGUAGE = "niepoprawny kod języka"
+REJECT_DUPLICATE_FILE = "duplikat w pliku"
+REJECT_EXISTS = "już istnieje w bazie"
+
+def map_columns(columns):
+    """{kolumna_pliku: kolumna_db}. Dopasowanie bez wielkości liter i zbędnych spacji."""
+    known = {name.strip().casefold(): db for name, db in REVERSE_COLUMN_MAP.items()}
+    known.update({db.casefold(): db for db in COLUMN_MAP})
+    mapping = {}
+    for col in columns:
+        db = known.get(" ".join(str(col).split()).casefold())
+        if db and db not in NON_IMPORTABLE and db not in mapping.values():
+            mapping[col] = db
+    if 'keyword' not in mapping.values() and len(columns):
+        # Dawna heurystyka: kolumna z "słowo"/"keyword" w nazwie, inaczej pierwsza kolumna
+        candidates = [c for c in columns if "słowo" in str(c).lower() or "keyword" in str(c).lower()]
+        c_kw = candidates[-1] if candidates else columns[0]
+        mapping = {c: db for c, db in mapping.items() if c != c_kw}
+        mapping[c_kw] = 'keyword'
+    return mapping
+
+def _read_xlsx_chunks(source, chunk_rows):
+    from openpyxl import load_workbook
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(h) if h is not None else f"kolumna_{i + 1}" for i, h in enumerate(header)]
+        while True:
+            batch = list(itertools.islice(rows, chunk_rows))
+            if not batch:
+                return
+            yield pd.DataFrame(batch, columns=header, dtype=object)
+    finally:
+        workbook.close()
+
+def iter_file_chunks(source, filename, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """DataFrame'y po maks. `chunk_rows` wierszy - plik nie jest wczytywany w całości."""
+    if filename.lower().endswith('.csv'):
+        # dtype=str + keep_default_na=False: "NA"/"null" jako słowa kluczowe zostają tekstem
+        yield from pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunk_rows, sep=None, engine='python')
+    else:
+        yield from _read_xlsx_chunks(source, chunk_rows)
+
+def normalize_chunk(df, mapping):
+    """Rekordy bazy (nazwy kolumn db) po normalizacji; kolumny tekstowe jako str bez NaN, priorytet i termin jako liczba / ISO albo None."""
+    out = df[list(mapping)].rename(columns=mapping)
+    out = out.astype(object).where(out.notna(), "").astype(str)
+    out['keyword'] = out['keyword'].str.split().str.join(" ")
+    if 'language' in out:
+        out['language'] = out['language'].str.strip().str.lower().replace("", DEFAULT_LANGUAGE)
+    else:
+        out['language'] = DEFAULT_LANGUAGE
+    if 'headers_final' not in out:
+        out['headers_final'] = ""
+    # Kolumny harmonogramu z typem w bazie - pusta lub niepoprawna wartość = NULL
+    if 'priority' in out:
+        out['priority'] = pd.to_numeric(out['priority'], errors='coerce').map(lambda v: None if pd.isna(v) else int(round(v)))
+    if 'publish_by' in out:
+        out['publish_by'] = pd.to_datetime(out['publish_by'], errors='coerce').map(lambda v: None if pd.isna(v) else v.isoformat())
+    return out
+
+def existing_pairs(client, keywords):
+    """
+    {(keyword.casefold(), language)} dla słów już obecnych w bazie w dowolnej wielkości liter -
+    RPC existing_keyword_pairs (lower(keyword) = ANY(...)) po LOOKUP_CHUNK słów.
+    """
+    keywords = list(dict.fromkeys(kw.lower() for kw in keywords))
+    found = set()
+    for i in range(0, len(keywords), LOOKUP_CHUNK):
+        response = client.rpc("existing_keyword_pairs", {"p_keywords": keywords[i:i + LOOKUP_CHUNK]}).execute()
+        found.update((r['keyword'].casefold(), (r.get('language') or DEFAULT_LANGUAGE).lower()) for r in response.data or [])
+    return found
+
+class ImportReport:
+    def __init__(self):
+        self.total = 0
+        self.inserted = 0
+        self.rejected = []  # (nr wiersza w pliku, słowo kluczowe, powód)
+
+    def reject(self, rows, keywords, reason):
+        self.rejected.extend((int(n), kw, reason) for n, kw in zip(rows, keywords))
+
+    def rejected_df(self):
+        return pd.DataFrame(self.rejected, columns=["Wiersz", "Słowo kluczowe", "Powód"])
+
+    def rejected_csv(self):
+        buffer = io.StringIO()
+        self.rejected_df().to_csv(buffer, index=False)
+        return buffer.getvalue().encode("utf-8")
+
+    def summary(self):
+        return f"Wierszy w pliku: {self.total}, zaimportowano: {self.inserted}, odrzucono: {len(self.rejected)}"
+
+def import_file(client, source, filename, batch_size=DEFAULT_IMPORT_BATCH_SIZE, chunk_rows=DEFAULT_CHUNK_ROWS,
+                on_progress=None, table="seo_content_tasks"):
+    """
+    Importuje plik porcjami. Zwraca ImportReport. on_progress(wierszy_przetworzonych, zaimportowanych)
+    wołane po każdej porcji (całkowita liczba wierszy nie jest znana bez czytania całego pliku).
+    """
+    report = ImportReport()
+    seen = set()
+    mapping = None
+    for chunk in iter_file_chunks(source, filename, chunk_rows):
+        if mapping is None:
+            mapping = map_columns(list(chunk.columns))
+        # Numer wiersza jak w arkuszu: nagłówek = 1
+        row_numbers = pd.RangeIndex(report.total + 2, report.total + 2 + len(chunk))
+        report.total += len(chunk)
+        df = normalize_chunk(chunk, mapping).set_axis(row_numbers)
+
+        checks = [
+            (REJECT_EMPTY, lambda d: d['keyword'] == ""),
+            (REJECT_TOO_LONG, lambda d: d['keyword'].str.len() > MAX_KEYWORD_LENGTH),
+            (REJECT_LANGUAGE, lambda d: ~d['language'].str.fullmatch(LANGUAGE_PATTERN))
+        ]
+        for reason, check in checks:
+            mask = check(df)
+            report.reject(df.index[mask], df.loc[mask, 'keyword'], reason)
+            df = df[~mask]
+
+        dedup_key = df['keyword'].str.casefold() + "\x1f" + df['language']
+        duplicate = dedup_key.duplicated() | dedup_key.isin(seen)
+        report.reject(df.index[duplicate], df.loc[duplicate, 'keyword'], REJECT_DUPLICATE_FILE)
+        df, dedup_key = df[~duplicate], dedup_key[~duplicate]
+        seen.update(dedup_key)
+
+        if not df.empty:
+            known = {f"{kw}\x1f{lang}" for kw, lang in existing_pairs(client, df['keyword'].tolist())}
+            exists = dedup_key.isin(known)
+            report.reject(df.index[exists], df.loc[exists, 'keyword'], REJECT_EXISTS)
+            df = df[~exists]
+
+        records = df.to_dict('records')
+        numbers = df.index.tolist()
+        for i in range(0, len(records), batch_size):
+            batch = records[i:i + batch_size]
+            try:
+                # Zaimportowane długie teksty (np. artykuły z eksportu) trafiają do magazynu blobów jak zapisy etapów
+                client.table(table).insert([blob_store.offload(r) for r in batch]).execute()
+                report.inserted += len(batch)
+            except Exception as e:
+                report.reject(numbers[i:i + batch_size], [r['keyword'] for r in batch], f"błąd zapisu: {str(e)[:100]}")
+        if on_progress:
+            on_progress(report.total, report.inserted)
+    return report
@@ -0,0 +1,341 @@
+"""
+Trwała kolejka zadań (jobs) dla workerów działających poza Streamlit.
+
+Każde zadanie to para (wiersz seo_content_tasks, etap). Worker (worker.py) przejmuje
+zadania z leasem na określony czas i przedłuża go heartbeatem. Zadanie z wygasłym
+leasem (np. worker padł) wraca do puli i jest ponawiane do max_attempts razy.
+Zadania, których lease wygasł po ostatniej próbie, fail_expired() oznacza jako nieudane i zwraca,
+by worker mógł oznaczyć wiersz błędem i pominąć dalsze etapy pipeline'u.
+Zadanie odłożone (defer - usługa chwilowo niedostępna) czeka na koniec krótkiego leasu
+bez właściciela i nie zużywa próby.
+
+Kolejność przejmowania (jak w scheduler.py): najpierw zadania wierszy z terminem "Publikuj do"
+w ciągu URGENT_HOURS (najbliższy termin pierwszy), potem udziały (share = operator/klasa batcha)
+naprzemiennie wg wag - n-te zadanie udziału ma przebieg n / weight - a w obrębie udziału
+wyższy priorytet wiersza. Backend SQLite nie zna wierszy seo_content_tasks, więc dzieli tylko wg wag.
+
+Backendy:
+    SupabaseJobStore - tabela seo_jobs + funkcja RPC claim_seo_jobs (patrz README)
+    SQLiteJobStore   - lokalny plik SQLite (testy / praca bez Supabase)
+"""
+import json
+import time
+import uuid
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+
+import scheduler
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+JOB_STATUSES = [JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_CANCELLED]
+
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_SQLITE_PATH = "jobs.sqlite"
+DEFAULT_SHARE = "-"
+
+def new_batch_id():
+    return uuid.uuid4().hex[:12]
+
+def _utc_iso(seconds_from_now=0):
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds_from_now)).isoformat()
+
+# --- SUPABASE ---
+class SupabaseJobStore:
+    def __init__(self, client, table="seo_jobs", cancellations_table="seo_job_cancellations"):
+        self.client = client
+        self.table = table
+        self.cancellations_table = cancellations_table
+
+    def enqueue(self, task_ids, stage, args=None, batch_id=None, max_attempts=DEFAULT_MAX_ATTEMPTS, pipeline=None,
+                share=DEFAULT_SHARE, weight=1.0):
+        if batch_id and self.is_cancelled(batch_id):
+            return batch_id
+        batch_id = batch_id or new_batch_id()
+        records = [
+            {"batch_id": batch_id, "task_id": int(task_id), "stage": stage, "args": args, "max_attempts": max_attempts, "pipeline": pipeline,
+             "share": share or DEFAULT_SHARE, "weight": float(weight or 1.0)}
+            for task_id in task_ids
+        ]
+        # Unikalny (batch_id, task_id, stage): ponowne dodanie tego samego etapu pipeline'u jest ignorowane
+        for i in range(0, len(records), 500):
+            self.client.table(self.table).upsert(
+                records[i:i + 500], on_conflict="batch_id,task_id,stage", ignore_duplicates=True
+            ).execute()
+        return batch_id
+
+    def claim(self, worker_id, stages=None, limit=1, lease_seconds=DEFAULT_LEASE_SECONDS):
+        if limit <= 0:
+            return []
+        response = self.client.rpc("claim_seo_jobs", {
+            "p_worker": worker_id,
+            "p_stages": list(stages) if stages else None,
+            "p_limit": int(limit),
+            "p_lease_seconds": int(lease_seconds),
+            "p_urgent_hours": float(scheduler.SCHEDULER_SETTINGS["urgent_hours"])
+        }).execute()
+        return response.data or []
+
+    def fail_expired(self):
+        response = self.client.rpc("fail_expired_seo_jobs", {}).execute()
+        return response.data or []
+
+    def heartbeat(self, job_ids, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        if not job_ids:
+            return
+        self.client.table(self.table).update({
+            "lease_expires_at": _utc_iso(lease_seconds), "updated_at": _utc_iso()
+        }).in_("id", list(job_ids)).eq("lease_owner", worker_id).eq("status", JOB_RUNNING).execute()
+
+    def complete(self, job, worker_id):
+        self.client.table(self.table).update({
+            "status": JOB_DONE, "lease_expires_at": None, "last_error": None, "updated_at": _utc_iso()
+        }).eq("id", job["id"]).eq("lease_owner", worker_id).execute()
+
+    def fail(self, job, worker_id, error):
+        retry = job["attempts"] < job["max_attempts"]
+        self.client.table(self.table).update({
+            "status": JOB_QUEUED if retry else JOB_FAILED,
+            "lease_owner": None, "lease_expires_at": None,
+            "last_error": str(error)[:500], "updated_at": _utc_iso()
+        }).eq("id", job["id"]).eq("lease_owner", worker_id).execute()
+        return retry
+
+    def defer(self, job, worker_id, delay_seconds, reason):
+        # Lease bez właściciela wygasa po delay_seconds - claim przejmie zadanie ponownie; próba nie jest liczona
+        self.client.table(self.table).update({
+            "status": JOB_RUNNING, "lease_owner": None, "lease_expires_at": _utc_iso(delay_seconds),
+            "attempts": max(0, job["attempts"] - 1), "last_error": str(reason)[:500], "updated_at": _utc_iso()
+        }).eq("id", job["id"]).eq("lease_owner", worker_id).execute()
+
+    def cancel(self, batch_id):
+        # Znacznik batcha najpierw: zadania już przejęte nie dodadzą kolejnych etapów (is_cancelled),
+        # a claim_seo_jobs pomija zadania anulowanych batchy
+        self.client.table(self.cancellations_table).upsert(
+            {"batch_id": batch_id, "cancelled_at": _utc_iso()}, on_conflict="batch_id", ignore_duplicates=True
+        ).execute()
+        self.client.table(self.table).update({
+            "status": JOB_CANCELLED, "updated_at": _utc_iso()
+        }).eq("batch_id", batch_id).eq("status", JOB_QUEUED).execute()
+
+    def is_cancelled(self, batch_id):
+        response = self.client.table(self.cancellations_table).select("batch_id").eq("batch_id", batch_id).limit(1).execute()
+        return bool(response.data)
+
+    def batch_summary(self, limit=10):
+        response = self.client.table("seo_job_batches").select("*").order("created_at", desc=True).limit(limit).execute()
+        return response.data or []
+
+# --- SQLITE (STAND-IN) ---
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seo_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT NOT NULL,
+    task_id INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    args TEXT,
+    pipeline TEXT,
+    share TEXT NOT NULL DEFAULT '-',
+    weight REAL NOT NULL DEFAULT 1,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS seo_jobs_claim_idx ON seo_jobs (status, id);
+CREATE INDEX IF NOT EXISTS seo_jobs_batch_idx ON seo_jobs (batch_id);
+CREATE UNIQUE INDEX IF NOT EXISTS seo_jobs_unique_idx ON seo_jobs (batch_id, task_id, stage);
+CREATE TABLE IF NOT EXISTS seo_job_cancellations (
+    batch_id TEXT PRIMARY KEY,
+    cancelled_at REAL NOT NULL
+);
+"""
+
+# Kolumny dodane po pierwszej wersji schematu (starsze pliki SQLite są uzupełniane przy starcie)
+SQLITE_MIGRATIONS = {
+    "pipeline": "ALTER TABLE seo_jobs ADD COLUMN pipeline TEXT",
+    "share": "ALTER TABLE seo_jobs ADD COLUMN share TEXT NOT NULL DEFAULT '-'",
+    "weight": "ALTER TABLE seo_jobs ADD COLUMN weight REAL NOT NULL DEFAULT 1"
+}
+
+class SQLiteJobStore:
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        with closing(self._connect()) as conn:
+            existing = {r["name"] for r in conn.execute("PRAGMA table_info(seo_jobs)")}
+            for column, ddl in SQLITE_MIGRATIONS.items():
+                if existing and column not in existing:
+                    conn.execute(ddl)
+            conn.executescript(SQLITE_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _to_job(row):
+        job = dict(row)
+        job["args"] = json.loads(job["args"]) if job["args"] else None
+        job["pipeline"] = json.loads(job["pipeline"]) if job.get("pipeline") else None
+        return job
+
+    def enqueue(self, task_ids, stage, args=None, batch_id=None, max_attempts=DEFAULT_MAX_ATTEMPTS, pipeline=None,
+                share=DEFAULT_SHARE, weight=1.0):
+        batch_id = batch_id or new_batch_id()
+        now = time.time()
+        args_json = json.dumps(args, ensure_ascii=False) if args else None
+        pipeline_json = json.dumps(pipeline, ensure_ascii=False) if pipeline else None
+        with closing(self._connect()) as conn:
+            # BEGIN IMMEDIATE - anulowanie batcha nie wejdzie między sprawdzenie a wstawienie
+            conn.execute("BEGIN IMMEDIATE")
+            if not self._cancelled(conn, batch_id):
+                conn.executemany(
+                    "INSERT OR IGNORE INTO seo_jobs (batch_id, task_id, stage, args, pipeline, share, weight, max_attempts, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(batch_id, int(task_id), stage, args_json, pipeline_json, share or DEFAULT_SHARE, float(weight or 1.0), max_attempts, now, now)
+                     for task_id in task_ids]
+                )
+            conn.execute("COMMIT")
+        return batch_id
+
+    def claim(self, worker_id, stages=None, limit=1, lease_seconds=DEFAULT_LEASE_SECONDS):
+        if limit <= 0:
+            return []
+        now = time.time()
+        stage_sql, stage_params = "", []
+        if stages:
+            stage_sql = f" AND stage IN ({','.join('?' * len(stages))})"
+            stage_params = list(stages)
+
+        with closing(self._connect()) as conn:
+            # BEGIN IMMEDIATE blokuje zapis - dwa workery nie przejmą tego samego zadania
+            conn.execute("BEGIN IMMEDIATE")
+            # Udziały naprzemiennie wg wag: n-te gotowe zadanie udziału ma przebieg n / weight
+            ids = [r["id"] for r in conn.execute(
+                "SELECT id FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY share ORDER BY id) / weight AS fair_pass FROM seo_jobs "
+                "WHERE (status = ? OR (status = ? AND lease_expires_at < ?)) "
+                f"AND attempts < max_attempts{stage_sql}) ORDER BY fair_pass, id LIMIT ?",
+                [JOB_QUEUED, JOB_RUNNING, now] + stage_params + [int(limit)]
+            )]
+            if not ids:
+                conn.execute("COMMIT")
+                return []
+            placeholders = ','.join('?' * len(ids))
+            conn.execute(
+                f"UPDATE seo_jobs SET status = ?, lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1, updated_at = ? "
+                f"WHERE id IN ({placeholders})",
+                [JOB_RUNNING, worker_id, now + lease_seconds, now] + ids
+            )
+            jobs = [self._to_job(r) for r in conn.execute(f"SELECT * FROM seo_jobs WHERE id IN ({placeholders}) ORDER BY id", ids)]
+            conn.execute("COMMIT")
+        return jobs
+
+    def fail_expired(self):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT * FROM seo_jobs WHERE status = ? AND lease_expires_at < ? AND attempts >= max_attempts ORDER BY id",
+                (JOB_RUNNING, now)
+            ).fetchall()
+            if rows:
+                ids = [r["id"] for r in rows]
+                conn.execute(
+                    f"UPDATE seo_jobs SET status = ?, lease_owner = NULL, lease_expires_at = NULL, "
+                    f"last_error = COALESCE(last_error, '') || ' [lease wygasł]', updated_at = ? WHERE id IN ({','.join('?' * len(ids))})",
+                    [JOB_FAILED, now] + ids
+                )
+            conn.execute("COMMIT")
+        return [{**self._to_job(r), "status": JOB_FAILED} for r in rows]
+
+    def heartbeat(self, job_ids, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        if not job_ids:
+            return
+        now = time.time()
+        job_ids = list(job_ids)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                f"UPDATE seo_jobs SET lease_expires_at = ?, updated_at = ? "
+                f"WHERE id IN ({','.join('?' * len(job_ids))}) AND lease_owner = ? AND status = ?",
+                [now + lease_seconds, now] + job_ids + [worker_id, JOB_RUNNING]
+            )
+
+    def complete(self, job, worker_id):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE seo_jobs SET status = ?, lease_expires_at = NULL, last_error = NULL, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                (JOB_DONE, time.time(), job["id"], worker_id)
+            )
+
+    def fail(self, job, worker_id, error):
+        retry = job["attempts"] < job["max_attempts"]
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE seo_jobs SET status = ?, lease_owner = NULL, lease_expires_at = NULL, last_error = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ?",
+                (JOB_QUEUED if retry else JOB_FAILED, str(error)[:500], time.time(), job["id"], worker_id)
+            )
+        return retry
+
+    def defer(self, job, worker_id, delay_seconds, reason):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE seo_jobs SET status = ?, lease_owner = NULL, lease_expires_at = ?, attempts = MAX(attempts - 1, 0), "
+                "last_error = ?, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                (JOB_RUNNING, now + delay_seconds, str(reason)[:500], now, job["id"], worker_id)
+            )
+
+    def cancel(self, batch_id):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT OR IGNORE INTO seo_job_cancellations (batch_id, cancelled_at) VALUES (?, ?)", (batch_id, now))
+            conn.execute(
+                "UPDATE seo_jobs SET status = ?, updated_at = ? WHERE batch_id = ? AND status = ?",
+                (JOB_CANCELLED, now, batch_id, JOB_QUEUED)
+            )
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _cancelled(conn, batch_id):
+        return conn.execute("SELECT 1 FROM seo_job_cancellations WHERE batch_id = ?", (batch_id,)).fetchone() is not None
+
+    def is_cancelled(self, batch_id):
+        with closing(self._connect()) as conn:
+            return self._cancelled(conn, batch_id)
+
+    def batch_summary(self, limit=10):
+        counts = ", ".join(f"SUM(status = '{s}') AS {s}" for s in JOB_STATUSES)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT batch_id, stage, MIN(created_at) AS created_at, MAX(updated_at) AS updated_at, "
+                f"COUNT(*) AS total, {counts} FROM seo_jobs GROUP BY batch_id, stage ORDER BY created_at DESC LIMIT ?",
+                (int(limit),)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+# --- FABRYKA ---
+def get_job_store(secrets, supabase_client=None):
+    """Zwraca backend kolejki wg sekcji [queue] w secrets (BACKEND = "supabase" | "sqlite")."""
+    queue_cfg = secrets.get("queue", {})
+    backend = queue_cfg.get("BACKEND", "supabase")
+    if backend == "sqlite":
+        return SQLiteJobStore(queue_cfg.get("SQLITE_PATH", DEFAULT_SQLITE_PATH))
+    if backend == "supabase":
+        if supabase_client is None:
+            from pipeline import get_supabase
+            supabase_client = get_supabase()
+        return SupabaseJobStore(supabase_client, queue_cfg.get("TABLE", "seo_jobs"))
+    raise ValueError(f"Nieznany backend kolejki: {backend}")
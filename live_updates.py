@@ -0,0 +1,184 @@
+"""
+Zmiany wierszy seo_content_tasks na żywo - siatka w UI łata tylko zmienione wiersze.
+
+Jeden kanał zmian na proces aplikacji, wspólny dla wszystkich sesji (operatorów):
+    realtime - Supabase Realtime (postgres_changes); tabela musi być w publikacji supabase_realtime (patrz README),
+    polling  - co POLL_SECONDS jedno lekkie zapytanie o wersję tabeli (liczba wierszy + najnowszy updated_at),
+               a przy zmianie - id wierszy z nowszym updated_at.
+Gdy Realtime jest niedostępny (brak pakietu, błąd kanału), kanał sam przechodzi na polling.
+
+Zdarzenia trafiają do bufora z numerami sekwencyjnymi. Sesja pamięta swój numer i pyta
+changes_since(seq) -> (nowy numer, {id zmienionych wierszy}, reset). reset=True (wstawione lub
+usunięte wiersze, przepełniony bufor, ponowne połączenie) oznacza, że strony siatki trzeba pobrać od nowa.
+"""
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+log = logging.getLogger("content_factory.live_updates")
+
+LIVE_MODES = ("realtime", "polling", "off")
+
+LIVE_SETTINGS = {
+    "poll_seconds": 3.0,     # polling: odstęp zapytań o wersję tabeli
+    "poll_limit": 1000,      # polling: więcej zmienionych wierszy naraz = reset zamiast łatania
+    "buffer_size": 5000      # zdarzeń w buforze; sesja, która została dalej w tyle, dostaje reset
+}
+
+class ChangeFeed:
+    """Kanał zmian tabeli: wątek w tle (Realtime albo polling) zapisuje id zmienionych wierszy w buforze."""
+
+    def __init__(self, mode, version_fn, changes_fn, url=None, key=None, table="seo_content_tasks", **settings):
+        """
+        Args:
+            version_fn: () -> (liczba wierszy, najnowszy updated_at) - pipeline.fetch_table_version
+            changes_fn: (updated_after, limit) -> [(id, updated_at)] - pipeline.fetch_changed_ids
+            url, key: adres i klucz Supabase (tylko realtime)
+        """
+        self.mode = mode
+        self.table = table
+        self.settings = {**LIVE_SETTINGS, **{k: v for k, v in settings.items() if v is not None}}
+        self.error = None
+        self.last_change_at = None
+        self._version_fn = version_fn
+        self._changes_fn = changes_fn
+        self._url = url
+        self._key = key
+        self._events = deque(maxlen=int(self.settings["buffer_size"]))  # (seq, id wiersza | None = reset)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        target = self._run_realtime if self.mode == "realtime" else self._run_polling
+        threading.Thread(target=target, name=f"live-{self.table}", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    # --- BUFOR ---
+    def _push(self, row_ids=(), reset=False):
+        with self._lock:
+            if reset:
+                self._seq += 1
+                self._events.append((self._seq, None))
+            for row_id in row_ids:
+                self._seq += 1
+                self._events.append((self._seq, int(row_id)))
+            self.last_change_at = time.time()
+
+    @property
+    def seq(self):
+        with self._lock:
+            return self._seq
+
+    def changes_since(self, seq):
+        """(bieżący numer, {id zmienionych wierszy}, reset) dla zdarzeń po numerze `seq`."""
+        with self._lock:
+            current = self._seq
+            if seq >= current:
+                return current, set(), False
+            if not self._events or self._events[0][0] > seq + 1:
+                return current, set(), True  # część zdarzeń wypadła z bufora
+            changed, reset = set(), False
+            for event_seq, row_id in reversed(self._events):
+                if event_seq <= seq:
+                    break
+                if row_id is None:
+                    reset = True
+                else:
+                    changed.add(row_id)
+            return current, changed, reset
+
+    # --- POLLING ---
+    def _run_polling(self):
+        version, cursor, seen = None, None, {}
+        while True:
+            try:
+                version, cursor, seen = self._poll(version, cursor, seen)
+                self.error = None
+            except Exception as e:
+                self.error = str(e)[:200]
+                log.warning("Kanał zmian (polling): %s", e)
+            if self._stop.wait(float(self.settings["poll_seconds"])):
+                return
+
+    def _poll(self, previous, cursor, seen):
+        """
+        Jedno sprawdzenie wersji tabeli. Kursor zostaje jedno odpytanie w tyle (zakładka na transakcje
+        zatwierdzone z wcześniejszym updated_at); wiersze już zgłoszone z tym samym updated_at są pomijane.
+        """
+        version = self._version_fn()
+        if previous is None or version == previous:
+            return version, version[1], seen
+        if version[0] != previous[0] or cursor is None:
+            self._push(reset=True)
+            return version, version[1], {}
+        limit = int(self.settings["poll_limit"])
+        changed = self._changes_fn(cursor, limit)
+        if len(changed) >= limit:
+            self._push(reset=True)
+        else:
+            fresh = [row_id for row_id, updated_at in changed if seen.get(row_id) != updated_at]
+            if fresh:
+                self._push(fresh)
+        return version, previous[1], dict(changed)
+
+    # --- REALTIME ---
+    def _run_realtime(self):
+        try:
+            asyncio.run(self._listen())
+        except Exception as e:
+            if self._stop.is_set():
+                return
+            self.error = f"Realtime niedostępny ({e}) - polling"
+            log.warning("Kanał zmian: Realtime niedostępny (%s), przechodzę na polling", e)
+            self.mode = "polling"
+            self._push(reset=True)
+            self._run_polling()
+
+    async def _listen(self):
+        from supabase import acreate_client
+
+        failed = asyncio.Event()
+        client = await acreate_client(self._url, self._key)
+        channel = client.channel(f"live-{self.table}")
+
+        def on_status(status, err=None):
+            status = str(getattr(status, "value", status))
+            if status == "SUBSCRIBED":
+                # Zdarzenia sprzed subskrypcji mogły przepaść - sesje pobierają strony od nowa
+                self.error = None
+                self._push(reset=True)
+            elif status in ("CHANNEL_ERROR", "TIMED_OUT", "CLOSED"):
+                self.error = f"{status}: {err}" if err else status
+                failed.set()
+
+        channel.on_postgres_changes("*", schema="public", table=self.table, callback=self._on_change)
+        await channel.subscribe(on_status)
+        try:
+            while not self._stop.is_set():
+                if failed.is_set():
+                    raise RuntimeError(self.error)
+                await asyncio.sleep(0.5)
+        finally:
+            await client.remove_channel(channel)
+
+    def _on_change(self, payload):
+        # Kształt zdarzenia zależy od wersji klienta realtime: {"data": {"type", "record"}} albo {"eventType", "new"}
+        data = payload.get("data", payload) if isinstance(payload, dict) else {}
+        kind = str(data.get("type") or data.get("eventType") or "").upper()
+        record = data.get("record") or data.get("new") or {}
+        if kind.endswith("UPDATE") and record.get("id") is not None:
+            self._push([record["id"]])
+        else:
+            self._push(reset=True)  # INSERT / DELETE zmieniają skład stron
+
+    def describe(self):
+        if self.mode == "realtime":
+            return "🟢 Na żywo (Supabase Realtime)" if not self.error else f"🟠 Realtime: {self.error}"
+        label = f"🟡 Na żywo (odpytywanie co {float(self.settings['poll_seconds']):g} s)"
+        return label if not self.error else f"{label} - {self.error}"
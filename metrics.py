@@ -0,0 +1,264 @@
+"""
+Pomiary wydajności: czasy etapów, wywołań Dify, żądań HTTP i zapytań do Supabase.
+
+Każde zdarzenie to jeden rekord (rodzaj, nazwa, czas, oczekiwanie w kolejce puli, rozmiary,
+ponowienia, tokeny), zapisywany paczkami do lokalnego SQLite albo tabeli seo_metrics w Supabase.
+Rodzaje: stage (etap wiersza), section (sekcja artykułu), dify (workflow), http (żądanie HTTP), db (Supabase).
+
+- batch_scope(batch_id) - zdarzenia w zakresie dostają identyfikator batcha (przepustowość per batch),
+- mark_submitted() / queue_wait() - czas od zlecenia zadania do puli do jego startu,
+- summarize() / batch_throughput() - p50/p95 dla widoku metryk w UI.
+"""
+import time
+import atexit
+import logging
+import sqlite3
+import threading
+import contextvars
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone
+
+log = logging.getLogger("content_factory.metrics")
+
+DEFAULT_SQLITE_PATH = "metrics.sqlite"
+
+METRICS_SETTINGS = {
+    "flush_every": 200,         # zdarzeń w buforze przed zapisem
+    "cost_per_1k_tokens": 0.0   # szacunkowy koszt (waluta dowolna) - tylko do widoku
+}
+
+FIELDS = ["ts", "batch_id", "kind", "name", "row_id", "wall_s", "queue_wait_s", "ok",
+          "status_code", "retries", "request_bytes", "response_bytes", "tokens", "detail"]
+
+_backend = None
+_buffer = []
+_buffer_lock = threading.Lock()
+
+_batch_id = contextvars.ContextVar("metrics_batch_id", default=None)
+_submitted_at = contextvars.ContextVar("metrics_submitted_at", default=None)
+
+def configure(backend=None, **settings):
+    global _backend
+    flush()
+    _backend = backend
+    METRICS_SETTINGS.update({k: v for k, v in settings.items() if v is not None})
+
+def enabled():
+    return _backend is not None
+
+def record(kind, name, **fields):
+    """Dodaje zdarzenie do bufora (bez backendu - nic nie robi)."""
+    if _backend is None:
+        return
+    event = {"ts": time.time(), "batch_id": _batch_id.get(), "kind": kind, "name": name}
+    event.update({k: v for k, v in fields.items() if k in FIELDS})
+    with _buffer_lock:
+        _buffer.append(event)
+        full = len(_buffer) >= int(METRICS_SETTINGS["flush_every"])
+    if full:
+        flush()
+
+def flush():
+    global _buffer
+    with _buffer_lock:
+        events, _buffer = _buffer, []
+    if events and _backend is not None:
+        try:
+            _backend.write(events)
+        except Exception:
+            log.exception("Zapis metryk nie powiódł się (%d zdarzeń)", len(events))
+
+atexit.register(flush)
+
+@contextmanager
+def timed(kind, name, **fields):
+    """Mierzy czas bloku; wyjątek = ok False (i jest przekazywany dalej)."""
+    started = time.perf_counter()
+    ok = True
+    try:
+        yield fields
+    except Exception:
+        ok = False
+        raise
+    finally:
+        record(kind, name, wall_s=time.perf_counter() - started, ok=fields.pop("ok", ok), **fields)
+
+@contextmanager
+def batch_scope(batch_id, flush_on_exit=True):
+    """Zakres batcha (dziedziczony przez wątki przez contextvars). Na końcu zapisuje bufor."""
+    token = _batch_id.set(batch_id)
+    try:
+        yield batch_id
+    finally:
+        _batch_id.reset(token)
+        if flush_on_exit:
+            flush()
+
+def mark_submitted():
+    """Wołane w kopii kontekstu przy zleceniu zadania do puli (submit_in_context)."""
+    _submitted_at.set(time.perf_counter())
+
+def queue_wait():
+    """Sekundy od zlecenia zadania do puli do teraz (None poza pulą)."""
+    submitted = _submitted_at.get()
+    return None if submitted is None else time.perf_counter() - submitted
+
+# --- PODSUMOWANIA ---
+def percentile(values, q):
+    """Percentyl z interpolacją liniową (q w 0..100)."""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    pos = (len(values) - 1) * q / 100.0
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+def _round(value, digits=3):
+    return None if value is None else round(value, digits)
+
+def summarize(events, kind):
+    """Statystyki per nazwa dla jednego rodzaju zdarzeń (lista słowników do tabeli)."""
+    groups = {}
+    for e in events:
+        if e["kind"] == kind:
+            groups.setdefault(e["name"], []).append(e)
+    cost_per_1k = float(METRICS_SETTINGS["cost_per_1k_tokens"] or 0)
+    rows = []
+    for name, items in sorted(groups.items()):
+        walls = [e.get("wall_s") for e in items]
+        waits = [e.get("queue_wait_s") for e in items]
+        tokens = sum(e.get("tokens") or 0 for e in items)
+        rows.append({
+            "name": name,
+            "count": len(items),
+            "errors": sum(1 for e in items if e.get("ok") in (False, 0)),
+            "p50_s": _round(percentile(walls, 50)),
+            "p95_s": _round(percentile(walls, 95)),
+            "total_s": _round(sum(w or 0 for w in walls), 1),
+            "queue_p50_s": _round(percentile(waits, 50)),
+            "queue_p95_s": _round(percentile(waits, 95)),
+            "retries": sum(e.get("retries") or 0 for e in items),
+            "request_kb": _round(sum(e.get("request_bytes") or 0 for e in items) / 1024, 1),
+            "response_kb": _round(sum(e.get("response_bytes") or 0 for e in items) / 1024, 1),
+            "tokens": tokens,
+            "cost": _round(tokens / 1000 * cost_per_1k, 4) if cost_per_1k else None
+        })
+    return rows
+
+def batch_throughput(events):
+    """
+    Przepustowość per batch na podstawie zdarzeń etapów: różne wiersze (row_id) na minutę od pierwszego
+    do ostatniego zdarzenia. Wiersz przechodzący kilka etapów liczy się raz; wykonania etapów w stage_runs.
+    """
+    groups = {}
+    for e in events:
+        if e["kind"] == "stage" and e.get("batch_id"):
+            groups.setdefault(e["batch_id"], []).append(e)
+    rows = []
+    for batch_id, items in groups.items():
+        started = min(e["ts"] - (e.get("wall_s") or 0) for e in items)
+        finished = max(e["ts"] for e in items)
+        minutes = max(finished - started, 1e-6) / 60
+        row_ids = {e.get("row_id") for e in items if e.get("row_id") is not None}
+        rows.append({
+            "batch_id": batch_id,
+            "stages": ", ".join(sorted({e["name"] for e in items})),
+            "started": datetime.fromtimestamp(started, timezone.utc).isoformat(timespec="seconds"),
+            "rows": len(row_ids),
+            "stage_runs": len(items),
+            "errors": sum(1 for e in items if e.get("ok") in (False, 0)),
+            "duration_s": round(finished - started, 1),
+            "rows_per_min": round(len(row_ids) / minutes, 1)
+        })
+    return sorted(rows, key=lambda r: r["started"], reverse=True)
+
+# --- BACKEND: SQLITE ---
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics_events (
+    ts REAL NOT NULL,
+    batch_id TEXT,
+    kind TEXT NOT NULL,
+    name TEXT,
+    row_id INTEGER,
+    wall_s REAL,
+    queue_wait_s REAL,
+    ok INTEGER,
+    status_code INTEGER,
+    retries INTEGER,
+    request_bytes INTEGER,
+    response_bytes INTEGER,
+    tokens INTEGER,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS metrics_events_ts_idx ON metrics_events (ts);
+"""
+
+class SQLiteMetricsBackend:
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SQLITE_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def write(self, events):
+        with closing(self._connect()) as conn:
+            conn.executemany(
+                f"INSERT INTO metrics_events ({', '.join(FIELDS)}) VALUES ({', '.join('?' for _ in FIELDS)})",
+                [tuple(e.get(f) for f in FIELDS) for e in events]
+            )
+
+    def load(self, since_ts, limit=100000):
+        with closing(self._connect()) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                f"SELECT {', '.join(FIELDS)} FROM metrics_events WHERE ts >= ? ORDER BY ts DESC LIMIT ?", (since_ts, limit)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+# --- BACKEND: SUPABASE ---
+class SupabaseMetricsBackend:
+    def __init__(self, client, table="seo_metrics"):
+        self.client = client
+        self.table = table
+
+    def write(self, events):
+        records = [
+            {**{f: e.get(f) for f in FIELDS if f != "ts"}, "ts": datetime.fromtimestamp(e["ts"], timezone.utc).isoformat()}
+            for e in events
+        ]
+        for i in range(0, len(records), 500):
+            self.client.table(self.table).insert(records[i:i + 500]).execute()
+
+    def load(self, since_ts, limit=100000, page_size=1000):
+        since = datetime.fromtimestamp(since_ts, timezone.utc).isoformat()
+        events = []
+        while len(events) < limit:
+            response = self.client.table(self.table).select(",".join(FIELDS)).gte("ts", since) \
+                .order("ts", desc=True).range(len(events), len(events) + page_size - 1).execute()
+            page = response.data or []
+            for r in page:
+                r["ts"] = datetime.fromisoformat(r["ts"]).timestamp()
+            events.extend(page)
+            if len(page) < page_size:
+                break
+        return events
+
+# --- FABRYKA ---
+def build_backend(secrets, supabase_getter=None):
+    """Backend wg sekcji [metrics] w secrets: BACKEND = "sqlite" (domyślnie) | "supabase" | "off"."""
+    metrics_cfg = secrets.get("metrics", {})
+    backend = metrics_cfg.get("BACKEND", "sqlite")
+    if backend == "off":
+        return None
+    if backend == "sqlite":
+        return SQLiteMetricsBackend(metrics_cfg.get("SQLITE_PATH", DEFAULT_SQLITE_PATH))
+    if backend == "supabase":
+        return SupabaseMetricsBackend(supabase_getter(), metrics_cfg.get("TABLE", "seo_metrics"))
+    raise ValueError(f"Nieznany backend metryk: {backend}")
+
+def load_events(since_ts):
+    return _backend.load(since_ts) if _backend is not None else []
@@ -0,0 +1,1139 @@
+"""
+Silnik etapów Content Factory - bez zależności od Streamlit.
+
+Moduł jest współdzielony przez UI (app.py) i worker kolejki zadań (worker.py).
+Konfigurację (te same sekcje co .streamlit/secrets.toml) ustawia się przez configure().
+"""
+import os
+import time
+import json
+import queue
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import http_client
+import dify_client
+import dify_cache
+import metrics
+import checkpoints
+import upstreams
+import wordpress_client
+import content_processing
+import blob_store
+import scheduler
+from dify_client import run_dify_workflow
+from wordpress_client import publish_post, split_terms, normalize_url
+
+DEFAULT_SECRETS_PATH = ".streamlit/secrets.toml"
+
+# --- MAPOWANIE KOLUMN (BAZA -> UI) ---
+COLUMN_MAP = {
+    'id': 'ID',
+    'keyword': 'Słowo kluczowe',
+    'language': 'Język',
+    'aio_prompt': 'AIO',
+    'status_research': 'Status Research',
+    'serp_phrases': 'Frazy z wyników',
+    'senuto_phrases': 'Frazy Senuto',
+    'info_graph': 'Graf informacji',
+    'competitors_headers': 'Nagłówki konkurencji',
+    'knowledge_graph': 'Knowledge graph',
+    'status_headers': 'Status Nagłówki',
+    'headers_expanded': 'Nagłówki rozbudowane',
+    'headers_h2': 'Nagłówki H2',
+    'headers_questions': 'Nagłówki pytania',
+    'headers_final': 'Nagłówki (Finalne)',
+    'status_rag': 'Status RAG',
+    'rag_content': 'RAG',
+    'rag_general': 'RAG General',
+    'status_brief': 'Status Brief',
+    'brief_json': 'Brief',
+    'brief_html': 'Brief plik',
+    'instructions': 'Dodatkowe instrukcje',
+    'status_writing': 'Status Generacja',
+    'final_article': 'Generowanie contentu',
+    'writing_stats': 'Statystyki generacji',
+    # NOWE KOLUMNY WP
+    'status_publication': 'Status Publikacji',
+    'publication_link': 'Link do wpisu',
+    'wp_site': 'Strona WP',
+    'wp_post_id': 'ID wpisu WP',
+    'wp_categories': 'Kategorie WP',
+    'wp_tags': 'Tagi WP',
+    'featured_image_url': 'Obrazek wyróżniający (URL)',
+    # HARMONOGRAM (scheduler.py)
+    'project': 'Projekt',
+    'priority': 'Priorytet',
+    'publish_by': 'Publikuj do'
+}
+
+REVERSE_COLUMN_MAP = {v: k for k, v in COLUMN_MAP.items()}
+
+# --- RÓWNOLEGŁOŚĆ (WORKERY NA ETAP) ---
+# Domyślna liczba równoległych wierszy per etap. Nadpisywane przez [batch] w secrets
+# (np. WORKERS_RESEARCH = 8) oraz przez ustawienia w pasku bocznym.
+STAGE_LABELS = {
+    'status_research': 'Research',
+    'status_headers': 'Nagłówki',
+    'status_rag': 'RAG',
+    'status_brief': 'Brief',
+    'status_writing': 'Generacja',
+    'status_publication': 'Publikacja WP'
+}
+
+DEFAULT_STAGE_WORKERS = {
+    'status_research': 8,
+    'status_headers': 8,
+    'status_rag': 8,
+    'status_brief': 8,
+    'status_writing': 4,
+    'status_publication': 16
+}
+
+# --- TRYBY GENERACJI ARTYKUŁU ---
+# sequential: sekcja po sekcji, "done" = pełny HTML dotychczasowych sekcji (tryb klasyczny)
+# parallel: sekcje w równoległych falach, "done" = kompaktowy plan + streszczenia gotowych sekcji
+WRITING_MODES = {
+    'sequential': 'Sekwencyjny (pełny kontekst)',
+    'parallel': 'Równoległy (fale sekcji)'
+}
+
+SECTION_SUMMARY_CHARS = 300
+
+# --- KONFIGURACJA ---
+SECRETS = {}
+
+_supabase_client = None
+_supabase_lock = threading.Lock()
+_cache_signature = None
+_metrics_signature = None
+_runs_signature = None
+_upstreams_signature = None
+_blobs_signature = None
+
+def configure(secrets):
+    """Ustawia konfigurację (słownik z sekcjami SUPABASE, dify, batch...)."""
+    global _supabase_client, _cache_signature, _metrics_signature, _runs_signature, _upstreams_signature, _blobs_signature
+    secrets = dict(secrets)
+    if secrets.get("SUPABASE") != SECRETS.get("SUPABASE"):
+        _supabase_client = None
+    SECRETS.clear()
+    SECRETS.update(secrets)
+
+    # Pula połączeń HTTP dopasowana do równoległości (batch + sekcje pisane w falach)
+    http_cfg = SECRETS.get("http", {})
+    max_workers = max(default_stage_workers(col) for col in DEFAULT_STAGE_WORKERS)
+    http_client.configure(
+        pool_size=int(http_cfg.get("POOL_SIZE", max(32, max_workers * 2))),
+        connect_timeout=http_cfg.get("CONNECT_TIMEOUT"),
+        max_retries=http_cfg.get("MAX_RETRIES"),
+        backoff_base=http_cfg.get("BACKOFF_BASE"),
+        backoff_max=http_cfg.get("BACKOFF_MAX")
+    )
+    dify_client.configure(
+        base_url=SECRETS.get("dify", {}).get("BASE_URL"),
+        response_mode=SECRETS.get("dify", {}).get("RESPONSE_MODE"),
+        read_timeout=http_cfg.get("DIFY_READ_TIMEOUT"),
+        retry_read_timeout=http_cfg.get("DIFY_RETRY_READ_TIMEOUT")
+    )
+    wp_cfg = SECRETS.get("wordpress", {})
+    wordpress_client.configure(
+        rate_per_second=wp_cfg.get("RATE_PER_SECOND"),
+        site_concurrency=wp_cfg.get("SITE_CONCURRENCY"),
+        batch_size=wp_cfg.get("BATCH_SIZE"),
+        batch_linger=wp_cfg.get("BATCH_LINGER")
+    )
+    # configure() wołane jest przy każdym przebiegu skryptu Streamlit - backend cache tylko przy zmianie ustawień
+    cache_signature = repr((SECRETS.get("cache"), SECRETS.get("SUPABASE")))
+    if cache_signature != _cache_signature:
+        dify_cache.configure(dify_cache.build_backend(SECRETS, get_supabase), dify_cache.ttl_from_secrets(SECRETS))
+        _cache_signature = cache_signature
+    metrics_signature = repr((SECRETS.get("metrics"), SECRETS.get("SUPABASE")))
+    if metrics_signature != _metrics_signature:
+        metrics_cfg = SECRETS.get("metrics", {})
+        metrics.configure(
+            metrics.build_backend(SECRETS, get_supabase),
+            flush_every=metrics_cfg.get("FLUSH_EVERY"),
+            cost_per_1k_tokens=metrics_cfg.get("COST_PER_1K_TOKENS")
+        )
+        _metrics_signature = metrics_signature
+    runs_signature = repr((SECRETS.get("runs"), SECRETS.get("SUPABASE")))
+    if runs_signature != _runs_signature:
+        runs_cfg = SECRETS.get("runs", {})
+        checkpoints.configure(
+            checkpoints.build_backend(SECRETS, get_supabase),
+            heartbeat_seconds=runs_cfg.get("HEARTBEAT_SECONDS"),
+            stale_after_seconds=runs_cfg.get("STALE_AFTER_SECONDS")
+        )
+        _runs_signature = runs_signature
+    # Zmiana [upstreams] resetuje stan bezpieczników i limitów - tylko przy faktycznej zmianie
+    upstreams_signature = repr(SECRETS.get("upstreams"))
+    if upstreams_signature != _upstreams_signature:
+        upstreams_cfg = SECRETS.get("upstreams", {})
+        upstreams.configure(
+            failure_threshold=upstreams_cfg.get("FAILURE_THRESHOLD"),
+            open_seconds=upstreams_cfg.get("OPEN_SECONDS"),
+            open_max_seconds=upstreams_cfg.get("OPEN_MAX_SECONDS"),
+            max_concurrency=upstreams_cfg.get("MAX_CONCURRENCY"),
+            min_concurrency=upstreams_cfg.get("MIN_CONCURRENCY"),
+            decrease_factor=upstreams_cfg.get("DECREASE_FACTOR"),
+            latency_factor=upstreams_cfg.get("LATENCY_FACTOR"),
+            limits={name: dict(limits) for name, limits in upstreams_cfg.get("limits", {}).items()}
+        )
+        _upstreams_signature = upstreams_signature
+    blobs_signature = repr((SECRETS.get("blobs"), SECRETS.get("SUPABASE")))
+    if blobs_signature != _blobs_signature:
+        blobs_cfg = SECRETS.get("blobs", {})
+        blob_store.configure(
+            blob_store.build_backend(SECRETS, get_supabase),
+            columns=blobs_cfg.get("COLUMNS"),
+            min_bytes=blobs_cfg.get("MIN_BYTES"),
+            compression=blobs_cfg.get("COMPRESSION"),
+            level=blobs_cfg.get("LEVEL"),
+            cache_mb=blobs_cfg.get("CACHE_MB"),
+            gc_grace_hours=blobs_cfg.get("GC_GRACE_HOURS")
+        )
+        _blobs_signature = blobs_signature
+    content_cfg = SECRETS.get("content", {})
+    content_processing.configure(
+        anchors=content_cfg.get("ANCHORS"),
+        toc=content_cfg.get("TOC"),
+        toc_min_headings=content_cfg.get("TOC_MIN_HEADINGS"),
+        toc_title=content_cfg.get("TOC_TITLE"),
+        sanitize=content_cfg.get("SANITIZE"),
+        minify=content_cfg.get("MINIFY")
+    )
+    scheduler_cfg = SECRETS.get("scheduler", {})
+    scheduler.configure(
+        enabled=scheduler_cfg.get("ENABLED"),
+        max_workers=scheduler_cfg.get("MAX_WORKERS"),
+        urgent_hours=scheduler_cfg.get("URGENT_HOURS"),
+        class_weights=scheduler_cfg.get("class_weights"),
+        operator_weights=scheduler_cfg.get("operator_weights"),
+        project_weights=scheduler_cfg.get("project_weights")
+    )
+
+def load_secrets(path=DEFAULT_SECRETS_PATH):
+    """Wczytuje plik secrets.toml poza Streamlit (np. w workerze)."""
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11 - pakiet toml instalowany razem ze Streamlit
+        import toml
+        return toml.load(path)
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+# Sekcje secrets.toml - zmienne środowiskowe CF_<SEKCJA>__<KLUCZ> trafiają do sekcji o tej nazwie
+SECRET_SECTIONS = ["general", "SUPABASE", "dify", "batch", "http", "wordpress", "metrics", "runs", "queue", "cache"]
+ENV_PREFIX = "CF_"
+
+def _env_value(value):
+    # Liczby i true/false jak w TOML, reszta jako tekst; JSON pozwala podać całą podsekcję (np. WORDPRESS__SITES)
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+def secrets_from_env(environ=None, prefix=ENV_PREFIX):
+    """Sekcje secrets ze zmiennych środowiskowych, np. CF_SUPABASE__URL, CF_DIFY__API_KEY_RESEARCH, CF_BATCH__WORKERS_RAG."""
+    sections = {name.lower(): name for name in SECRET_SECTIONS}
+    secrets = {}
+    for name, value in (os.environ if environ is None else environ).items():
+        if not name.startswith(prefix) or "__" not in name:
+            continue
+        section, key = name[len(prefix):].split("__", 1)
+        section = sections.get(section.lower(), section.lower())
+        value = _env_value(value)
+        # Klucze w secrets.toml są wielkimi literami, podsekcje (np. [wordpress.sites]) małymi
+        secrets.setdefault(section, {})[key.lower() if isinstance(value, dict) else key.upper()] = value
+    return secrets
+
+def load_config(path=DEFAULT_SECRETS_PATH, environ=None):
+    """secrets.toml (jeśli istnieje) nadpisany zmiennymi CF_* - konfiguracja dla cron/CI bez pliku secrets."""
+    secrets = load_secrets(path) if path and os.path.exists(path) else {}
+    for section, values in secrets_from_env(environ).items():
+        secrets[section] = {**secrets.get(section, {}), **values}
+    if not secrets.get("SUPABASE"):
+        raise ValueError(f"Brak konfiguracji Supabase: plik {path} lub zmienne {ENV_PREFIX}SUPABASE__URL / {ENV_PREFIX}SUPABASE__KEY.")
+    return secrets
+
+def get_supabase():
+    global _supabase_client
+    with _supabase_lock:
+        if _supabase_client is None:
+            # Import przy pierwszym połączeniu - sam import silnika (CLI, worker) jest szybki i bez efektów ubocznych
+            from supabase import create_client
+            _supabase_client = create_client(SECRETS["SUPABASE"]["URL"], SECRETS["SUPABASE"]["KEY"])
+        return _supabase_client
+
+def default_stage_workers(status_col_db):
+    secret_key = f"WORKERS_{status_col_db.replace('status_', '').upper()}"
+    batch_cfg = SECRETS.get("batch", {})
+    return int(batch_cfg.get(secret_key, DEFAULT_STAGE_WORKERS[status_col_db]))
+
+# --- OBSŁUGA DANYCH ---
+def rename_to_ui(record):
+    return {COLUMN_MAP.get(k, k): v for k, v in record.items()}
+
+@contextmanager
+def db_call(name, **fields):
+    """Zapytanie batcha do Supabase: pomiar w metrics + limit i bezpiecznik upstreamu "supabase"."""
+    with metrics.timed("db", name, **fields), upstreams.guard("supabase"):
+        yield
+
+def fetch_row(row_id):
+    """Pobiera pełny wiersz zadania (nazwy kolumn jak w UI) lub None."""
+    with db_call("fetch_row", row_id=row_id):
+        response = get_supabase().table("seo_content_tasks").select("*").eq("id", row_id).limit(1).execute()
+    return rename_to_ui(blob_store.resolve(response.data)[0]) if response.data else None
+
+# Lekka projekcja dla siatki w UI: identyfikacja, statusy i krótkie kolumny edytowalne.
+# Pozostałe (ciężkie) kolumny pobierane są na żądanie - podgląd wiersza, batch, eksport.
+# Przy włączonym [blobs] ciężkie kolumny trzymają referencje, a treść jest rozwijana z magazynu
+# blobów tylko w zapytaniach, które o te kolumny proszą (blob_store.resolve).
+GRID_COLUMNS = [
+    'id', 'keyword', 'language', 'aio_prompt', 'project', 'priority', 'publish_by',
+    'status_research', 'status_headers', 'status_rag', 'status_brief', 'status_writing', 'status_publication',
+    'headers_final', 'instructions', 'publication_link', 'wp_site', 'wp_post_id', 'wp_categories', 'wp_tags', 'featured_image_url',
+    'updated_at'
+]
+HEAVY_COLUMNS = [c for c in COLUMN_MAP if c not in GRID_COLUMNS]
+
+FETCH_CHUNK = 200
+
+def _apply_filters(query, filters):
+    # filters: {kolumna_db: fragment} - dopasowanie jak str.contains, ale po stronie bazy
+    for col, pattern in (filters or {}).items():
+        if pattern == PENDING_STATUS:
+            # Wiersze sprzed dodania kolumny statusu mają NULL zamiast domyślnego "Oczekuje" - ilike go nie dopasuje
+            query = query.or_(f"{col}.is.null,{col}.ilike.*{PENDING_STATUS}*")
+        else:
+            query = query.ilike(col, f"%{pattern}%")
+    return query
+
+def fetch_table_version():
+    """(liczba wierszy, najnowszy updated_at) - jedno lekkie zapytanie do sprawdzenia, czy tabela się zmieniła."""
+    response = get_supabase().table("seo_content_tasks").select("updated_at", count="exact") \
+        .order("updated_at", desc=True, nullsfirst=False).limit(1).execute()
+    return response.count or 0, (response.data[0]["updated_at"] if response.data else None)
+
+def fetch_changed_ids(updated_after, limit=1000):
+    """[(id, updated_at)] wierszy zmienionych po `updated_after` - kanał zmian siatki (live_updates, polling)."""
+    response = get_supabase().table("seo_content_tasks").select("id,updated_at").gt("updated_at", updated_after) \
+        .order("updated_at").limit(limit).execute()
+    return [(r["id"], r["updated_at"]) for r in response.data or []]
+
+def fetch_grid_page(page=0, page_size=100, filters=None, columns=None):
+    """Strona siatki (najnowsze pierwsze), filtrowana po stronie bazy. Zwraca (rekordy UI, liczba pasujących)."""
+    query = get_supabase().table("seo_content_tasks").select(",".join(columns or GRID_COLUMNS), count="exact")
+    start = page * page_size
+    response = _apply_filters(query, filters).order("id", desc=True).range(start, start + page_size - 1).execute()
+    return [rename_to_ui(r) for r in blob_store.resolve(response.data or [])], response.count or 0
+
+def fetch_rows(row_ids, columns="*", updated_since=None):
+    """Wybrane wiersze (domyślnie wszystkie kolumny), pobierane porcjami po FETCH_CHUNK id."""
+    ids = [int(i) for i in row_ids]
+    rows = []
+    for i in range(0, len(ids), FETCH_CHUNK):
+        query = get_supabase().table("seo_content_tasks").select(columns).in_("id", ids[i:i + FETCH_CHUNK])
+        if updated_since:
+            query = query.gt("updated_at", updated_since)
+        with db_call("fetch_rows"):
+            records = query.execute().data or []
+        rows.extend(rename_to_ui(r) for r in blob_store.resolve(records))
+    return rows
+
+def iter_record_pages(columns="*", page_size=500, filters=None, resolve=True):
+    """Cała tabela stronami (keyset po id, bez OFFSET) - rekordy z nazwami kolumn z bazy (resolve=False: referencje blobów)."""
+    if columns != "*" and "id" not in columns.split(","):
+        columns = "id," + columns
+    last_id = None
+    while True:
+        query = _apply_filters(get_supabase().table("seo_content_tasks").select(columns), filters)
+        if last_id is not None:
+            query = query.lt("id", last_id)
+        records = query.order("id", desc=True).limit(page_size).execute().data or []
+        if not records:
+            return
+        yield blob_store.resolve(records) if resolve else records
+        last_id = records[-1]["id"]
+
+def update_db_record(row_id, updates, offload=True):
+    """Zapis wiersza; długie wartości ciężkich kolumn trafiają do magazynu blobów (offload=False - zostają w wierszu)."""
+    if offload:
+        updates = blob_store.offload(updates)
+    with db_call("update_row", row_id=row_id, request_bytes=sum(len(str(v or "")) for v in updates.values())):
+        get_supabase().table("seo_content_tasks").update(updates).eq("id", row_id).execute()
+
+def compact_rows(row_ids=None, dry_run=False, page_size=100):
+    """
+    Przenosi długie wartości ciężkich kolumn zapisane jeszcze w wierszach do magazynu blobów.
+    Zapis warunkowy po updated_at - wiersz zmieniony w międzyczasie (np. przez etap) jest pomijany.
+    """
+    columns = [c for c in blob_store.BLOB_SETTINGS["columns"] if c in COLUMN_MAP]
+    min_bytes = int(blob_store.BLOB_SETTINGS["min_bytes"])
+    select = ",".join(["id", "updated_at"] + columns)
+    if row_ids is None:
+        pages = iter_record_pages(select, page_size, resolve=False)
+    else:
+        ids = [int(i) for i in row_ids]
+        pages = (get_supabase().table("seo_content_tasks").select(select).in_("id", ids[i:i + page_size]).execute().data or []
+                 for i in range(0, len(ids), page_size))
+    stats = {"rows": 0, "values": 0, "bytes_inline": 0, "bytes_refs": 0, "skipped": 0}
+    for records in pages:
+        for record in records:
+            inline = {c: record[c] for c in columns
+                      if isinstance(record.get(c), str) and len(record[c]) >= min_bytes and not blob_store.is_ref(record[c])}
+            if not inline:
+                continue
+            stats["rows"] += 1
+            stats["values"] += len(inline)
+            stats["bytes_inline"] += sum(len(v.encode("utf-8")) for v in inline.values())
+            if dry_run:
+                continue
+            updates = blob_store.offload(inline)
+            stats["bytes_refs"] += sum(len(v) for v in updates.values())
+            with db_call("compact_row", row_id=record["id"]):
+                response = get_supabase().table("seo_content_tasks").update(updates) \
+                    .eq("id", record["id"]).eq("updated_at", record["updated_at"]).execute()
+            if not response.data:
+                stats["skipped"] += 1
+    return stats
+
+def collect_blob_garbage(dry_run=False):
+    """Usuwa bloby, do których nie prowadzi żadna referencja w seo_content_tasks (starsze niż [blobs] GC_GRACE_HOURS)."""
+    columns = sorted(set(HEAVY_COLUMNS) | {c for c in blob_store.BLOB_SETTINGS["columns"] if c in COLUMN_MAP})
+    started = time.time()
+    referenced = set()
+    for records in iter_record_pages(",".join(columns), page_size=200, resolve=False):
+        referenced |= blob_store.referenced_keys(records)
+    return blob_store.collect_garbage(referenced, dry_run, started)
+
+def fetch_stage_statuses(row_id):
+    """Zwraca {etap: status} dla wiersza - bez pobierania ciężkich kolumn."""
+    cols = ",".join(spec['status_col'] for spec in STAGES.values())
+    with db_call("fetch_statuses", row_id=row_id):
+        response = get_supabase().table("seo_content_tasks").select(cols).eq("id", row_id).limit(1).execute()
+    record = response.data[0] if response.data else {}
+    return {stage: record.get(spec['status_col']) for stage, spec in STAGES.items()}
+
+def fetch_stage_status_map(row_ids):
+    """{id wiersza: {etap: status}} dla wielu wierszy - tylko id i kolumny statusów, porcjami po FETCH_CHUNK."""
+    cols = ",".join(["id"] + [spec['status_col'] for spec in STAGES.values()])
+    ids = [int(i) for i in row_ids]
+    statuses = {}
+    for i in range(0, len(ids), FETCH_CHUNK):
+        with db_call("fetch_statuses"):
+            response = get_supabase().table("seo_content_tasks").select(cols).in_("id", ids[i:i + FETCH_CHUNK]).execute()
+        for record in response.data or []:
+            statuses[record["id"]] = {stage: record.get(spec['status_col']) for stage, spec in STAGES.items()}
+    return statuses
+
+def mark_stages_status(row_ids, stages, status):
+    """Ustawia ten sam status wielu etapom wielu wierszy (jedno zapytanie na FETCH_CHUNK id)."""
+    if not row_ids or not stages: return
+    updates = {STAGES[stage]['status_col']: status for stage in stages}
+    ids = [int(i) for i in row_ids]
+    for i in range(0, len(ids), FETCH_CHUNK):
+        with db_call("mark_statuses"):
+            get_supabase().table("seo_content_tasks").update(updates).in_("id", ids[i:i + FETCH_CHUNK]).execute()
+
+# --- DIFY + PODGLĄD POSTĘPU ---
+# (row_id, etykieta etapu) -> nazwa bieżącego węzła workflow. Wypełniane w trybie streaming,
+# czytane przez UI w trakcie batcha.
+ROW_PROGRESS = {}
+
+def submit_in_context(pool, fn, *args, task=None):
+    """
+    pool.submit() z kopią contextvars (m.in. zakres cache i metryk batcha) - wątki puli jej nie dziedziczą.
+    Kopia zapamiętuje moment zlecenia, więc zadanie zna swój czas oczekiwania w kolejce puli.
+    task (scheduler.Task) - priorytet, termin i projekt wiersza dla puli harmonogramu.
+    """
+    ctx = contextvars.copy_context()
+    ctx.run(metrics.mark_submitted)
+    if task is not None:
+        return pool.submit_task(task, ctx.run, fn, *args)
+    return pool.submit(ctx.run, fn, *args)
+
+def run_stage_workflow(row, stage, label, api_key, inputs):
+    key = (row['ID'], label)
+
+    def on_event(name, data):
+        if name == "node_started":
+            ROW_PROGRESS[key] = data.get('title') or data.get('node_type') or name
+
+    started = time.perf_counter()
+    resp = {}
+    try:
+        resp = dify_cache.cached_call(
+            stage, api_key, inputs, lambda: run_dify_workflow(api_key, inputs, on_event=on_event, upstream=f"dify:{stage}")
+        )
+        return resp
+    finally:
+        ROW_PROGRESS.pop(key, None)
+        cache_hit = resp.get("metrics", {}).get("cache") == "hit"
+        metrics.record(
+            "dify", stage, row_id=row['ID'], wall_s=time.perf_counter() - started,
+            ok="data" in resp and resp["data"].get("outputs") is not None,
+            request_bytes=sum(len(str(v or "")) for v in inputs.values()),
+            tokens=None if cache_hit else (resp.get("data") or {}).get("total_tokens"),
+            detail="cache" if cache_hit else str(resp.get("error") or "")[:200] or None
+        )
+
+def extract_headers_from_text(text):
+    return content_processing.extract_headers(text)
+
+# --- LOGIKA BIZNESOWA (ETAPY) ---
+
+def stage_research(row):
+    inputs = {"keyword": row['Słowo kluczowe'], "language": row['Język'], "aio": row['AIO'] if row['AIO'] else ""}
+    resp = run_stage_workflow(row, 'research', "Research", SECRETS['dify']['API_KEY_RESEARCH'], inputs)
+    if "data" in resp and "outputs" in resp["data"]:
+        out = resp["data"]["outputs"]
+        return {
+            "status_research": "✅ Gotowe",
+            "serp_phrases": out.get("frazy z serp", ""),
+            "senuto_phrases": out.get("frazy_senuto", ""),
+            "info_graph": out.get("grafinformacji", ""),
+            "competitors_headers": out.get("naglowki", ""),
+            "knowledge_graph": out.get("knowledge_graph", "")
+        }
+    else:
+        raise Exception(f"Dify Error: {resp.get('error', 'Unknown error')}")
+
+def stage_headers(row):
+    frazy_full = f"{row['Frazy z wyników']}\n{row['Frazy Senuto']}"
+    inputs = {"keyword": row['Słowo kluczowe'], "language": row['Język'], "frazy": frazy_full, "graf": row['Graf informacji'], "headings": row['Nagłówki konkurencji']}
+    resp = run_stage_workflow(row, 'headers', "Nagłówki", SECRETS['dify']['API_KEY_HEADERS'], inputs)
+    if "data" in resp and "outputs" in resp["data"]:
+        out = resp["data"]["outputs"]
+        h2 = out.get("naglowki_h2", "")
+        questions = out.get("naglowki_pytania", "")
+        final_headers = row['Nagłówki (Finalne)']
+        if not final_headers: final_headers = questions if questions else h2
+        return {
+            "status_headers": "✅ Gotowe",
+            "headers_expanded": out.get("naglowki_rozbudowane", ""),
+            "headers_h2": h2,
+            "headers_questions": questions,
+            "headers_final": final_headers
+        }
+    else:
+        raise Exception(f"Dify Error: {resp.get('error', 'Unknown error')}")
+
+def stage_rag(row):
+    inputs = {"keyword": row['Słowo kluczowe'], "language": row['Język'], "headings": row['Nagłówki konkurencji']}
+    resp = run_stage_workflow(row, 'rag', "RAG", SECRETS['dify']['API_KEY_RAG'], inputs)
+    if "data" in resp and "outputs" in resp["data"]:
+        out = resp["data"]["outputs"]
+        return {"status_rag": "✅ Gotowe", "rag_content": out.get("dokladne", ""), "rag_general": out.get("ogolne", "")}
+    else:
+        raise Exception(f"Dify Error: {resp.get('error', 'Unknown error')}")
+
+def stage_brief(row):
+    h2_source = row['Nagłówki H2'] if row['Nagłówki H2'] else row['Nagłówki (Finalne)']
+    if not h2_source: raise Exception("Brak nagłówków H2 do stworzenia briefu.")
+    frazy_full = f"{row['Frazy z wyników']}\n{row['Frazy Senuto']}"
+    inputs = {"keyword": row['Słowo kluczowe'], "keywords": frazy_full, "headings": h2_source, "knowledge_graph": row['Knowledge graph'], "information_graph": row['Graf informacji']}
+    resp = run_stage_workflow(row, 'brief', "Brief", SECRETS['dify']['API_KEY_BRIEF'], inputs)
+    if "data" in resp and "outputs" in resp["data"]:
+        out = resp["data"]["outputs"]
+        return {"status_brief": "✅ Gotowe", "brief_json": out.get("brief", ""), "brief_html": out.get("html", "")}
+    else:
+        raise Exception(f"Dify Error: {resp.get('error', 'Unknown error')}")
+
+def summarize_section(section_html, max_chars=SECTION_SUMMARY_CHARS):
+    text = content_processing.plain_text(section_html)
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
+
+def build_outline_context(headers_list, current_idx, summaries):
+    """Kompaktowy kontekst dla trybu równoległego: plan artykułu + streszczenia gotowych sekcji."""
+    lines = ["Plan artykułu:"]
+    for i, h in enumerate(headers_list):
+        marker = "  <-- PISZESZ TĘ SEKCJĘ" if i == current_idx else ""
+        lines.append(f"{i + 1}. {h}{marker}")
+        if i in summaries:
+            lines.append(f"   Streszczenie: {summaries[i]}")
+    return "\n".join(lines)
+
+def write_section(row, h2, done, full_knowledge, full_keywords, label="Generacja"):
+    """Generuje jedną sekcję H2. Zwraca (html_sekcji, treść, statystyki)."""
+    inputs = {
+        "naglowek": h2, "language": row['Język'], "knowledge": full_knowledge, "keywords": full_keywords,
+        "headings": row['Nagłówki rozbudowane'], "done": done, "keyword": row['Słowo kluczowe'], "instruction": row['Dodatkowe instrukcje']
+    }
+    started = time.perf_counter()
+    queue_wait = metrics.queue_wait()
+    resp = run_stage_workflow(row, 'writing', label, SECRETS['dify']['API_KEY_WRITE'], inputs)
+    stats = {
+        "header": h2,
+        "seconds": round(time.perf_counter() - started, 2),
+        "input_chars": sum(len(str(v or "")) for v in inputs.values()),
+        "done_chars": len(done)
+    }
+    if "data" in resp and "outputs" in resp["data"]:
+        section = resp["data"]["outputs"].get("result", "")
+        stats["output_chars"] = len(section)
+        stats["tokens"] = resp["data"].get("total_tokens")
+        stats["ttfb_s"] = resp.get("metrics", {}).get("ttfb_s")
+        metrics.record(
+            "section", "writing", row_id=row['ID'], wall_s=stats["seconds"], queue_wait_s=queue_wait, ok=True,
+            request_bytes=stats["input_chars"], response_bytes=stats["output_chars"], tokens=stats["tokens"]
+        )
+        return f"<h2>{h2}</h2>\n{section}\n\n", section, stats
+    stats["error"] = str(resp.get('error'))[:200]
+    metrics.record(
+        "section", "writing", row_id=row['ID'], wall_s=stats["seconds"], queue_wait_s=queue_wait, ok=False,
+        request_bytes=stats["input_chars"], detail=stats["error"]
+    )
+    return f"<h2>{h2}</h2>\n[BŁĄD GENEROWANIA: {resp.get('error')}]\n\n", "", stats
+
+def load_writing_checkpoint(row, headers_list):
+    """Gotowe sekcje przerwanej generacji tego samego planu nagłówków: {indeks: {"html", "text", "stats"}}."""
+    raw = row.get('writing_checkpoint')
+    if not raw or dify_cache.force_refresh_requested():
+        return {}
+    try:
+        checkpoint = json.loads(raw) if isinstance(raw, str) else raw
+    except ValueError:
+        return {}
+    if checkpoint.get("headers") != headers_list:
+        return {}
+    return {int(i): section for i, section in (checkpoint.get("sections") or {}).items() if int(i) < len(headers_list)}
+
+def stage_writing(row, writing_config=None):
+    headers_text = row['Nagłówki (Finalne)']
+    headers_list = extract_headers_from_text(headers_text)
+    if not headers_list: raise Exception("Pusta kolumna 'Nagłówki (Finalne)'.")
+    full_knowledge = f"{row['RAG']}\n{row['RAG General']}"
+    full_keywords = f"{row['Frazy z wyników']}, {row['Frazy Senuto']}"
+
+    writing_config = writing_config or {}
+    mode = writing_config.get('mode', 'sequential')
+    started = time.perf_counter()
+    parts = content_processing.ArticleBuilder(len(headers_list))
+    section_stats = [None] * len(headers_list)
+
+    # Wznowienie po awarii: sekcje zapisane w checkpoincie nie są generowane ponownie
+    saved = load_writing_checkpoint(row, headers_list)
+    for i, section in saved.items():
+        parts[i], section_stats[i] = section["html"], section["stats"]
+    checkpoint = {"headers": headers_list, "sections": {str(i): section for i, section in saved.items()}}
+
+    def persist_progress(i, section):
+        # Zapis częściowego artykułu i gotowych sekcji po każdej sekcji - awaria w połowie traci najwyżej jedną sekcję
+        if section:
+            checkpoint["sections"][str(i)] = {"html": parts[i], "text": section, "stats": section_stats[i]}
+        # Częściowy artykuł zostaje w wierszu - blob na każdą sekcję byłby od razu śmieciem w magazynie
+        update_db_record(row['ID'], {"final_article": parts.html(), "writing_checkpoint": json.dumps(checkpoint, ensure_ascii=False)}, offload=False)
+
+    if mode == 'parallel':
+        # Fale sekcji: w obrębie fali wszystko równolegle, kolejne fale widzą streszczenia poprzednich
+        wave_size = int(writing_config.get('wave_size') or 0) or len(headers_list)
+        summaries = {i: summarize_section(section["text"]) for i, section in saved.items()}
+        # Wątki sekcji ograniczone limitem równoległości workflow pisania - fala większa niż limit
+        # czekałaby w upstreams.slot(), zajmując wątki bez żadnej pracy
+        workers = min(wave_size, upstreams.get("dify:writing").max_concurrency)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="section") as pool:
+            for wave_start in range(0, len(headers_list), wave_size):
+                wave = [i for i in range(wave_start, min(wave_start + wave_size, len(headers_list))) if i not in saved]
+                if not wave:
+                    continue
+                futures = {
+                    submit_in_context(
+                        pool, write_section, row, headers_list[i], build_outline_context(headers_list, i, summaries),
+                        full_knowledge, full_keywords, f"Generacja {i + 1}/{len(headers_list)}"
+                    ): i
+                    for i in wave
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    parts[i], section, section_stats[i] = future.result()
+                    if section:
+                        summaries[i] = summarize_section(section)
+                    persist_progress(i, section)
+    else:
+        for i, h2 in enumerate(headers_list):
+            if i not in saved:
+                parts[i], section, section_stats[i] = write_section(
+                    row, h2, parts.html(upto=i), full_knowledge, full_keywords, f"Generacja {i + 1}/{len(headers_list)}"
+                )
+                persist_progress(i, section)
+
+    stats = {
+        "mode": mode,
+        "wave_size": writing_config.get('wave_size') if mode == 'parallel' else None,
+        "sections": section_stats,
+        "resumed_sections": len(saved),
+        "wall_seconds": round(time.perf_counter() - started, 2),
+        "sum_section_seconds": round(sum(s["seconds"] for s in section_stats), 2),
+        "total_input_chars": sum(s["input_chars"] for s in section_stats),
+        "total_tokens": sum(s.get("tokens") or 0 for s in section_stats)
+    }
+    return {
+        "status_writing": "✅ Gotowe", "final_article": parts.html(), "writing_stats": json.dumps(stats, ensure_ascii=False),
+        "writing_checkpoint": None
+    }
+
+def _optional_int(value):
+    # Wartości z siatki pandas: None / NaN / "" / liczba / tekst z liczbą
+    try:
+        return int(float(value)) or None
+    except (TypeError, ValueError):
+        return None
+
+def _optional_text(value):
+    return value.strip() if isinstance(value, str) and value.strip() else None
+
+# --- STRONY WORDPRESS ---
+# Rejestr stron: [wordpress.sites.<nazwa>] w secrets (URL, USER, KEY, opcjonalnie MAX_CONCURRENCY,
+# RATE_PER_SECOND). Wiersz z kolumną "Strona WP" trafia na wskazaną stronę, pozostałe na stronę
+# domyślną z paska bocznego (wp_config: nazwa z rejestru albo url/user/key wpisane ręcznie).
+def wp_sites():
+    return SECRETS.get("wordpress", {}).get("sites", {})
+
+# Login i hasło aplikacji nie trafiają do kolejki zadań ani do rejestru przebiegów. Worker i wznowienie
+# biorą je z rejestru stron we własnych secrets - po nazwie strony albo po jej adresie.
+WP_CREDENTIAL_FIELDS = ('user', 'key')
+
+def wp_config_reference(wp_config):
+    """wp_config bez danych logowania (nazwa strony i adres zostają)."""
+    if not wp_config:
+        return wp_config
+    return {k: v for k, v in wp_config.items() if k not in WP_CREDENTIAL_FIELDS}
+
+def stage_args_reference(stage_args):
+    """Argumenty etapów do zapisu poza procesem - publikacja jako wp_config_reference()."""
+    if not stage_args or not stage_args.get('publication'):
+        return stage_args
+    return {**stage_args, 'publication': wp_config_reference(stage_args['publication'])}
+
+def with_wp_credentials(stage_args, wp_config):
+    """Argumenty etapów z rejestru przebiegów + login i hasło z wp_config, jeśli dotyczy tej samej strony (adresu)."""
+    publication = (stage_args or {}).get('publication')
+    wp_config = wp_config or {}
+    if not publication or publication.get('key') or not wp_config.get('key') or not publication.get('url'):
+        return stage_args
+    if normalize_url(publication['url'].strip()) != normalize_url((wp_config.get('url') or '').strip()):
+        return stage_args
+    return {**stage_args, 'publication': {**publication, 'user': wp_config.get('user'), 'key': wp_config['key']}}
+
+def wp_site_by_url(url):
+    """Nazwa strony z rejestru o tym adresie albo None."""
+    if not url:
+        return None
+    url = normalize_url(url.strip())
+    return next((name for name, cfg in wp_sites().items() if cfg.get("URL") and normalize_url(cfg["URL"]) == url), None)
+
+def wp_reference_resolvable(wp_config):
+    """Czy strona domyślna z referencji (bez danych logowania) da się odtworzyć z rejestru stron."""
+    wp_config = wp_config or {}
+    return bool(wp_config.get('site') or wp_site_by_url(wp_config.get('url')))
+
+def _site_target(name):
+    cfg = wp_sites().get(name)
+    if cfg is None:
+        raise Exception(f"Nieznana strona WP: '{name}' (brak [wordpress.sites.{name}] w secrets).")
+    return {
+        "name": name, "url": cfg.get("URL"), "user": cfg.get("USER"), "key": cfg.get("KEY"),
+        "max_concurrency": cfg.get("MAX_CONCURRENCY"), "rate_per_second": cfg.get("RATE_PER_SECOND")
+    }
+
+def resolve_wp_target(row, wp_config):
+    """Docelowa strona WP wiersza: kolumna "Strona WP", potem strona domyślna z wp_config."""
+    name = _optional_text(row.get('Strona WP')) or (wp_config or {}).get('site')
+    if name:
+        return _site_target(name)
+    wp_config = wp_config or {}
+    if not wp_config.get('key'):
+        # Referencja z kolejki lub rejestru przebiegów - dane logowania z rejestru stron po adresie
+        name = wp_site_by_url(wp_config.get('url'))
+        if name:
+            return _site_target(name)
+    return {"name": None, "url": wp_config.get('url'), "user": wp_config.get('user'), "key": wp_config.get('key'),
+            "max_concurrency": None, "rate_per_second": None}
+
+def stage_publication(row, wp_config):
+    """Etap 6: Publikacja w WP. Wiersz z zapisanym ID wpisu aktualizuje istniejący wpis zamiast tworzyć duplikat."""
+    content = row['Generowanie contentu']
+    title = row['Słowo kluczowe']
+    
+    if not content or len(content) < 50:
+        raise Exception("Brak wygenerowanej treści do publikacji.")
+    
+    target = resolve_wp_target(row, wp_config)
+    if not target['url'] or not target['user'] or not target['key']:
+        raise Exception("Brak konfiguracji WordPress.")
+
+    # Kotwice, spis treści, sanityzacja i minifikacja ([content] w secrets); artykuł w bazie zostaje bez zmian
+    with metrics.timed("content", "prepare_for_publication", row_id=row['ID'], request_bytes=len(content)) as m:
+        content, report = content_processing.prepare_for_publication(content, language=row.get('Język'))
+        m["response_bytes"] = report["bytes_out"]
+
+    result = publish_post(
+        target['url'],
+        target['user'],
+        target['key'],
+        title,
+        content,
+        post_id=_optional_int(row.get('ID wpisu WP')),
+        categories=split_terms(row.get('Kategorie WP')),
+        tags=split_terms(row.get('Tagi WP')),
+        featured_image_url=_optional_text(row.get('Obrazek wyróżniający (URL)')),
+        rate_per_second=target['rate_per_second'],
+        max_concurrency=target['max_concurrency']
+    )
+    
+    if result['success']:
+        return {
+            "status_publication": "✅ Zaktualizowano (Draft)" if result.get('updated') else "✅ Opublikowano (Draft)",
+            "publication_link": result['link'],
+            "wp_post_id": result['id']
+        }
+    else:
+        raise Exception(f"WP Error: {result['message']}")
+
+def _thread_pool(workers, thread_name_prefix, upstream=None):
+    # Przy włączonym harmonogramie wątki są wspólne dla procesu, a `workers` to limit tej puli
+    if scheduler.enabled():
+        return scheduler.ScheduledExecutor(workers, upstream=upstream, name=thread_name_prefix)
+    return ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix=thread_name_prefix)
+
+class SitePoolExecutor:
+    """
+    Pula publikacji z osobną pulą wątków na każdą stronę WP (rozmiar = limit równoległości strony).
+    Wiersze wolnej strony czekają w jej własnej kolejce, zamiast zajmować wątki wspólnej puli.
+    """
+
+    def __init__(self, wp_config, thread_name_prefix="publication"):
+        self.wp_config = wp_config
+        self.thread_name_prefix = thread_name_prefix
+        # Pule stron powstają przy pierwszym wierszu strony - z operatorem i klasą batcha z chwili utworzenia
+        self.flow = scheduler.current_flow()
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def pool_for(self, row):
+        try:
+            target = resolve_wp_target(row, self.wp_config)
+            key = target['name'] or target['url'] or ""
+            workers = target['max_concurrency'] or wordpress_client.WP_SETTINGS["site_concurrency"]
+        except Exception:
+            # Nieznana strona - etap zgłosi błąd w wierszu, wystarczy dowolna pula
+            key, workers = "", 1
+        with self._lock:
+            if key not in self._pools:
+                with scheduler.flow_scope(*self.flow):
+                    self._pools[key] = _thread_pool(workers, f"{self.thread_name_prefix}-{len(self._pools)}")
+            return self._pools[key]
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+def stage_executor(stage, workers, stage_args=None, thread_name_prefix=None):
+    """
+    Pula wątków etapu - dla publikacji pula per strona WP (SitePoolExecutor).
+    Przy włączonym [scheduler] pula w harmonogramie (operator i klasa batcha z scheduler.flow_scope).
+    """
+    prefix = thread_name_prefix or f"stage-{stage}"
+    if stage == 'publication':
+        return SitePoolExecutor(stage_args, prefix)
+    return _thread_pool(workers, prefix, upstream=f"dify:{stage}")
+
+def row_task(row):
+    """Priorytet, termin publikacji i projekt wiersza dla harmonogramu."""
+    return scheduler.row_task(row.get('Priorytet'), row.get('Publikuj do'), row.get('Projekt'))
+
+def submit_row(executor, row, fn, *args):
+    """submit_in_context() do puli etapu; SitePoolExecutor wybiera pulę strony wiersza, harmonogram - miejsce w kolejce."""
+    pool = executor.pool_for(row) if isinstance(executor, SitePoolExecutor) else executor
+    task = row_task(row) if isinstance(pool, scheduler.ScheduledExecutor) else None
+    return submit_in_context(pool, fn, *args, task=task)
+
+
+# --- REJESTR ETAPÓW ---
+STAGES = {
+    'research': {'func': stage_research, 'status_col': 'status_research'},
+    'headers': {'func': stage_headers, 'status_col': 'status_headers'},
+    'rag': {'func': stage_rag, 'status_col': 'status_rag'},
+    'brief': {'func': stage_brief, 'status_col': 'status_brief'},
+    'writing': {'func': stage_writing, 'status_col': 'status_writing'},
+    'publication': {'func': stage_publication, 'status_col': 'status_publication'}
+}
+
+# --- PRZETWARZANIE WIERSZA ---
+def _stage_tokens(updates):
+    # Generacja raportuje tokeny wszystkich sekcji w writing_stats; pozostałe etapy - w zdarzeniach "dify"
+    try:
+        return json.loads(updates["writing_stats"])["total_tokens"]
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def process_single_row(row, process_func, status_col_db, extra_args=None, stop_event=None):
+    """
+    Przetwarza jeden wiersz w wątku workera. Zwraca None, jeśli batch zatrzymano przed startem
+    albo wiersz wstrzymano, bo bezpiecznik usługi (Dify, Supabase, WP) jest otwarty.
+    """
+    if stop_event is not None and stop_event.is_set():
+        return None
+
+    row_id = row['ID']
+    stage_name = status_col_db.replace('status_', '')
+    queue_wait = metrics.queue_wait()
+    started = time.perf_counter()
+    try:
+        update_db_record(row_id, {status_col_db: IN_PROGRESS_STATUS})
+        # Przekazanie dodatkowych argumentów (np. konfig WP)
+        if extra_args:
+            updates = process_func(row, extra_args)
+        else:
+            updates = process_func(row)
+
+        update_db_record(row_id, updates)
+        # Wyniki trafiają też do wiersza w pamięci - kolejny etap pipeline'u nie musi go pobierać z bazy
+        row.update(rename_to_ui(updates))
+        metrics.record(
+            "stage", stage_name, row_id=row_id, wall_s=time.perf_counter() - started, queue_wait_s=queue_wait, ok=True,
+            response_bytes=sum(len(str(v or "")) for v in updates.values()), tokens=_stage_tokens(updates)
+        )
+        return True, None
+    except upstreams.CircuitOpenError as e:
+        # Usługa leży - wiersz czeka na wznowienie zamiast zużywać próbę i dostawać ❌
+        try:
+            update_db_record(row_id, {status_col_db: upstream_paused_status(e.upstream)})
+        except Exception:
+            pass  # Supabase też niedostępny - status zostaje, przebieg i tak jest do wznowienia
+        metrics.record(
+            "stage", stage_name, row_id=row_id, wall_s=time.perf_counter() - started, queue_wait_s=queue_wait, ok=False,
+            detail=str(e)[:200]
+        )
+        return None
+    except Exception as e:
+        error_msg = str(e)[:100]
+        update_db_record(row_id, {status_col_db: f"❌ Błąd: {error_msg}"})
+        metrics.record(
+            "stage", stage_name, row_id=row_id, wall_s=time.perf_counter() - started, queue_wait_s=queue_wait, ok=False,
+            detail=error_msg
+        )
+        return False, error_msg
+
+# --- PEŁNY PIPELINE (DAG ETAPÓW) ---
+# Zależności danych między etapami. Nagłówki i RAG potrzebują tylko researchu, więc biegną równolegle.
+PIPELINE_ORDER = ['research', 'headers', 'rag', 'brief', 'writing', 'publication']
+
+STAGE_DEPENDENCIES = {
+    'research': [],
+    'headers': ['research'],
+    'rag': ['research'],
+    'brief': ['headers'],
+    'writing': ['headers', 'rag'],
+    'publication': ['writing']
+}
+
+PENDING_STATUS = "Oczekuje"
+QUEUED_STATUS = "⏳ W kolejce"
+IN_PROGRESS_STATUS = "🔄 W trakcie..."
+PAUSED_STATUS = "⏸️ Wstrzymano (do akceptacji)"
+SKIPPED_STATUS = "⛔ Pominięto (błąd wcześniejszego etapu)"
+CANCELLED_STATUS = "⛔ Anulowano"
+UPSTREAM_PAUSED_PREFIX = "⏸️ Wstrzymano: "
+
+def upstream_paused_status(upstream):
+    """Status etapu wstrzymanego przez otwarty bezpiecznik - w odróżnieniu od PAUSED_STATUS wznowienie go powtarza."""
+    return f"{UPSTREAM_PAUSED_PREFIX}{upstream} niedostępny"
+
+def is_done_status(status):
+    return isinstance(status, str) and status.startswith("✅")
+
+def stage_dependencies(stage, stages):
+    """Zależności etapu ograniczone do etapów uruchomionych w tym pipeline (reszta = spełnione)."""
+    return [d for d in STAGE_DEPENDENCIES[stage] if d in stages]
+
+def root_stages(stages):
+    return [s for s in stages if not stage_dependencies(s, stages)]
+
+def next_stages(stage, stages, done_stages):
+    """Etapy, które po zakończeniu `stage` mają spełnione wszystkie zależności."""
+    return [
+        s for s in stages
+        if stage in STAGE_DEPENDENCIES[s] and all(d in done_stages for d in stage_dependencies(s, stages))
+    ]
+
+def descendant_stages(stage, stages):
+    result = []
+    frontier = [stage]
+    while frontier:
+        current = frontier.pop()
+        for s in stages:
+            if current in STAGE_DEPENDENCIES[s] and s not in result:
+                result.append(s)
+                frontier.append(s)
+    return [s for s in stages if s in result]
+
+class PipelineRunner:
+    """
+    Strumieniowe wykonanie DAG etapów dla wielu wierszy.
+
+    Każdy etap ma własną pulę wątków. Wiersz przechodzi do kolejnego etapu zaraz po
+    zakończeniu poprzedniego, bez czekania na resztę batcha. Etapy z `pause_after`
+    zatrzymują wiersz (np. do ręcznej edycji "Nagłówki (Finalne)").
+    Postęp trafia do kolejki `events` jako krotki (row_id, etap, wynik).
+    `statuses` ({row_id: {etap: status}}) - wznowienie: etapy ✅ są pomijane, wstrzymane czekają dalej.
+    """
+
+    def __init__(self, rows, stages=None, stage_workers=None, stage_args=None, pause_after=(), stop_event=None, statuses=None):
+        self.stages = [s for s in PIPELINE_ORDER if s in (stages or PIPELINE_ORDER)]
+        self.stage_args = stage_args or {}
+        self.pause_after = set(pause_after) & set(self.stages)
+        self.stop_event = stop_event or threading.Event()
+        self.rows = {row['ID']: row for row in rows}
+        self.stats = {s: {"done": 0, "errors": 0, "skipped": 0, "paused": 0} for s in self.stages}
+        self.events = queue.Queue()
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._finished = threading.Event()
+        statuses = statuses or {}
+        self._done_stages = {
+            row_id: {s for s in self.stages if is_done_status(statuses.get(row_id, {}).get(s))} for row_id in self.rows
+        }
+        self._scheduled = {row_id: set() for row_id in self.rows}
+        self._paused = {
+            row_id: {s for s in self.stages if statuses.get(row_id, {}).get(s) == PAUSED_STATUS} for row_id in self.rows
+        }
+        stage_workers = stage_workers or {}
+        self._pools = {
+            s: stage_executor(
+                s, stage_workers.get(s) or DEFAULT_STAGE_WORKERS[STAGES[s]['status_col']],
+                self.stage_args.get(s), thread_name_prefix=f"pipeline-{s}"
+            )
+            for s in self.stages
+        }
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    def start(self):
+        with self._lock:
+            for row_id in self.rows:
+                for stage in self._ready_stages(row_id):
+                    self._schedule(row_id, stage)
+            if self._pending == 0:
+                self._finished.set()
+        return self
+
+    def _ready_stages(self, row_id):
+        # Bez statusów startowych = etapy bez zależności; przy wznowieniu także etapy po gotowych
+        done = self._done_stages[row_id]
+        return [
+            s for s in self.stages
+            if s not in done and s not in self._paused[row_id] and all(d in done for d in stage_dependencies(s, self.stages))
+        ]
+
+    def _schedule(self, row_id, stage):
+        # Wywoływane pod self._lock
+        self._scheduled[row_id].add(stage)
+        self._pending += 1
+        submit_row(self._pools[stage], self.rows[row_id], self._run, row_id, stage)
+
+    def _run(self, row_id, stage):
+        spec = STAGES[stage]
+        try:
+            result = process_single_row(self.rows[row_id], spec['func'], spec['status_col'], self.stage_args.get(stage), self.stop_event)
+        except Exception as e:
+            result = (False, str(e)[:100])
+
+        paused = []
+        with self._lock:
+            if result is None:
+                self.stats[stage]["skipped"] += 1
+            elif result[0]:
+                self.stats[stage]["done"] += 1
+                self._done_stages[row_id].add(stage)
+                if stage in self.pause_after:
+                    paused = [s for s in descendant_stages(stage, self.stages) if s not in self._scheduled[row_id]]
+                    self._paused[row_id].update(paused)
+                    for s in paused:
+                        self.stats[s]["paused"] += 1
+                else:
+                    for nxt in next_stages(stage, self.stages, self._done_stages[row_id]):
+                        if nxt not in self._scheduled[row_id] and nxt not in self._paused[row_id]:
+                            self._schedule(row_id, nxt)
+            else:
+                self.stats[stage]["errors"] += 1
+
+        if paused:
+            update_db_record(row_id, {STAGES[s]['status_col']: PAUSED_STATUS for s in paused})
+
+        with self._lock:
+            self._pending -= 1
+            self.events.put((row_id, stage, result))
+            if self._pending == 0:
+                self._finished.set()
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+    def drain_events(self):
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def run(self, on_event=None, poll_interval=0.5):
+        """Uruchamia pipeline i blokuje do końca (użycie bez UI). Zwraca statystyki etapów."""
+        self.start()
+        try:
+            while not self.wait(poll_interval):
+                for event in self.drain_events():
+                    if on_event: on_event(*event)
+            for event in self.drain_events():
+                if on_event: on_event(*event)
+        finally:
+            self.shutdown()
+        return self.stats
+
+    def shutdown(self, cancel=True):
+        # Anuluje wiersze czekające w pulach; etapy w toku dokończą zapis do bazy
+        if cancel and not self.finished:
+            self.stop_event.set()
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=cancel)
+
+# --- PRZEBIEGI (WZNAWIANIE PO AWARII) ---
+@contextmanager
+def tracked_run(kind, row_ids, stages, stage_args=None, pause_after=(), run_id=None, resumed_from=None):
+    """
+    Rekord przebiegu w rejestrze checkpoints na czas batcha w sesji lub CLI (uchwyt: run_id, stopped, stats).
+    Nowy przebieg oznacza etapy wierszy jako "⏳ W kolejce" - po awarii wiersz, który nie zdążył
+    wystartować, nie zostanie uznany za gotowy na podstawie ✅ z wcześniejszego przebiegu.
+    """
+    run_id = run_id or checkpoints.new_run_id()
+    if checkpoints.enabled() and not resumed_from:
+        mark_stages_status(row_ids, stages, QUEUED_STATUS)
+    # Rekord przebiegu bez loginu i hasła WP - wznowienie bierze je z rejestru stron albo z bieżącej konfiguracji
+    with checkpoints.track_run(run_id, kind, stages, row_ids, stage_args_reference(stage_args), pause_after, resumed_from) as handle:
+        yield handle
+
+def resume_plan(run):
+    """
+    Niedokończone wiersze przebiegu: {id: {etap: status}}. Pomijane są wiersze z samymi ✅ / ⏸️ w etapach
+    przebiegu oraz wiersze "🔄 W trakcie...", które mogą jeszcze kończyć się w tle (przebieg przerwany przed chwilą).
+    """
+    retry_in_progress = checkpoints.in_progress_abandoned(run)
+    plan = {}
+    for row_id, statuses in fetch_stage_status_map(run["row_ids"]).items():
+        run_statuses = [statuses[s] for s in run["stages"]]
+        if not retry_in_progress and IN_PROGRESS_STATUS in run_statuses:
+            continue
+        if any(not is_done_status(status) and status != PAUSED_STATUS for status in run_statuses):
+            plan[row_id] = statuses
+    return plan
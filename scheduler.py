@@ -0,0 +1,374 @@
+"""
+Harmonogram batchy: priorytet wiersza, termin publikacji i sprawiedliwy podział mocy (fair share).
+
+Pule etapów (pipeline.stage_executor) to przy włączonym harmonogramie ScheduledExecutor - kolejki
+nad jedną, wspólną dla procesu pulą MAX_WORKERS wątków. Batch jednego operatora nie blokuje więc
+pozostałych, a wolny wątek wybiera kolejne zadanie tak:
+
+1. pilne - wiersz z "Publikuj do" w ciągu URGENT_HOURS (albo po terminie): najbliższy termin
+   pierwszy (EDF), niezależnie od udziałów,
+2. pozostałe - z udziału (operator, projekt, klasa batcha) o najmniejszym przebiegu: każde
+   zlecenie przesuwa przebieg udziału o 1/waga (stride scheduling). Przy wagach 4 : 1 : 0.1
+   batch pilny dostaje 4 wątki na każdy wątek normalnego, a samotny batch "w tle" bierze całą
+   wolną moc. Udział, który wraca po przerwie, startuje od bieżącego przebiegu (bez "zaległości"),
+3. w obrębie udziału - wyższy "Priorytet", wcześniejszy termin, kolejność zlecenia.
+
+Liczba wątków batcha na etap (pasek boczny, [batch] WORKERS_*) zostaje górnym limitem jego kolejki.
+Zadania etapu, którego upstream (np. "dify:writing") ma zajęte wszystkie miejsca limitu
+równoległości, czekają w kolejce zamiast blokować wątek w upstreams.slot() - w tym czasie wątek
+bierze pracę innego etapu lub batcha. Otwarty bezpiecznik nie wstrzymuje kolejki: wiersz od razu
+dostaje status "wstrzymano" (process_single_row).
+
+Ustawienia ładuje pipeline.configure() z sekcji [scheduler] w secrets.
+"""
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import Future
+from datetime import datetime
+
+import upstreams
+
+SCHEDULER_SETTINGS = {
+    "enabled": False,        # włączany przez [scheduler] ENABLED = true w secrets
+    "max_workers": 64,       # wątki procesu dla wszystkich batchy i etapów
+    "urgent_hours": 24.0,    # termin bliżej niż tyle godzin = zadanie pilne (EDF)
+    "poll_seconds": 0.2,     # ponowna ocena kolejek czekających na zajęty upstream
+    "idle_seconds": 2.0,     # bezczynny wątek kończy się po tym czasie
+    "class_weights": {},     # klasa -> waga (uzupełnia DEFAULT_CLASS_WEIGHTS)
+    "operator_weights": {},  # operator -> waga (domyślnie 1)
+    "project_weights": {}    # projekt -> waga (domyślnie 1)
+}
+
+# Klasy batcha wybierane przy uruchomieniu (pasek boczny, factory.py run --class)
+PRIORITY_CLASSES = {
+    'urgent': '🔥 Pilny (klient)',
+    'normal': 'Normalny',
+    'bulk': '🐢 W tle (backfill)'
+}
+DEFAULT_CLASS = 'normal'
+DEFAULT_CLASS_WEIGHTS = {'urgent': 4.0, 'normal': 1.0, 'bulk': 0.1}
+MIN_WEIGHT = 0.001
+
+Flow = namedtuple("Flow", "operator klass")
+Task = namedtuple("Task", "priority deadline project")
+
+NO_TASK = Task(0, None, "")
+
+_flow = contextvars.ContextVar("scheduler_flow", default=Flow("", DEFAULT_CLASS))
+
+def configure(**settings):
+    """Nadpisuje SCHEDULER_SETTINGS (None = bez zmiany). Kolejki i zadania w toku działają dalej."""
+    with _scheduler.cond:
+        SCHEDULER_SETTINGS.update({k: v for k, v in settings.items() if v is not None})
+        _scheduler.cond.notify_all()
+
+def enabled():
+    return bool(SCHEDULER_SETTINGS["enabled"])
+
+# --- OPERATOR I KLASA BATCHA ---
+@contextmanager
+def flow_scope(operator=None, klass=None):
+    """Operator i klasa batcha dla pul etapów tworzonych w tym kontekście (ScheduledExecutor zapamiętuje je przy utworzeniu)."""
+    token = _flow.set(Flow((operator or "").strip(), klass if klass in PRIORITY_CLASSES else DEFAULT_CLASS))
+    try:
+        yield
+    finally:
+        _flow.reset(token)
+
+def current_flow():
+    return _flow.get()
+
+def share_weight(operator="", project="", klass=DEFAULT_CLASS):
+    """Waga udziału = klasa × operator × projekt."""
+    settings = SCHEDULER_SETTINGS
+    weight = (
+        float(settings["class_weights"].get(klass, DEFAULT_CLASS_WEIGHTS.get(klass, 1.0)))
+        * float(settings["operator_weights"].get(operator or "", 1.0))
+        * float(settings["project_weights"].get(project or "", 1.0))
+    )
+    return max(weight, MIN_WEIGHT)
+
+def share_label(operator="", klass=DEFAULT_CLASS):
+    """Etykieta udziału w kolejce workerów (seo_jobs.share)."""
+    return f"{operator or '-'}/{klass}"
+
+# --- ZADANIE (WIERSZ) ---
+def parse_priority(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):  # None, "", NaN
+        return 0
+
+def parse_deadline(value):
+    """"Publikuj do" jako znacznik czasu (s od epoki) albo None. Czas bez strefy = czas lokalny."""
+    if value is None or value == "":
+        return None
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    try:
+        return value.timestamp()
+    except (ValueError, OverflowError):  # NaT z pandas
+        return None
+
+def row_task(priority=None, publish_by=None, project=None):
+    return Task(parse_priority(priority), parse_deadline(publish_by), project.strip() if isinstance(project, str) else "")
+
+# --- HARMONOGRAM ---
+def _urgent_seconds():
+    return float(SCHEDULER_SETTINGS["urgent_hours"]) * 3600
+
+def _horizon(now=None):
+    """Terminy do tej chwili są pilne (EDF)."""
+    return (time.time() if now is None else now) + _urgent_seconds()
+
+class _Share:
+    __slots__ = ("key", "pass_", "queued", "running", "dispatched")
+
+    def __init__(self, key, pass_):
+        self.key = key  # (operator, projekt, klasa)
+        self.pass_ = pass_
+        self.queued = 0
+        self.running = 0
+        self.dispatched = 0
+
+class _Queue:
+    """Zadania jednej puli etapu dla jednego projektu (jeden udział)."""
+    __slots__ = ("executor", "project", "share", "heap", "promote_at")
+
+    def __init__(self, executor, project, share):
+        self.executor = executor
+        self.project = project
+        self.share = share
+        self.heap = []
+        self.promote_at = float("inf")  # najbliższa chwila, w której termin zadania w kolejce wejdzie w horyzont pilnych
+
+class _Item:
+    __slots__ = ("future", "fn", "args", "kwargs", "queue", "task")
+
+    def __init__(self, future, fn, args, kwargs, queue, task):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.queue = queue
+        self.task = task
+
+class _Scheduler:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.active = set()   # kolejki z zadaniami
+        self.shares = {}      # klucz udziału -> _Share (tylko udziały z zadaniami w kolejce lub w toku)
+        self.vtime = 0.0      # przebieg ostatnio obsłużonego udziału
+        self.threads = 0
+        self.idle = 0
+        self.seq = itertools.count()
+        self.thread_ids = itertools.count(1)
+
+    # _runnable, _pick i _release wywoływane pod self.cond
+    def submit(self, executor, task, fn, args, kwargs):
+        future = Future()
+        with self.cond:
+            if executor.is_shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            key = (executor.flow.operator, task.project, executor.flow.klass)
+            share = self.shares.get(key)
+            if share is None:
+                share = self.shares[key] = _Share(key, self.vtime)
+            elif not share.queued:
+                share.pass_ = max(share.pass_, self.vtime)
+            queue = executor.queues.get(task.project)
+            if queue is None:
+                queue = executor.queues[task.project] = _Queue(executor, task.project, share)
+            queue.share = share
+            self._push(queue, _Item(future, fn, args, kwargs, queue, task), next(self.seq), _horizon())
+            share.queued += 1
+            executor.queued += 1
+            self.active.add(queue)
+            if self.threads < int(SCHEDULER_SETTINGS["max_workers"]) and self.idle < self._runnable():
+                self.threads += 1
+                threading.Thread(target=self._worker, name=f"scheduler-{next(self.thread_ids)}", daemon=True).start()
+            self.cond.notify()
+        return future
+
+    @staticmethod
+    def _push(queue, item, seq, horizon):
+        # Kolejność w kolejce: pilne wg terminu, potem priorytet wiersza, termin, kolejność zlecenia
+        task = item.task
+        if task.deadline is not None and task.deadline <= horizon:
+            order = (0, task.deadline, -task.priority)
+        else:
+            order = (1, -task.priority, task.deadline if task.deadline is not None else float("inf"))
+            if task.deadline is not None:
+                queue.promote_at = min(queue.promote_at, task.deadline - _urgent_seconds())
+        heapq.heappush(queue.heap, (order, seq, item))
+
+    def _promote(self, queue, horizon):
+        """Układa kolejkę na nowo, gdy termin któregoś zadania wszedł w horyzont pilnych od chwili zlecenia."""
+        entries, queue.heap, queue.promote_at = queue.heap, [], float("inf")
+        for _, seq, item in entries:
+            self._push(queue, item, seq, horizon)
+
+    def _runnable(self):
+        # Zadania, które mogą ruszyć od razu (limity pul etapów) - tyle wątków ma sens uruchomić
+        executors = {queue.executor for queue in self.active}
+        return sum(min(ex.queued, max(ex.max_workers - ex.running, 0)) for ex in executors)
+
+    def _pick(self):
+        """(zadanie, czy coś czeka na zajęty upstream). Zadanie jest już zaliczone jako uruchomione."""
+        now = time.time()
+        horizon = _horizon(now)
+        saturated = {}
+        blocked = False
+        best = None
+        for queue in self.active:
+            executor = queue.executor
+            if executor.running >= executor.max_workers:
+                continue
+            if executor.upstream:
+                if executor.upstream not in saturated:
+                    saturated[executor.upstream] = upstreams.saturated(executor.upstream)
+                if saturated[executor.upstream]:
+                    blocked = True
+                    continue
+            if queue.promote_at <= now:
+                self._promote(queue, horizon)
+            order, seq, item = queue.heap[0]
+            deadline = item.task.deadline
+            if deadline is not None and deadline <= horizon:
+                rank = (0, deadline, seq)
+            else:
+                rank = (1, queue.share.pass_, order, seq)
+            if best is None or rank < best[0]:
+                best = (rank, queue)
+        if best is None:
+            return None, blocked
+
+        rank, queue = best
+        item = heapq.heappop(queue.heap)[2]
+        if not queue.heap:
+            self.active.discard(queue)
+        share = queue.share
+        share.queued -= 1
+        share.running += 1
+        share.dispatched += 1
+        if rank[0]:
+            # Pilne zadania nie przesuwają zegara - udział i tak płaci za nie swoim przebiegiem
+            self.vtime = max(self.vtime, share.pass_)
+        share.pass_ += 1.0 / share_weight(*share.key)
+        queue.executor.queued -= 1
+        queue.executor.running += 1
+        return item, blocked
+
+    def _release(self, share):
+        if not share.queued and not share.running:
+            self.shares.pop(share.key, None)
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                idle_since = time.monotonic()
+                while True:
+                    item, blocked = self._pick()
+                    if item is not None:
+                        break
+                    remaining = float(SCHEDULER_SETTINGS["idle_seconds"]) - (time.monotonic() - idle_since)
+                    if self.threads > int(SCHEDULER_SETTINGS["max_workers"]) or (remaining <= 0 and not blocked):
+                        self.threads -= 1
+                        return
+                    self.idle += 1
+                    self.cond.wait(float(SCHEDULER_SETTINGS["poll_seconds"]) if blocked else remaining)
+                    self.idle -= 1
+            self._run(item)
+
+    def _run(self, item):
+        try:
+            if item.future.set_running_or_notify_cancel():
+                try:
+                    result = item.fn(*item.args, **item.kwargs)
+                except BaseException as e:
+                    item.future.set_exception(e)
+                else:
+                    item.future.set_result(result)
+        finally:
+            with self.cond:
+                queue = item.queue
+                queue.executor.running -= 1
+                queue.share.running -= 1
+                self._release(queue.share)
+                self.cond.notify_all()
+
+    def shutdown(self, executor, wait, cancel_futures):
+        cancelled = []
+        with self.cond:
+            executor.is_shutdown = True
+            if cancel_futures:
+                for queue in executor.queues.values():
+                    cancelled.extend(item.future for _, _, item in queue.heap)
+                    queue.share.queued -= len(queue.heap)
+                    executor.queued -= len(queue.heap)
+                    queue.heap.clear()
+                    self.active.discard(queue)
+                    self._release(queue.share)
+        # Callbacki anulowanych futures poza blokadą harmonogramu
+        for future in cancelled:
+            future.cancel()
+        if wait:
+            with self.cond:
+                while executor.running or executor.queued:
+                    self.cond.wait()
+
+    def snapshot(self):
+        with self.cond:
+            shares = [
+                {
+                    "operator": share.key[0] or "-", "project": share.key[1] or "-", "class": share.key[2],
+                    "weight": round(share_weight(*share.key), 3), "queued": share.queued, "running": share.running,
+                    "dispatched": share.dispatched
+                }
+                for share in self.shares.values()
+            ]
+            return {
+                "threads": self.threads, "idle": self.idle, "max_workers": int(SCHEDULER_SETTINGS["max_workers"]),
+                "shares": sorted(shares, key=lambda s: (s["class"] != "urgent", -s["running"], s["operator"], s["project"]))
+            }
+
+_scheduler = _Scheduler()
+
+class ScheduledExecutor:
+    """
+    Pula etapu batcha w harmonogramie - interfejs jak ThreadPoolExecutor (submit, shutdown).
+    max_workers to limit zadań tej puli w toku; wątki pochodzą ze wspólnej puli procesu.
+    upstream - nazwa z upstreams.py, której zajęty limit wstrzymuje wydawanie zadań tej puli.
+    """
+
+    def __init__(self, max_workers, upstream=None, name="stage"):
+        self.max_workers = max(1, int(max_workers))
+        self.upstream = upstream
+        self.name = name
+        self.flow = _flow.get()
+        self.queues = {}  # projekt -> _Queue
+        self.queued = 0
+        self.running = 0
+        self.is_shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        return _scheduler.submit(self, NO_TASK, fn, args, kwargs)
+
+    def submit_task(self, task, fn, *args, **kwargs):
+        """submit() z priorytetem, terminem i projektem wiersza (row_task)."""
+        return _scheduler.submit(self, task, fn, args, kwargs)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        _scheduler.shutdown(self, wait, cancel_futures)
+
+def snapshot():
+    """Wątki harmonogramu i udziały z zadaniami w kolejce lub w toku (panel metryk)."""
+    return _scheduler.snapshot()
@@ -0,0 +1,21 @@
+import dify_cache
+
+
+def test_cache_key_ignores_outer_whitespace_line_endings_and_keyword_case():
+    base = dify_cache.cache_key("key", {"keyword": "Buty Do Biegania", "brief": "a\nb"})
+    assert dify_cache.cache_key("key", {"keyword": "  buty do biegania\n", "brief": "a\r\nb  "}) == base
+
+
+def test_cache_key_keeps_inner_whitespace():
+    base = dify_cache.cache_key("key", {"brief": "akapit 1\n\nakapit 2"})
+    assert dify_cache.cache_key("key", {"brief": "akapit 1 akapit 2"}) != base
+    assert dify_cache.cache_key("key", {"brief": "akapit 1\nakapit 2"}) != base
+    assert dify_cache.cache_key("key", {"brief": "kod:\n    wcięcie"}) != dify_cache.cache_key("key", {"brief": "kod:\nwcięcie"})
+
+
+def test_cache_key_depends_on_workflow():
+    assert dify_cache.cache_key("key-a", {"keyword": "x"}) != dify_cache.cache_key("key-b", {"keyword": "x"})
+
+
+def test_missing_values_normalize_to_empty():
+    assert dify_cache.normalize_inputs({"a": None, "b": float("nan"), "c": [" x "]}) == {"a": "", "b": "", "c": ["x"]}
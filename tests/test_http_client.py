@@ -0,0 +1,131 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+import http_client
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = b""
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """Kolejne wyniki session.request: odpowiedź albo wyjątek."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.calls.append(timeout)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    state = SimpleNamespace(session=None, slept=[])
+    monkeypatch.setattr(http_client, "get_session", lambda url: state.session)
+    monkeypatch.setattr(http_client, "time", SimpleNamespace(perf_counter=time.perf_counter, sleep=state.slept.append))
+    monkeypatch.setitem(http_client.HTTP_SETTINGS, "max_retries", 3)
+    monkeypatch.setitem(http_client.HTTP_SETTINGS, "backoff_base", 1.0)
+    monkeypatch.setitem(http_client.HTTP_SETTINGS, "backoff_max", 60.0)
+    monkeypatch.setitem(http_client.HTTP_SETTINGS, "retry_after_max", 30.0)
+    return state
+
+
+def refused():
+    from urllib3.exceptions import MaxRetryError, NewConnectionError
+    return requests.exceptions.ConnectionError(MaxRetryError(None, "/x", NewConnectionError(None, "Connection refused")))
+
+
+def test_retries_transient_status_with_backoff(transport):
+    transport.session = FakeSession(FakeResponse(502), FakeResponse(503), FakeResponse(200))
+    response = http_client.request_with_retry("GET", "https://example.com/x")
+    assert response.status_code == 200
+    assert len(transport.slept) == 2
+    assert 0 <= transport.slept[0] <= 1.0 and 0 <= transport.slept[1] <= 2.0
+
+
+def test_honors_retry_after_with_cap(transport):
+    transport.session = FakeSession(FakeResponse(429, {"Retry-After": "7"}), FakeResponse(429, {"Retry-After": "600"}), FakeResponse(201))
+    assert http_client.request_with_retry("POST", "https://example.com/x").status_code == 201
+    assert transport.slept == [7.0, 30.0]
+
+
+def test_client_errors_are_returned_without_retry(transport):
+    transport.session = FakeSession(FakeResponse(404))
+    assert http_client.request_with_retry("GET", "https://example.com/x").status_code == 404
+    assert transport.slept == []
+
+
+def test_last_transient_response_is_returned_after_retries(transport):
+    transport.session = FakeSession(*(FakeResponse(500) for _ in range(4)))
+    assert http_client.request_with_retry("GET", "https://example.com/x").status_code == 500
+    assert len(transport.slept) == 3
+
+
+@pytest.mark.parametrize("status", [500, 502, 504])
+def test_post_is_not_resent_after_ambiguous_status(transport, status):
+    transport.session = FakeSession(FakeResponse(status), FakeResponse(201))
+    assert http_client.request_with_retry("POST", "https://example.com/x").status_code == status
+    assert len(transport.session.calls) == 1
+
+
+def test_put_is_retried_after_ambiguous_status(transport):
+    transport.session = FakeSession(FakeResponse(502), FakeResponse(200))
+    assert http_client.request_with_retry("PUT", "https://example.com/x").status_code == 200
+
+
+def test_post_retry_statuses_can_be_widened(transport):
+    transport.session = FakeSession(FakeResponse(502), FakeResponse(201))
+    response = http_client.request_with_retry("POST", "https://example.com/x", retry_statuses=http_client.RETRY_STATUSES)
+    assert response.status_code == 201
+
+
+def test_post_is_resent_only_when_connection_was_not_established(transport):
+    transport.session = FakeSession(refused(), requests.exceptions.ConnectTimeout(), FakeResponse(201))
+    assert http_client.request_with_retry("POST", "https://example.com/x").status_code == 201
+
+    # Zerwanie po wysłaniu - serwer mógł już wykonać zapis
+    transport.session = FakeSession(requests.exceptions.ConnectionError("Connection aborted"), FakeResponse(201))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_client.request_with_retry("POST", "https://example.com/x")
+    assert len(transport.session.calls) == 1
+
+
+def test_connection_errors_are_retried_then_raised(transport):
+    transport.session = FakeSession(requests.exceptions.ConnectionError(), FakeResponse(200))
+    assert http_client.request_with_retry("GET", "https://example.com/x").status_code == 200
+
+    transport.session = FakeSession(*(requests.exceptions.ConnectionError() for _ in range(4)))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_client.request_with_retry("GET", "https://example.com/x")
+
+
+def test_read_timeout_is_not_retried_by_default(transport):
+    transport.session = FakeSession(requests.exceptions.ReadTimeout(), FakeResponse(200))
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        http_client.request_with_retry("POST", "https://example.com/x", read_timeout=5)
+    assert transport.session.calls == [(http_client.HTTP_SETTINGS["connect_timeout"], 5)]
+
+    transport.session = FakeSession(requests.exceptions.ReadTimeout(), FakeResponse(200))
+    assert http_client.request_with_retry("POST", "https://example.com/x", retry_read_timeout=True).status_code == 200
+
+
+def test_retry_after_http_date():
+    response = FakeResponse(503, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})
+    assert http_client.retry_after_seconds(response) == 0.0
+    assert http_client.retry_after_seconds(FakeResponse(503, {"Retry-After": "soon"})) is None
@@ -0,0 +1,81 @@
+import io
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import importer
+
+
+class FakeResult:
+    def __init__(self, data=None):
+        self.data = data
+
+
+class FakeClient:
+    """Tabela seo_content_tasks w pamięci + RPC existing_keyword_pairs jak w README (lower(keyword))."""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.lookups = []
+        self._pending = None
+
+    def rpc(self, name, params):
+        assert name == "existing_keyword_pairs"
+        self.lookups.append(params["p_keywords"])
+        wanted = set(params["p_keywords"])
+        self._result = [{"keyword": r["keyword"], "language": r["language"]} for r in self.rows if r["keyword"].lower() in wanted]
+        return self
+
+    def table(self, name):
+        return self
+
+    def insert(self, records):
+        self._pending = records
+        return self
+
+    def execute(self):
+        if self._pending is not None:
+            self.rows.extend(self._pending)
+            self._pending = None
+            return FakeResult([])
+        return FakeResult(self._result)
+
+
+def csv_file(text):
+    return io.BytesIO(text.encode("utf-8"))
+
+
+def test_existing_pairs_ignores_case():
+    client = FakeClient([{"keyword": "Buty Do Biegania", "language": "pl"}])
+    assert importer.existing_pairs(client, ["buty do BIEGANIA", "inne"]) == {("buty do biegania", "pl")}
+    assert client.lookups == [["buty do biegania", "inne"]]
+
+
+def test_import_rejects_duplicates_in_file_and_database_regardless_of_case():
+    client = FakeClient([{"keyword": "Rower Miejski", "language": "pl"}])
+    source = csv_file(
+        "Słowo kluczowe;Język\n"
+        "rower miejski;pl\n"       # już w bazie (inna wielkość liter)
+        "Rower miejski;en\n"       # inny język - nowy
+        "Kask rowerowy;\n"         # domyślny język
+        "KASK  rowerowy;pl\n"      # duplikat w pliku
+        ";pl\n"
+    )
+    report = importer.import_file(client, source, "import.csv")
+
+    assert report.total == 5
+    assert report.inserted == 2
+    reasons = {(row, reason) for row, _, reason in report.rejected}
+    assert reasons == {
+        (2, importer.REJECT_EXISTS), (5, importer.REJECT_DUPLICATE_FILE), (6, importer.REJECT_EMPTY)
+    }
+    assert {(r["keyword"], r["language"]) for r in client.rows[1:]} == {("Rower miejski", "en"), ("Kask rowerowy", "pl")}
+
+
+def test_import_reports_progress_in_rows():
+    client = FakeClient()
+    source = csv_file("keyword\n" + "".join(f"słowo {i}\n" for i in range(7)))
+    progress = []
+    importer.import_file(client, source, "import.csv", chunk_rows=3, on_progress=lambda rows, inserted: progress.append((rows, inserted)))
+    assert progress == [(3, 3), (6, 6), (7, 7)]
@@ -0,0 +1,129 @@
+from collections import Counter
+from contextlib import closing
+
+import pytest
+
+import job_queue
+
+
+@pytest.fixture
+def store(tmp_path):
+    return job_queue.SQLiteJobStore(str(tmp_path / "jobs.sqlite"))
+
+
+def expire_leases(store):
+    with closing(store._connect()) as conn:
+        conn.execute("UPDATE seo_jobs SET lease_expires_at = 0 WHERE status = ?", (job_queue.JOB_RUNNING,))
+
+
+def test_expired_lease_returns_job_to_queue(store):
+    store.enqueue([1], "research", max_attempts=2)
+    first = store.claim("w1")
+    assert [j["task_id"] for j in first] == [1]
+    assert store.claim("w2") == []
+
+    expire_leases(store)
+    second = store.claim("w2")
+    assert [j["id"] for j in second] == [first[0]["id"]]
+    assert second[0]["attempts"] == 2
+    assert second[0]["lease_owner"] == "w2"
+    assert store.fail_expired() == []
+
+
+def test_expired_last_attempt_is_failed_and_returned(store):
+    batch_id = store.enqueue([7], "writing", args={"site": "blog"}, max_attempts=1,
+                             pipeline={"stages": ["writing", "publication"]})
+    store.claim("w1")
+    expire_leases(store)
+
+    assert store.claim("w2") == []
+    expired = store.fail_expired()
+    assert len(expired) == 1
+    job = expired[0]
+    assert (job["task_id"], job["stage"], job["status"]) == (7, "writing", job_queue.JOB_FAILED)
+    assert job["args"] == {"site": "blog"}
+    assert job["pipeline"] == {"stages": ["writing", "publication"]}
+    # Drugi worker nie dostanie tego samego zadania ponownie
+    assert store.fail_expired() == []
+
+    summary = store.batch_summary()[0]
+    assert summary["batch_id"] == batch_id
+    assert summary[job_queue.JOB_FAILED] == 1
+
+
+def test_deferred_job_keeps_attempt(store):
+    store.enqueue([1], "research", max_attempts=1)
+    job = store.claim("w1")[0]
+    store.defer(job, "w1", 0, "upstream otwarty")
+    expire_leases(store)
+
+    assert store.fail_expired() == []
+    again = store.claim("w1")
+    assert again[0]["attempts"] == 1
+
+
+def test_claim_alternates_shares_by_weight(store):
+    store.enqueue(range(1, 21), "research", share="bulk", weight=1.0)
+    store.enqueue(range(101, 121), "research", share="urgent", weight=4.0)
+
+    claimed = store.claim("w1", limit=10)
+    shares = Counter("urgent" if j["task_id"] > 100 else "bulk" for j in claimed)
+    assert shares == {"urgent": 8, "bulk": 2}
+
+
+def test_claim_does_not_starve_light_share(store):
+    store.enqueue(range(1, 101), "research", share="heavy", weight=4.0)
+    store.enqueue([1001], "research", share="light", weight=1.0)
+
+    claimed = [j["task_id"] for j in store.claim("w1", limit=5)]
+    assert 1001 in claimed
+
+
+def test_claim_filters_stages(store):
+    store.enqueue([1], "research")
+    store.enqueue([2], "writing")
+    assert [j["stage"] for j in store.claim("w1", stages=["writing"], limit=5)] == ["writing"]
+
+
+def test_cancelled_batch_does_not_grow(store, monkeypatch):
+    import worker
+
+    pipeline_cfg = {"stages": ["research", "headers", "rag"]}
+    batch_id = store.enqueue([1, 2], "research", pipeline=pipeline_cfg)
+    running = store.claim("w1", limit=1)[0]
+    store.cancel(batch_id)
+
+    assert store.is_cancelled(batch_id)
+    assert store.claim("w2") == []
+
+    marked = []
+    monkeypatch.setattr(worker, "fetch_stage_statuses", lambda task_id: {"research": "✅ Gotowe"})
+    monkeypatch.setattr(worker, "mark_stages_status", lambda ids, stages, status: marked.append((ids, sorted(stages), status)))
+    # Zadanie przejęte przed anulowaniem kończy się, ale nie dodaje kolejnych etapów
+    worker.advance_pipeline(store, running, True)
+    store.complete(running, "w1")
+
+    assert marked == [([1], ["headers", "rag"], worker.CANCELLED_STATUS)]
+    store.enqueue([1], "headers", batch_id=batch_id, pipeline=pipeline_cfg)
+    statuses = Counter(r[job_queue.JOB_CANCELLED] for r in store.batch_summary())
+    assert [r["stage"] for r in store.batch_summary()] == ["research"]
+    assert statuses == Counter({1: 1})
+    assert not store.is_cancelled(store.enqueue([3], "research"))
+
+
+def test_worker_completes_job_when_advance_fails(store, monkeypatch):
+    import worker
+
+    store.enqueue([1], "research", pipeline={"stages": ["research", "headers"]})
+    marked = []
+    monkeypatch.setattr(worker, "run_job", lambda job: (True, None))
+    monkeypatch.setattr(worker, "advance_pipeline", lambda *a: (_ for _ in ()).throw(RuntimeError("supabase")))
+    monkeypatch.setattr(worker, "mark_stages_status", lambda ids, stages, status: marked.append((ids, list(stages), status)))
+    monkeypatch.setattr(worker.metrics, "flush", lambda: None)
+
+    worker.run_worker(store, concurrency=1, poll_interval=0.01, once=True)
+
+    # Zakończony etap nie wraca do kolejki, dalsze etapy czekają na ponowne uruchomienie
+    summary = store.batch_summary()[0]
+    assert (summary[job_queue.JOB_DONE], summary[job_queue.JOB_RUNNING]) == (1, 0)
+    assert marked == [([1], ["headers"], worker.ADVANCE_FAILED_STATUS)]
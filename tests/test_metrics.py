@@ -0,0 +1,28 @@
+import metrics
+
+
+def stage_event(batch_id, row_id, name, ts, wall_s=1.0, ok=True):
+    return {"kind": "stage", "batch_id": batch_id, "row_id": row_id, "name": name, "ts": ts, "wall_s": wall_s, "ok": ok}
+
+
+def test_batch_throughput_counts_distinct_rows():
+    events = [
+        stage_event("b1", row_id, stage, ts=1000 + 10 * i + row_id)
+        for i, stage in enumerate(["research", "headers", "rag"])
+        for row_id in (1, 2)
+    ]
+    events.append(stage_event("b1", 2, "brief", ts=1060, ok=False))
+    events.append({"kind": "http", "batch_id": "b1", "name": "POST x", "ts": 1000})
+
+    (batch,) = metrics.batch_throughput(events)
+    assert batch["rows"] == 2
+    assert batch["stage_runs"] == 7
+    assert batch["errors"] == 1
+    assert batch["duration_s"] == 60.0
+    assert batch["rows_per_min"] == 2.0
+    assert batch["stages"] == "brief, headers, rag, research"
+
+
+def test_batch_throughput_separates_batches_newest_first():
+    events = [stage_event("old", 1, "research", ts=100), stage_event("new", 1, "research", ts=5000)]
+    assert [b["batch_id"] for b in metrics.batch_throughput(events)] == ["new", "old"]
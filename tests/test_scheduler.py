@@ -0,0 +1,127 @@
+import time
+import threading
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+
+import pytest
+
+import scheduler
+import upstreams
+
+
+@pytest.fixture(autouse=True)
+def one_thread(monkeypatch):
+    # Jeden wątek procesu - kolejność wykonania = kolejność wyboru przez harmonogram
+    monkeypatch.setitem(scheduler.SCHEDULER_SETTINGS, "max_workers", 1)
+    monkeypatch.setitem(scheduler.SCHEDULER_SETTINGS, "idle_seconds", 0.2)
+    monkeypatch.setitem(scheduler.SCHEDULER_SETTINGS, "poll_seconds", 0.02)
+    monkeypatch.setitem(scheduler.SCHEDULER_SETTINGS, "class_weights", {})
+
+
+class Recorder:
+    """Blokuje jedyny wątek harmonogramu, aż wszystkie zadania trafią do kolejek, i zapisuje kolejność."""
+
+    def __init__(self):
+        self.order = []
+        self.release = threading.Event()
+        self.blocker = scheduler.ScheduledExecutor(1, name="blocker")
+        self.started = threading.Event()
+        self.blocker.submit(self._block)
+        assert self.started.wait(5)
+
+    def _block(self):
+        self.started.set()
+        self.release.wait(5)
+
+    def job(self, label):
+        return lambda: self.order.append(label)
+
+    def run(self, *executors):
+        self.release.set()
+        for executor in (self.blocker,) + executors:
+            executor.shutdown(wait=True)
+        return self.order
+
+
+def test_scheduler_is_disabled_by_default():
+    assert scheduler.SCHEDULER_SETTINGS["enabled"] is False
+
+
+def test_priority_then_deadline_then_submission_order():
+    rec = Recorder()
+    pool = scheduler.ScheduledExecutor(1)
+    far = datetime.now() + timedelta(days=30)
+    pool.submit_task(scheduler.row_task(0), rec.job("plain-1"))
+    pool.submit_task(scheduler.row_task(5, far + timedelta(hours=1)), rec.job("high-late"))
+    pool.submit_task(scheduler.row_task(5, far), rec.job("high-early"))
+    pool.submit_task(scheduler.row_task(0), rec.job("plain-2"))
+    pool.submit_task(scheduler.row_task(1), rec.job("medium"))
+
+    assert rec.run(pool) == ["high-early", "high-late", "medium", "plain-1", "plain-2"]
+
+
+def test_urgent_deadline_goes_first_across_shares():
+    rec = Recorder()
+    with scheduler.flow_scope("ania", "urgent"):
+        urgent_class = scheduler.ScheduledExecutor(1)
+    with scheduler.flow_scope("backfill", "bulk"):
+        bulk = scheduler.ScheduledExecutor(1)
+    soon = datetime.now() + timedelta(hours=1)
+    urgent_class.submit_task(scheduler.row_task(9), rec.job("urgent-class"))
+    bulk.submit_task(scheduler.row_task(0, soon + timedelta(minutes=1)), rec.job("deadline-later"))
+    bulk.submit_task(scheduler.row_task(0, soon), rec.job("deadline-first"))
+
+    assert rec.run(urgent_class, bulk) == ["deadline-first", "deadline-later", "urgent-class"]
+
+
+def test_deadline_entering_horizon_after_submit_is_promoted(monkeypatch):
+    clock = {"now": time.time()}
+    monkeypatch.setattr(scheduler, "time", SimpleNamespace(time=lambda: clock["now"], monotonic=time.monotonic))
+    rec = Recorder()
+    pool = scheduler.ScheduledExecutor(1)
+    due = datetime.fromtimestamp(clock["now"]) + timedelta(hours=25)
+    pool.submit_task(scheduler.row_task(5), rec.job("high"))
+    pool.submit_task(scheduler.row_task(0, due), rec.job("due"))
+    # Po zleceniu termin był poza horyzontem 24 h - po 2 h zadanie jest już pilne
+    clock["now"] += 2 * 3600
+
+    assert rec.run(pool) == ["due", "high"]
+
+
+def test_shares_alternate_by_weight():
+    rec = Recorder()
+    with scheduler.flow_scope("klient", "urgent"):
+        heavy = scheduler.ScheduledExecutor(1)
+    with scheduler.flow_scope("inny", "normal"):
+        light = scheduler.ScheduledExecutor(1)
+    for i in range(8):
+        heavy.submit(rec.job("urgent"))
+        light.submit(rec.job("normal"))
+
+    order = rec.run(heavy, light)
+    # Waga 4 : 1 - na pierwsze 5 zadań przypada 4 pilne i 1 normalne, normalne nie czeka na koniec pilnych
+    assert order[:5].count("urgent") == 4
+    assert "normal" in order[:5]
+
+
+def test_saturated_upstream_does_not_block_other_pools():
+    upstream = upstreams.get("test:scheduler-saturated", max_concurrency=1)
+    rec = Recorder()
+    waiting = scheduler.ScheduledExecutor(1, upstream="test:scheduler-saturated")
+    free = scheduler.ScheduledExecutor(1)
+    with upstream.slot():
+        waiting.submit(rec.job("saturated"))
+        free.submit(rec.job("free"))
+        rec.release.set()
+        free.shutdown(wait=True)
+        assert rec.order == ["free"]
+    waiting.shutdown(wait=True)
+    rec.blocker.shutdown(wait=True)
+    assert rec.order == ["free", "saturated"]
+
+
+def test_worker_threads_are_daemons():
+    rec = Recorder()
+    threads = [t for t in threading.enumerate() if t.name.startswith("scheduler-")]
+    assert threads and all(t.daemon for t in threads)
+    rec.run()
@@ -0,0 +1,169 @@
+from types import SimpleNamespace
+
+import pytest
+
+import upstreams
+from upstreams import CLOSED, OPEN, HALF_OPEN, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    # Zegar tylko dla upstreams.py - moduł time innych wątków zostaje bez zmian
+    monkeypatch.setattr(upstreams, "time", SimpleNamespace(monotonic=fake.monotonic, sleep=fake.sleep))
+    for key, value in {"failure_threshold": 3, "open_seconds": 30.0, "open_max_seconds": 100.0,
+                       "decrease_cooldown": 5.0, "decrease_factor": 0.5, "min_concurrency": 1, "latency_factor": 3.0}.items():
+        monkeypatch.setitem(upstreams.UPSTREAM_SETTINGS, key, value)
+    return fake
+
+
+def trip(upstream, failures=3):
+    for _ in range(failures):
+        upstream.before_attempt()
+        upstream.report(overload=True)
+
+
+def test_opens_after_consecutive_overload_failures(clock):
+    upstream = upstreams.Upstream("test:a", max_concurrency=8)
+    trip(upstream, 2)
+    assert upstream.state == CLOSED
+    trip(upstream, 1)
+    assert upstream.state == OPEN
+
+    with pytest.raises(CircuitOpenError) as error:
+        upstream.before_attempt()
+    assert error.value.retry_after == pytest.approx(30.0)
+    with pytest.raises(CircuitOpenError):
+        with upstream.slot():
+            pass
+
+
+def test_non_overload_result_resets_failure_count(clock):
+    upstream = upstreams.Upstream("test:b")
+    trip(upstream, 2)
+    upstream.report(overload=False)  # np. 400 - usługa odpowiada
+    trip(upstream, 2)
+    assert upstream.state == CLOSED
+
+
+def test_half_open_allows_single_probe_and_closes_on_success(clock):
+    upstream = upstreams.Upstream("test:c")
+    trip(upstream)
+    clock.now += 30
+
+    probe = upstream.before_attempt()
+    assert upstream.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        upstream.before_attempt()  # drugi wątek czeka na wynik próby
+
+    upstream.report(overload=False, latency=0.1, probe=probe)
+    assert upstream.state == CLOSED
+    assert upstream.trips == 0
+    upstream.before_attempt()
+
+
+def test_failed_probe_reopens_with_doubled_duration_up_to_max(clock):
+    upstream = upstreams.Upstream("test:d")
+    trip(upstream)
+    durations = []
+    for _ in range(3):
+        clock.now = upstream.opened_until
+        probe = upstream.before_attempt()
+        upstream.report(overload=True, probe=probe)
+        assert upstream.state == OPEN
+        durations.append(upstream.opened_until - clock.now)
+    assert durations == [60.0, 100.0, 100.0]
+
+
+def test_late_results_do_not_decide_half_open_breaker(clock):
+    upstream = upstreams.Upstream("test:i")
+    trip(upstream)
+    clock.now += 30
+    probe = upstream.before_attempt()
+
+    # Odpowiedzi wywołań sprzed otwarcia nie zamykają ani nie otwierają bezpiecznika
+    upstream.report(overload=False, latency=0.1)
+    upstream.report(overload=True)
+    upstream.report(overload=True)
+    upstream.report(overload=True)
+    assert upstream.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        upstream.before_attempt()
+
+    upstream.report(overload=False, latency=0.1, probe=probe)
+    assert upstream.state == CLOSED
+
+
+def test_overload_cuts_limit_once_per_cooldown_and_fast_responses_grow_it(clock):
+    upstream = upstreams.Upstream("test:e", max_concurrency=16)
+    upstream.report(overload=True)
+    upstream.report(overload=True)
+    assert upstream.limit == 8.0
+    clock.now += 5
+    upstream.report(overload=True)
+    assert upstream.limit == 4.0
+
+    for _ in range(200):
+        upstream.report(latency=0.1)
+    assert upstream.limit == 16.0
+
+
+def test_latency_spike_reduces_limit(clock):
+    upstream = upstreams.Upstream("test:f", max_concurrency=10)
+    upstream.report(latency=0.1)
+    for _ in range(10):
+        upstream.report(latency=5.0)
+    assert upstream.limit < 10.0
+    assert upstream.state == CLOSED
+
+
+def test_retry_after_holds_every_caller(clock):
+    upstream = upstreams.Upstream("test:g")
+    upstream.report(overload=True, retry_after=12)
+    upstream.before_attempt()
+    assert clock.slept == [12]
+    upstream.before_attempt()
+    assert clock.slept == [12]
+
+
+def test_saturated_tracks_slots_but_not_open_breaker(clock):
+    upstream = upstreams.Upstream("test:h", max_concurrency=1)
+    with upstream.slot():
+        assert upstream.saturated()
+        trip(upstream)
+        assert not upstream.saturated()
+    assert not upstream.saturated()
+
+
+def test_guard_reports_overload_from_exception(clock, monkeypatch):
+    monkeypatch.setattr(upstreams, "_upstreams", {})
+
+    class ApiError(Exception):
+        def __init__(self, code):
+            self.code = code
+
+    for _ in range(3):
+        with pytest.raises(ApiError):
+            with upstreams.guard("test:guard"):
+                raise ApiError(503)
+    assert upstreams.get("test:guard").state == OPEN
+
+    monkeypatch.setattr(upstreams, "_upstreams", {})
+    for _ in range(3):
+        with pytest.raises(ApiError):
+            with upstreams.guard("test:guard"):
+                raise ApiError("23505")  # błąd zapytania - usługa działa
+    assert upstreams.get("test:guard").state == CLOSED
@@ -0,0 +1,182 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("requests")
+
+import upstreams
+import wordpress_client
+from wordpress_client import WPBatcher, media_filename
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None, text=""):
+        self.status_code = status_code
+        self.payload = payload
+        self.text = text
+        self.headers = {}
+        self.content = text.encode("utf-8")
+
+    def close(self):
+        pass
+
+    def json(self):
+        if self.payload is None:
+            raise ValueError("not json")
+        return self.payload
+
+
+class FakeSite:
+    """WPSite bez sieci: odpowiedź /batch/v1 z `batch_response`, pojedyncze zapisy zapisywane w `single`."""
+
+    def __init__(self, batch_response):
+        self.batch_response = batch_response
+        self.upstream = upstreams.Upstream("wp:test", max_concurrency=4)
+        self._supports_batch = True
+        self.batch_calls = 0
+        self.single = []
+
+    def request(self, method, path, **kwargs):
+        assert path == "/batch/v1"
+        self.batch_calls += 1
+        if isinstance(self.batch_response, Exception):
+            raise self.batch_response
+        return self.batch_response
+
+    def send(self, method, path, body):
+        self.single.append((method, path, body))
+        return 201, {"id": len(self.single)}, ""
+
+
+def make_batch(n):
+    return [("POST", "/wp/v2/posts", {"title": f"t{i}"}, Future()) for i in range(n)]
+
+
+def test_partial_flush_returns_per_item_results():
+    site = FakeSite(FakeResponse(207, {"responses": [
+        {"status": 201, "body": {"id": 10}},
+        {"status": 400, "body": {"code": "rest_invalid_param"}}
+    ]}))
+    batch = make_batch(2)
+    WPBatcher(site)._flush(batch)
+
+    assert batch[0][3].result(0)[:2] == (201, {"id": 10})
+    assert batch[1][3].result(0)[:2] == (400, {"code": "rest_invalid_param"})
+    assert site.single == []
+
+
+@pytest.mark.parametrize("response", [
+    FakeResponse(500, text="fatal error"),
+    FakeResponse(200, {"responses": [{"status": 201, "body": {}}]}),  # mniej odpowiedzi niż wpisów
+    FakeResponse(200, None, "<html>"),                                # odpowiedź nie jest JSON
+    ConnectionError("reset"),
+])
+def test_failed_flush_fails_every_item_without_resending(response):
+    site = FakeSite(response)
+    batch = make_batch(3)
+    WPBatcher(site)._flush(batch)
+
+    for _, _, _, future in batch:
+        with pytest.raises(Exception):
+            future.result(0)
+    assert site.single == []
+    assert site._supports_batch
+
+
+@pytest.mark.parametrize("status", wordpress_client.BATCH_UNSUPPORTED_STATUSES)
+def test_unsupported_batch_falls_back_to_single_requests(status):
+    site = FakeSite(FakeResponse(status, {"code": "rest_no_route"}))
+    batch = make_batch(2)
+    WPBatcher(site)._flush(batch)
+
+    assert [f.result(0)[0] for _, _, _, f in batch] == [201, 201]
+    assert len(site.single) == 2
+    assert site._supports_batch is False
+
+
+def test_oversized_batch_rejected_before_execution_falls_back():
+    site = FakeSite(FakeResponse(400, {"code": "rest_batch_max_requests_exceeded"}))
+    batch = make_batch(2)
+    WPBatcher(site)._flush(batch)
+    assert len(site.single) == 2
+
+
+def test_circuit_open_propagates_to_all_callers():
+    site = FakeSite(upstreams.CircuitOpenError("wp:test", 30))
+    batch = make_batch(2)
+    WPBatcher(site)._flush(batch)
+    for _, _, _, future in batch:
+        with pytest.raises(upstreams.CircuitOpenError):
+            future.result(0)
+
+
+def test_concurrent_calls_share_one_batch(monkeypatch):
+    monkeypatch.setitem(wordpress_client.WP_SETTINGS, "batch_size", 3)
+    monkeypatch.setitem(wordpress_client.WP_SETTINGS, "batch_linger", 5)
+    site = FakeSite(FakeResponse(200, {"responses": [{"status": 201, "body": {"id": i}} for i in range(3)]}))
+    batcher = WPBatcher(site)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(batcher.call("POST", "/wp/v2/posts", {})))
+               for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(2)
+
+    assert site.batch_calls == 1
+    assert sorted(r[1]["id"] for r in results) == [0, 1, 2]
+
+
+def test_media_filename_depends_on_source_url():
+    first, first_slug = media_filename("https://cdn.example.com/a/Photo 1.JPG")
+    second, second_slug = media_filename("https://cdn.example.com/b/Photo 1.JPG")
+    assert first_slug != second_slug
+    assert first_slug.startswith("photo-1-") and first.endswith(".jpg")
+    assert media_filename("https://cdn.example.com/a/Photo 1.JPG") == (first, first_slug)
+
+
+class RecordingSession:
+    """Sesja HTTP strony WP: kolejne odpowiedzi z listy, wysłane żądania w `sent`."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.sent = []
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.sent.append((method, url))
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def wp_site(monkeypatch, request):
+    session = RecordingSession()
+    monkeypatch.setattr(wordpress_client.http_client, "get_session", lambda url: session)
+    monkeypatch.setattr(wordpress_client.http_client, "backoff_delay", lambda attempt: 0)
+    site = wordpress_client.WPSite(f"https://{request.node.name.replace('_', '-')}.test", "user", "key")
+    site._supports_batch = True
+    return site, session
+
+
+def test_batch_post_is_not_resent_after_server_error(wp_site):
+    site, session = wp_site
+    session.responses = [FakeResponse(502, text="Bad Gateway"), FakeResponse(207, {"responses": []})]
+    batch = make_batch(2)
+    WPBatcher(site)._flush(batch)
+
+    assert session.sent == [("POST", f"{site.base_url}/wp-json/batch/v1")]
+    for _, _, _, future in batch:
+        with pytest.raises(Exception):
+            future.result(0)
+
+
+def test_single_create_is_not_resent_but_update_is_retried(wp_site, monkeypatch):
+    site, session = wp_site
+    monkeypatch.setitem(wordpress_client.WP_SETTINGS, "batch_size", 1)
+    session.responses = [FakeResponse(504, text="Gateway Timeout"), FakeResponse(201, {"id": 1})]
+    assert site.send("POST", "/wp/v2/posts", {"title": "t"})[0] == 504
+    assert len(session.sent) == 1
+
+    session.responses = [FakeResponse(502, text="Bad Gateway"), FakeResponse(200, {"id": 1})]
+    assert site.send("PUT", "/wp/v2/posts/1", {"title": "t"})[0] == 200
+    assert len(session.sent) == 3
@@ -0,0 +1,268 @@
+"""
+Ochrona usług zewnętrznych (upstreamów): limit tempa, adaptacyjna równoległość i bezpiecznik.
+
+Upstream to jeden workflow Dify ("dify:research", "dify:writing"...), Supabase ("supabase")
+albo jedna strona WP ("wp:klient-a.pl"). Każdy ma własne:
+- token bucket (RATE_PER_SECOND, BURST; 0 = bez limitu),
+- limit równoległości AIMD: +1/limit po każdej szybkiej odpowiedzi (do MAX_CONCURRENCY),
+  × DECREASE_FACTOR po 429/5xx/timeoucie albo gdy czas odpowiedzi rośnie ponad LATENCY_FACTOR × bazowy,
+- bezpiecznik (circuit breaker): po FAILURE_THRESHOLD kolejnych błędach przeciążenia otwiera się
+  na OPEN_SECONDS (każde kolejne otwarcie 2x dłużej, do OPEN_MAX_SECONDS). Wywołania rzucają wtedy
+  od razu CircuitOpenError, a wiersze są wstrzymywane zamiast oznaczane błędem. Po czasie otwarcia
+  jedno wywołanie próbne (half-open) zamyka bezpiecznik albo otwiera go ponownie.
+
+Retry-After z odpowiedzi 429/503 wstrzymuje wszystkie wątki danego upstreamu, nie tylko ten, który ją dostał.
+Ustawienia ładuje pipeline.configure() z sekcji [upstreams] w secrets.
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+log = logging.getLogger("content_factory.upstreams")
+
+UPSTREAM_SETTINGS = {
+    "failure_threshold": 5,     # kolejne błędy przeciążenia, po których bezpiecznik się otwiera
+    "open_seconds": 30.0,       # s, pierwsze otwarcie
+    "open_max_seconds": 300.0,  # s, limit czasu otwarcia przy kolejnych awariach
+    "max_concurrency": 64,      # domyślny górny limit równoległości upstreamu
+    "min_concurrency": 1,
+    "decrease_factor": 0.5,     # mnożnik limitu przy przeciążeniu
+    "decrease_cooldown": 5.0,   # s, najwyżej jedno cięcie na okno (fala błędów = jedno cięcie)
+    "latency_factor": 3.0,      # 0 = bez reakcji na czas odpowiedzi
+    "retry_after_max": 300.0,   # s, limit wstrzymania z Retry-After
+    "limits": {}                # nazwa upstreamu -> {"RATE_PER_SECOND", "BURST", "MAX_CONCURRENCY"}
+}
+
+OVERLOAD_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Upstream chwilowo niedostępny - wiersz należy wstrzymać, a nie oznaczać błędem."""
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"{upstream} niedostępny (bezpiecznik otwarty, kolejna próba za {retry_after:.0f} s)")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Limit tempa z rezerwacją: wątek bierze token od razu i czeka, aż bucket by go uzupełnił."""
+
+    def __init__(self, rate_per_second=0, burst=None):
+        self.rate = float(rate_per_second or 0)
+        self.capacity = max(1.0, float(burst or 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+class Upstream:
+    def __init__(self, name, rate_per_second=0, burst=None, max_concurrency=None):
+        self.name = name
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self.max_concurrency = max(1, int(max_concurrency or UPSTREAM_SETTINGS["max_concurrency"]))
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_until = 0.0
+        self.hold_until = 0.0
+        self.latency = None    # EWMA czasu odpowiedzi
+        self.baseline = None   # bazowy czas odpowiedzi (minimum EWMA, powoli doganiające)
+        self._probe = None     # token próby w HALF_OPEN (tylko jej wynik zamyka albo ponownie otwiera bezpiecznik)
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _open_error(self, now):
+        return CircuitOpenError(self.name, max(self.opened_until - now, 0.0))
+
+    @contextmanager
+    def slot(self):
+        """Miejsce w limicie równoległości na całe wywołanie (np. workflow Dify razem ze strumieniem)."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self.state == OPEN and now < self.opened_until:
+                    raise self._open_error(now)
+                if self.in_flight < max(int(self.limit), int(UPSTREAM_SETTINGS["min_concurrency"])):
+                    break
+                self._cond.wait(1.0)
+            self.in_flight += 1
+        try:
+            yield self
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify()
+
+    def before_attempt(self):
+        """
+        Przed każdą próbą (także ponowieniem): bezpiecznik, wstrzymanie z Retry-After, token bucket.
+        Zwraca token próby w HALF_OPEN (None poza nią) - do przekazania w report(probe=...).
+        """
+        probe = None
+        with self._cond:
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now < self.opened_until:
+                    raise self._open_error(now)
+                self.state = HALF_OPEN
+                self._probe = None
+            if self.state == HALF_OPEN:
+                if self._probe is not None:
+                    raise CircuitOpenError(self.name, float(UPSTREAM_SETTINGS["open_seconds"]))
+                probe = self._probe = object()
+            hold = self.hold_until - now
+        if hold > 0:
+            time.sleep(hold)
+        self.bucket.acquire()
+        return probe
+
+    def saturated(self):
+        """Wszystkie miejsca limitu równoległości zajęte - nowe wywołanie czekałoby w slot(). Otwarty bezpiecznik = nie (szybki błąd)."""
+        with self._cond:
+            if self.state == OPEN:
+                return False
+            return self.in_flight >= max(int(self.limit), int(UPSTREAM_SETTINGS["min_concurrency"]))
+
+    def report(self, overload=False, latency=None, retry_after=None, probe=None):
+        """
+        Wynik jednej próby. overload - 429/5xx/timeout/zerwane połączenie; inne błędy (np. 4xx)
+        oznaczają, że usługa działa, i zerują licznik bezpiecznika. probe - token z before_attempt():
+        bezpiecznik otwarty albo w HALF_OPEN zmienia stan tylko wynik próby, nie spóźnione odpowiedzi
+        wywołań sprzed otwarcia.
+        """
+        with self._cond:
+            now = time.monotonic()
+            probe = probe is not None and probe is self._probe and self.state == HALF_OPEN
+            if probe:
+                self._probe = None
+            if overload:
+                self.failures += 1
+                if retry_after:
+                    self.hold_until = max(self.hold_until, now + min(retry_after, float(UPSTREAM_SETTINGS["retry_after_max"])))
+                self._decrease(now)
+                if probe or (self.state == CLOSED and self.failures >= int(UPSTREAM_SETTINGS["failure_threshold"])):
+                    self._open(now)
+            else:
+                self.failures = 0
+                if probe:
+                    self.state = CLOSED
+                    self.trips = 0
+                    log.info("Upstream %s: bezpiecznik zamknięty", self.name)
+                    metrics.record("upstream", self.name, ok=True, detail="closed")
+                if latency is not None:
+                    self._observe_latency(now, latency)
+            self._cond.notify_all()
+
+    def _open(self, now):
+        # Wywoływane pod self._cond
+        self.trips += 1
+        duration = min(float(UPSTREAM_SETTINGS["open_seconds"]) * 2 ** (self.trips - 1), float(UPSTREAM_SETTINGS["open_max_seconds"]))
+        self.state = OPEN
+        self.opened_until = now + duration
+        self.failures = 0
+        log.warning("Upstream %s: bezpiecznik otwarty na %.0f s (limit równoległości %.1f)", self.name, duration, self.limit)
+        metrics.record("upstream", self.name, ok=False, wall_s=duration, detail="open")
+
+    def _decrease(self, now):
+        if now - self._last_decrease >= float(UPSTREAM_SETTINGS["decrease_cooldown"]):
+            self.limit = max(float(UPSTREAM_SETTINGS["min_concurrency"]), self.limit * float(UPSTREAM_SETTINGS["decrease_factor"]))
+            self._last_decrease = now
+
+    def _observe_latency(self, now, latency):
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        self.baseline = self.latency if self.baseline is None else min(self.latency, self.baseline + (self.latency - self.baseline) * 0.01)
+        factor = float(UPSTREAM_SETTINGS["latency_factor"] or 0)
+        if factor and self.latency > factor * self.baseline:
+            self._decrease(now)
+        else:
+            self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+
+    def snapshot(self):
+        with self._cond:
+            now = time.monotonic()
+            return {
+                "name": self.name,
+                "state": self.state,
+                "limit": round(self.limit, 1),
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "failures": self.failures,
+                "open_for_s": round(max(self.opened_until - now, 0.0), 1) if self.state == OPEN else None,
+                "latency_s": round(self.latency, 3) if self.latency is not None else None
+            }
+
+# --- REJESTR ---
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+def configure(**settings):
+    """Nadpisuje UPSTREAM_SETTINGS i resetuje stan upstreamów (nowe limity obowiązują od razu)."""
+    with _upstreams_lock:
+        UPSTREAM_SETTINGS.update({k: v for k, v in settings.items() if v is not None})
+        _upstreams.clear()
+
+def get(name, rate_per_second=None, burst=None, max_concurrency=None):
+    """Upstream tworzony przy pierwszym użyciu; [upstreams.limits."nazwa"] w secrets ma pierwszeństwo przed argumentami."""
+    with _upstreams_lock:
+        upstream = _upstreams.get(name)
+        if upstream is None:
+            limits = UPSTREAM_SETTINGS["limits"].get(name, {})
+            upstream = Upstream(
+                name,
+                limits.get("RATE_PER_SECOND", rate_per_second),
+                limits.get("BURST", burst),
+                limits.get("MAX_CONCURRENCY", max_concurrency)
+            )
+            _upstreams[name] = upstream
+        return upstream
+
+def snapshot():
+    with _upstreams_lock:
+        upstreams = list(_upstreams.values())
+    return [u.snapshot() for u in sorted(upstreams, key=lambda u: u.name)]
+
+def saturated(name):
+    """Upstream.saturated() bez tworzenia upstreamu - nieznany (jeszcze niewywołany) nie jest zajęty."""
+    with _upstreams_lock:
+        upstream = _upstreams.get(name)
+    return upstream is not None and upstream.saturated()
+
+def is_overload_error(error):
+    """Wyjątek klienta bez kodu (sieć, timeout) albo z kodem 429/5xx = przeciążenie; inne kody = usługa odpowiada."""
+    code = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if code is None:
+        return True
+    return str(code).isdigit() and int(code) in OVERLOAD_STATUSES
+
+@contextmanager
+def guard(name):
+    """Wywołanie klienta bez własnej warstwy HTTP (Supabase): slot + jedna próba, wynik z wyjątku."""
+    upstream = get(name)
+    with upstream.slot():
+        probe = upstream.before_attempt()
+        started = time.monotonic()
+        try:
+            yield upstream
+        except Exception as e:
+            upstream.report(overload=is_overload_error(e), probe=probe)
+            raise
+        upstream.report(latency=time.monotonic() - started, probe=probe)
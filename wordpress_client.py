@@ -1,6 +1,40 @@
-import requests
+"""
+Klient WordPress REST API.
+
+- publish_post(): tworzy wpis albo aktualizuje istniejący (post_id) zamiast dodawać duplikat,
+- kategorie/tagi rozwiązywane przez cache terminów per strona (jedno pobranie listy, brakujące tworzone),
+- obrazek wyróżniający z URL: wyszukanie w bibliotece mediów po slugu z hashem adresu źródłowego
+  (ten sam plik z innego adresu to inny obrazek), upload tylko gdy go brak,
+- limit żądań na sekundę, adaptacyjny limit równoległych zapisów wpisów i bezpiecznik per strona
+  (upstream "wp:<host>" w upstreams.py - jedna wolna lub leżąca strona nie blokuje innych),
+- równoległe publikacje na tę samą stronę łączone w żądania /batch/v1 (WP 5.6+), jeśli strona je obsługuje.
+
+Ustawienia (configure) ładuje pipeline.configure() z sekcji [wordpress] w secrets.
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from requests.auth import HTTPBasicAuth
-from urllib.parse import urlparse
+from urllib.parse import urlparse, unquote
+
+import http_client
+import upstreams
+
+# Timeout odczytu odpowiedzi WP (połączenie: http_client.HTTP_SETTINGS["connect_timeout"])
+WP_READ_TIMEOUT = 60
+
+WP_SETTINGS = {
+    "rate_per_second": 5.0, # maks. żądań na sekundę do jednej strony, 0 = bez limitu
+    "site_concurrency": 4,  # maks. równoległych publikacji na jedną stronę
+    "batch_size": 25,       # maks. wpisów w jednym żądaniu /batch/v1 (limit WP: 25), 1 = bez batchowania
+    "batch_linger": 0.3     # s - ile czekać na kolejne wpisy do tej samej paczki
+}
+
+def configure(**settings):
+    WP_SETTINGS.update({k: v for k, v in settings.items() if v is not None})
 
 def normalize_url(url):
     """Upewnia się, że URL ma protokół i jest czystą domeną."""
@@ -8,10 +42,293 @@ def normalize_url(url):
         url = 'https://' + url
     return url.rstrip('/')
 
+def _publish_result(status_code, data, text):
+    """Interpretacja odpowiedzi WP na zapis wpisu (201 - utworzono, 200 - zaktualizowano)."""
+    if status_code in (200, 201):
+        return {
+            "success": True,
+            "link": data.get('link'),
+            "id": data.get('id'),
+            "updated": status_code == 200,
+            "message": "Zaktualizowano pomyślnie" if status_code == 200 else "Opublikowano pomyślnie"
+        }
+    elif status_code == 401:
+        return {"success": False, "message": "Błąd 401: Nieautoryzowany dostęp. Sprawdź nazwę użytkownika i Hasło Aplikacji (Klucz API)."}
+    elif status_code == 403:
+        return {"success": False, "message": "Błąd 403: Brak uprawnień. Użytkownik musi mieć rolę Autora lub Administratora."}
+    else:
+        return {"success": False, "message": f"Błąd API ({status_code}): {text[:200]}"}
+
+# --- STRONA (cache terminów, mediów, batch) ---
+class WPSite:
+    def __init__(self, domain, api_user, api_key, rate_per_second=None, max_concurrency=None):
+        self.base_url = normalize_url(domain)
+        self.auth = HTTPBasicAuth(api_user, api_key)
+        self.max_concurrency = max(1, int(max_concurrency or WP_SETTINGS["site_concurrency"]))
+        self.upstream = upstreams.get(
+            f"wp:{urlparse(self.base_url).netloc}",
+            rate_per_second=float(WP_SETTINGS["rate_per_second"] if rate_per_second is None else rate_per_second),
+            max_concurrency=self.max_concurrency
+        )
+        self.batcher = WPBatcher(self)
+        self._supports_batch = None
+        self._terms = {}  # taksonomia -> {nazwa.casefold(): id}
+        self._media = {}  # URL źródłowy -> id mediów
+        self._lock = threading.Lock()
+        self._term_locks = {'categories': threading.Lock(), 'tags': threading.Lock()}
+
+    def request(self, method, path, **kwargs):
+        """Żądanie do /wp-json{path} przez pulę http_client, z limitem żądań i bezpiecznikiem strony."""
+        return http_client.request_with_retry(
+            method, f"{self.base_url}/wp-json{path}", auth=self.auth, read_timeout=WP_READ_TIMEOUT, upstream=self.upstream, **kwargs
+        )
+
+    def supports_batch(self):
+        """Czy strona wystawia /batch/v1 (indeks REST API sprawdzany raz)."""
+        if self._supports_batch is None:
+            try:
+                response = self.request("GET", "/", params={"_fields": "namespaces"})
+                namespaces = response.json().get("namespaces", []) if response.status_code == 200 else []
+                self._supports_batch = "batch/v1" in namespaces
+            except upstreams.CircuitOpenError:
+                raise
+            except Exception:
+                self._supports_batch = False
+        return self._supports_batch
+
+    def _load_terms(self, taxonomy):
+        terms, page = {}, 1
+        while True:
+            response = self.request("GET", f"/wp/v2/{taxonomy}", params={"per_page": 100, "page": page, "_fields": "id,name,slug"})
+            if response.status_code != 200:
+                raise Exception(f"Nie można pobrać {taxonomy} ({response.status_code}): {response.text[:200]}")
+            for term in response.json():
+                terms[term['name'].casefold()] = term['id']
+                terms.setdefault(term['slug'].casefold(), term['id'])
+            if page >= int(response.headers.get("X-WP-TotalPages", 1)):
+                return terms
+            page += 1
+
+    def term_ids(self, taxonomy, names):
+        """Id terminów (categories/tags) o podanych nazwach - brakujące są tworzone."""
+        names = [n.strip() for n in names if n and n.strip()]
+        if not names:
+            return []
+        with self._term_locks[taxonomy]:
+            terms = self._terms.get(taxonomy)
+            if terms is None:
+                terms = self._terms[taxonomy] = self._load_terms(taxonomy)
+            ids = []
+            for name in names:
+                if name.casefold() not in terms:
+                    response = self.request("POST", f"/wp/v2/{taxonomy}", json={"name": name})
+                    data = response.json() if response.headers.get("Content-Type", "").startswith("application/json") else {}
+                    if response.status_code == 201:
+                        terms[name.casefold()] = data['id']
+                    elif data.get('code') == 'term_exists':
+                        terms[name.casefold()] = data['data']['term_id']
+                    else:
+                        raise Exception(f"Nie można utworzyć terminu '{name}' ({response.status_code}): {response.text[:200]}")
+                ids.append(terms[name.casefold()])
+            return list(dict.fromkeys(ids))
+
+    def featured_media(self, image_url):
+        """Id mediów dla obrazka z URL: z cache, z biblioteki (slug z hashem adresu) albo po uploadzie."""
+        with self._lock:
+            if image_url in self._media:
+                return self._media[image_url]
+        filename, slug = media_filename(image_url)
+        response = self.request("GET", "/wp/v2/media", params={"slug": slug, "_fields": "id"})
+        found = response.json() if response.status_code == 200 else []
+        if found:
+            media_id = found[0]['id']
+        else:
+            image = http_client.request_with_retry("GET", image_url, read_timeout=WP_READ_TIMEOUT)
+            if image.status_code != 200:
+                raise Exception(f"Nie można pobrać obrazka {image_url} ({image.status_code})")
+            response = self.request("POST", "/wp/v2/media", data=image.content, headers={
+                "Content-Type": image.headers.get("Content-Type", "application/octet-stream"),
+                "Content-Disposition": f'attachment; filename="{filename}"'
+            })
+            if response.status_code != 201:
+                raise Exception(f"Upload obrazka nie powiódł się ({response.status_code}): {response.text[:200]}")
+            media_id = response.json()['id']
+        with self._lock:
+            self._media[image_url] = media_id
+        return media_id
+
+    def send(self, method, path, body):
+        """
+        (status, dane, tekst) - przez /batch/v1 (jeśli włączone i dostępne) albo pojedynczym żądaniem.
+        Miejsce w limicie równoległości strony zajmuje tylko samo żądanie zapisu (paczka - jedno miejsce).
+        """
+        if int(WP_SETTINGS["batch_size"] or 1) > 1 and self.supports_batch():
+            return self.batcher.call(method, path, body)
+        with self.upstream.slot():
+            response = self.request(method, path, json=body)
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        return response.status_code, data if isinstance(data, dict) else {}, response.text
+
+def media_filename(image_url):
+    """(nazwa pliku, slug) uploadu - slug zawiera hash adresu źródłowego, więc wyszukanie trafia tylko w ten obrazek."""
+    stem, ext = os.path.splitext(os.path.basename(unquote(urlparse(image_url).path)))
+    stem = re.sub(r'[^a-z0-9]+', '-', stem.lower()).strip('-')[:60] or "image"
+    slug = f"{stem}-{hashlib.sha1(image_url.encode('utf-8')).hexdigest()[:12]}"
+    return f"{slug}{ext.lower() or '.jpg'}", slug
+
+class WPBatcher:
+    """
+    Łączy równoległe zapisy wpisów na jedną stronę w żądania /batch/v1.
+
+    Pierwszy wątek, który doda wpis do pustej paczki, czeka `batch_linger` i wysyła wszystko,
+    co się zebrało; pełna paczka (`batch_size`) wysyłana jest od razu. Pozostałe wątki czekają
+    na swój wynik. Pojedynczo wpisy są wysyłane tylko wtedy, gdy strona nie zna /batch/v1
+    (404/405/501) albo odrzuciła paczkę przed wykonaniem (za duża) - inny błąd mógł nastąpić po
+    zapisaniu części wpisów, więc cała paczka kończy się błędem zamiast ryzykować duplikaty.
+    Z tego samego powodu http_client nie ponawia POST paczki po 500/502/504 (tylko 429/503).
+    """
+
+    def __init__(self, site):
+        self.site = site
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def call(self, method, path, body):
+        future = Future()
+        batch_size = int(WP_SETTINGS["batch_size"])
+        with self._lock:
+            self._pending.append((method, path, body, future))
+            leader = len(self._pending) == 1
+            full = self._take() if len(self._pending) >= batch_size else None
+        if full:
+            self._flush(full)
+        elif leader:
+            # Paczka zapełniona przez inny wątek kończy czekanie lidera wcześniej
+            try:
+                return future.result(timeout=float(WP_SETTINGS["batch_linger"]))
+            except FutureTimeout:
+                pass
+            with self._lock:
+                batch = self._take()
+            if batch:
+                self._flush(batch)
+        return future.result()
+
+    def _take(self):
+        # Wywoływane pod self._lock
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _flush(self, batch):
+        try:
+            self._send(batch)
+        except Exception as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            # Wątki paczki czekają w future.result() - żaden nie może zostać bez wyniku
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(Exception("Żądanie /batch/v1 nie zwróciło wyniku dla wpisu"))
+
+    def _send(self, batch):
+        with self.site.upstream.slot():
+            response = self.site.request("POST", "/batch/v1", json={
+                "validation": "normal",
+                "requests": [{"method": m, "path": p, "body": b} for m, p, b, _ in batch]
+            })
+        if response.status_code in BATCH_UNSUPPORTED_STATUSES or _batch_rejected(response):
+            # Strona nie wykonała żadnego wpisu z paczki - ta i kolejne paczki pojedynczo
+            self.site._supports_batch = False
+            for method, path, body, future in batch:
+                try:
+                    future.set_result(self.site.send(method, path, body))
+                except Exception as e:
+                    future.set_exception(e)
+            return
+        if response.status_code not in (200, 207):
+            raise Exception(f"Żądanie /batch/v1 nie powiodło się ({response.status_code}): {response.text[:200]}")
+        responses = response.json().get("responses")
+        if not isinstance(responses, list) or len(responses) != len(batch):
+            raise Exception(f"Niepoprawna odpowiedź /batch/v1: {response.text[:200]}")
+        for (_, _, _, future), item in zip(batch, responses):
+            data = item.get("body") or {}
+            future.set_result((item.get("status"), data, json.dumps(data, ensure_ascii=False)))
+
+# Strona bez /batch/v1 (stary WP, wyłączona trasa) - pojedyncze żądania nie grożą duplikatem
+BATCH_UNSUPPORTED_STATUSES = (404, 405, 501)
+
+def _batch_rejected(response):
+    """Paczka odrzucona przed wykonaniem (niższy limit wpisów na stronie niż batch_size)."""
+    if response.status_code != 400:
+        return False
+    try:
+        return response.json().get("code") == "rest_batch_max_requests_exceeded"
+    except ValueError:
+        return False
+
+_sites = {}
+_sites_lock = threading.Lock()
+
+def get_site(domain, api_user, api_key, rate_per_second=None, max_concurrency=None):
+    """
+    WPSite współdzielony przez wątki (cache terminów/mediów i limity per strona i konto).
+    Limity są brane przy pierwszym użyciu strony; zmiana limitów tworzy nowy obiekt
+    (upstream "wp:<host>" z bezpiecznikiem jest wspólny dla wszystkich kont na danym hoście).
+    """
+    key = (normalize_url(domain), api_user, api_key, rate_per_second, max_concurrency)
+    with _sites_lock:
+        if key not in _sites:
+            _sites[key] = WPSite(domain, api_user, api_key, rate_per_second, max_concurrency)
+        return _sites[key]
+
+def split_terms(value):
+    """"a, b; c" -> ["a", "b", "c"] (kolumny Kategorie WP / Tagi WP)."""
+    if not isinstance(value, str):
+        return []
+    return [t.strip() for t in value.replace(";", ",").split(",") if t.strip()]
+
+def publish_post(domain, api_user, api_key, title, content, post_id=None, status='draft',
+                 categories=None, tags=None, featured_image_url=None, rate_per_second=None, max_concurrency=None):
+    """
+    Tworzy wpis albo aktualizuje istniejący (post_id) - ponowna publikacja nie tworzy duplikatu.
+    Jeśli wpis o post_id usunięto w WP, tworzony jest nowy. Wynik jak publish_post_draft (+ "updated").
+    Najwyżej `max_concurrency` żądań zapisu na stronę naraz (mniej, gdy strona zwalnia lub zwraca 429/5xx);
+    wpisy zebrane w jedną paczkę /batch/v1 zajmują jedno miejsce.
+    Przy otwartym bezpieczniku strony rzuca upstreams.CircuitOpenError - wiersz jest wstrzymywany.
+    """
+    try:
+        site = get_site(domain, api_user, api_key, rate_per_second, max_concurrency)
+        return _publish(site, title, content, post_id, status, categories, tags, featured_image_url)
+    except upstreams.CircuitOpenError:
+        raise
+    except Exception as e:
+        return {"success": False, "message": f"Błąd połączenia: {str(e)}"}
+
+def _publish(site, title, content, post_id, status, categories, tags, featured_image_url):
+    body = {'title': title, 'content': content, 'status': status}
+    if categories:
+        body['categories'] = site.term_ids('categories', categories)
+    if tags:
+        body['tags'] = site.term_ids('tags', tags)
+    if featured_image_url:
+        body['featured_media'] = site.featured_media(featured_image_url)
+
+    if post_id:
+        status_code, data, text = site.send("PUT", f"/wp/v2/posts/{int(post_id)}", body)
+        if status_code not in (404, 410):
+            return _publish_result(status_code, data, text)
+    status_code, data, text = site.send("POST", "/wp/v2/posts", body)
+    return _publish_result(status_code, data, text)
+
 def publish_post_draft(domain, api_user, api_key, title, content):
     """
     Publikuje post przez WordPress REST API.
-    
+
     Args:
         domain (str): Adres strony (np. https://mojablog.pl)
         api_user (str): Nazwa użytkownika (login) powiązana z kluczem
@@ -19,40 +336,4 @@ def publish_post_draft(domain, api_user, api_key, title, content):
         title (str): Tytuł artykułu
         content (str): Treść HTML
     """
-    base_url = normalize_url(domain)
-    # Endpoint API WordPressa
-    api_endpoint = f"{base_url}/wp-json/wp/v2/posts"
-    
-    # Payload dla API
-    post_data = {
-        'title': title,
-        'content': content,
-        'status': 'draft'  # Publikujemy jako szkic
-    }
-    
-    try:
-        # Wysyłamy żądanie do API używając Basic Auth (Standard WP API)
-        response = requests.post(
-            api_endpoint,
-            auth=HTTPBasicAuth(api_user, api_key),
-            json=post_data,
-            timeout=30
-        )
-        
-        if response.status_code == 201:
-            data = response.json()
-            return {
-                "success": True,
-                "link": data.get('link'),
-                "id": data.get('id'),
-                "message": "Opublikowano pomyślnie"
-            }
-        elif response.status_code == 401:
-            return {"success": False, "message": "Błąd 401: Nieautoryzowany dostęp. Sprawdź nazwę użytkownika i Hasło Aplikacji (Klucz API)."}
-        elif response.status_code == 403:
-            return {"success": False, "message": "Błąd 403: Brak uprawnień. Użytkownik musi mieć rolę Autora lub Administratora."}
-        else:
-            return {"success": False, "message": f"Błąd API ({response.status_code}): {response.text[:200]}"}
-            
-    except Exception as e:
-        return {"success": False, "message": f"Błąd połączenia: {str(e)}"}
+    return publish_post(domain, api_user, api_key, title, content)
@@ -0,0 +1,222 @@
+"""
+Worker kolejki zadań Content Factory - działa niezależnie od przeglądarki i Streamlit.
+
+Przejmuje zadania z kolejki (job_queue.py) z leasem, uruchamia etapy z pipeline.py
+i aktualizuje statusy wierszy w seo_content_tasks. Można uruchomić wiele procesów
+(także na różnych maszynach) - każde zadanie przejmuje tylko jeden worker.
+
+Przykłady:
+    python worker.py --concurrency 8
+    python worker.py --stages research,headers,rag --concurrency 16
+    python worker.py --backend sqlite --sqlite-path jobs.sqlite --once
+"""
+import os
+import uuid
+import socket
+import signal
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import job_queue
+import metrics
+import upstreams
+import dify_cache
+from pipeline import (
+    STAGES, DEFAULT_SECRETS_PATH, PAUSED_STATUS, SKIPPED_STATUS, CANCELLED_STATUS,
+    configure, load_config, fetch_row, fetch_stage_statuses, mark_stages_status, process_single_row,
+    is_done_status, next_stages, descendant_stages
+)
+
+log = logging.getLogger("content_factory.worker")
+
+def run_job(job):
+    """Wykonuje jedno zadanie. Zwraca (sukces, komunikat_błędu) albo None - wiersz wstrzymany (usługa niedostępna)."""
+    stage = STAGES.get(job["stage"])
+    if stage is None:
+        return False, f"Nieznany etap: {job['stage']}"
+    row = fetch_row(job["task_id"])
+    if row is None:
+        return False, f"Brak wiersza #{job['task_id']} w seo_content_tasks."
+    # Metryki zapisywane paczkami (FLUSH_EVERY) i przy heartbeacie, nie po każdym zadaniu
+    with dify_cache.batch_scope(force_refresh=(job.get("pipeline") or {}).get("force_refresh", False)), \
+            metrics.batch_scope(job["batch_id"], flush_on_exit=False):
+        return process_single_row(row, stage["func"], stage["status_col"], job.get("args"))
+
+def advance_pipeline(store, job, success):
+    """Po zakończeniu etapu pipeline'u dodaje do kolejki etapy, które mają już spełnione zależności."""
+    pipeline_cfg = job.get("pipeline")
+    if not pipeline_cfg:
+        return
+    stages = pipeline_cfg["stages"]
+    if not success:
+        mark_stages_status([job["task_id"]], descendant_stages(job["stage"], stages), SKIPPED_STATUS)
+        return
+    if job["stage"] in pipeline_cfg.get("pause_after", []):
+        mark_stages_status([job["task_id"]], descendant_stages(job["stage"], stages), PAUSED_STATUS)
+        return
+    if store.is_cancelled(job["batch_id"]):
+        # Batch anulowany w trakcie etapu - zadanie kończy się, ale nie dodaje kolejnych etapów
+        mark_stages_status([job["task_id"]], descendant_stages(job["stage"], stages), CANCELLED_STATUS)
+        return
+
+    # Statusy czytamy po zapisie własnego wyniku - przy dwóch równoległych gałęziach (nagłówki/RAG)
+    # przynajmniej jedna zobaczy obie jako gotowe; duplikaty odrzuca unikalny indeks kolejki.
+    statuses = fetch_stage_statuses(job["task_id"])
+    done = {stage for stage, status in statuses.items() if is_done_status(status)}
+    for nxt in next_stages(job["stage"], stages, done):
+        store.enqueue([job["task_id"]], nxt, pipeline_cfg.get("stage_args", {}).get(nxt),
+                      batch_id=job["batch_id"], max_attempts=job["max_attempts"], pipeline=pipeline_cfg,
+                      share=job.get("share"), weight=job.get("weight"))
+
+ADVANCE_FAILED_STATUS = "❌ Błąd: nie dodano etapu do kolejki (uruchom ponownie)"
+
+def mark_advance_failed(job):
+    """Dalsze etapy pipeline'u z błędem zamiast "W kolejce" - wybór wierszy do ponowienia obejmie je ponownie."""
+    pipeline_cfg = job.get("pipeline")
+    if not pipeline_cfg:
+        return
+    try:
+        mark_stages_status([job["task_id"]], descendant_stages(job["stage"], pipeline_cfg["stages"]), ADVANCE_FAILED_STATUS)
+    except Exception:
+        log.exception("Nie udało się oznaczyć dalszych etapów wiersza #%s", job["task_id"])
+
+LEASE_EXPIRED_STATUS = "❌ Błąd: worker przerwał etap (lease wygasł po ostatniej próbie)"
+
+def fail_abandoned(store):
+    """Zadania porzucone po ostatniej próbie (worker padł): błąd w wierszu i pominięcie dalszych etapów."""
+    for job in store.fail_expired():
+        mark_stages_status([job["task_id"]], [job["stage"]], LEASE_EXPIRED_STATUS)
+        advance_pipeline(store, job, False)
+        log.warning("Zadanie #%s (%s, wiersz #%s) porzucone - lease wygasł po ostatniej próbie", job["id"], job["stage"], job["task_id"])
+
+def run_worker(store, concurrency=4, stages=None, lease_seconds=job_queue.DEFAULT_LEASE_SECONDS, poll_interval=5.0, once=False, stop_event=None):
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    stop_event = stop_event or threading.Event()
+    heartbeat_stop = threading.Event()
+    in_flight = {}
+    lock = threading.Lock()
+
+    def on_done(job, future):
+        try:
+            result = future.result()
+        except upstreams.CircuitOpenError as e:
+            result = None
+            # fetch_row przy otwartym bezpieczniku Supabase - status wiersza się nie zmienił
+            log.warning("Zadanie #%s: %s", job["id"], e)
+        except Exception as e:
+            result = False, str(e)
+        try:
+            if result is None:
+                # Otwarty bezpiecznik - zadanie wraca do kolejki po czasie otwarcia, bez zużycia próby
+                store.defer(job, worker_id, float(upstreams.UPSTREAM_SETTINGS["open_seconds"]), "Usługa niedostępna - odłożono")
+                log.info("Zadanie #%s (%s, wiersz #%s) odłożone - usługa niedostępna", job["id"], job["stage"], job["task_id"])
+                return
+            success, error_msg = result
+            if success:
+                try:
+                    advance_pipeline(store, job, True)
+                except Exception:
+                    # Etap jest zapisany - nie powtarzamy go, tylko oznaczamy dalsze etapy do ponownego uruchomienia
+                    log.exception("Zadanie #%s: nie udało się dodać kolejnych etapów", job["id"])
+                    mark_advance_failed(job)
+                store.complete(job, worker_id)
+                log.info("Zadanie #%s (%s, wiersz #%s) zakończone", job["id"], job["stage"], job["task_id"])
+            else:
+                retry = store.fail(job, worker_id, error_msg)
+                if not retry:
+                    advance_pipeline(store, job, False)
+                log.warning("Zadanie #%s (%s, wiersz #%s) błąd: %s%s", job["id"], job["stage"], job["task_id"], error_msg,
+                            " - ponowienie" if retry else "")
+        except Exception:
+            log.exception("Nie udało się zapisać wyniku zadania #%s", job["id"])
+        finally:
+            with lock:
+                in_flight.pop(job["id"], None)
+
+    def heartbeat_loop():
+        # Przedłużanie leasów trwających zadań (np. długa generacja artykułu)
+        while not heartbeat_stop.wait(max(lease_seconds / 3, 1)):
+            with lock:
+                job_ids = list(in_flight)
+            try:
+                store.heartbeat(job_ids, worker_id, lease_seconds)
+            except Exception:
+                log.exception("Heartbeat nie powiódł się")
+            metrics.flush()
+
+    log.info("Worker %s start (wątki: %s, etapy: %s)", worker_id, concurrency, ",".join(stages) if stages else "wszystkie")
+    threading.Thread(target=heartbeat_loop, name="heartbeat", daemon=True).start()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="job") as pool:
+        while not stop_event.is_set():
+            with lock:
+                free_slots = concurrency - len(in_flight)
+            jobs = []
+            try:
+                fail_abandoned(store)
+            except Exception:
+                log.exception("Nie udało się obsłużyć porzuconych zadań")
+            if free_slots > 0:
+                try:
+                    jobs = store.claim(worker_id, stages, free_slots, lease_seconds)
+                except Exception:
+                    log.exception("Nie udało się pobrać zadań z kolejki")
+            for job in jobs:
+                with lock:
+                    in_flight[job["id"]] = job
+                future = pool.submit(run_job, job)
+                future.add_done_callback(lambda f, job=job: on_done(job, f))
+
+            with lock:
+                idle = not in_flight
+            if once and not jobs and idle:
+                break
+            stop_event.wait(0.2 if jobs else poll_interval)
+
+    # Wyjście z bloku with czeka na dokończenie zadań w toku (heartbeat działa do końca)
+    heartbeat_stop.set()
+    metrics.flush()
+    log.info("Worker %s zatrzymany", worker_id)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Worker kolejki zadań Content Factory")
+    parser.add_argument("--secrets", default=DEFAULT_SECRETS_PATH, help="Ścieżka do secrets.toml (zmienne CF_* nadpisują plik)")
+    parser.add_argument("--backend", choices=["supabase", "sqlite"], help="Backend kolejki (domyślnie [queue] BACKEND z secrets)")
+    parser.add_argument("--sqlite-path", help="Plik SQLite dla backendu sqlite")
+    parser.add_argument("--concurrency", type=int, default=4, help="Liczba zadań wykonywanych równolegle")
+    parser.add_argument("--stages", help="Etapy obsługiwane przez workera, np. research,headers (domyślnie wszystkie)")
+    parser.add_argument("--lease", type=int, default=job_queue.DEFAULT_LEASE_SECONDS, help="Czas leasu zadania w sekundach")
+    parser.add_argument("--poll", type=float, default=5.0, help="Odstęp odpytywania pustej kolejki w sekundach")
+    parser.add_argument("--once", action="store_true", help="Zakończ, gdy kolejka jest pusta")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    secrets = load_config(args.secrets)
+    queue_cfg = dict(secrets.get("queue", {}))
+    if args.backend:
+        queue_cfg["BACKEND"] = args.backend
+    if args.sqlite_path:
+        queue_cfg["SQLITE_PATH"] = args.sqlite_path
+    secrets["queue"] = queue_cfg
+    configure(secrets)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()] if args.stages else None
+    unknown = [s for s in stages or [] if s not in STAGES]
+    if unknown:
+        parser.error(f"Nieznane etapy: {', '.join(unknown)}")
+
+    stop_event = threading.Event()
+    def handle_signal(signum, frame):
+        log.info("Otrzymano sygnał %s - kończę bieżące zadania i zatrzymuję workera", signum)
+        stop_event.set()
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    store = job_queue.get_job_store(secrets)
+    run_worker(store, args.concurrency, stages, args.lease, args.poll, args.once, stop_event)
+
+if __name__ == "__main__":
+    main()